@@ -0,0 +1,379 @@
+"""録音の解析とエンコード設定（無音の短縮・モノラル化・VBR/CBR）。
+
+保留音や沈黙の多い長時間通話を小さく・速くエンコードするための任意の処理。
+config.ini の [recording] セクションで有効にする（既定はすべて無効で、従来どおり
+ステレオ 128kbps CBR のまま）。
+
+- 無音: 20ms 窓ごとの RMS (dBFS) をまとめて計算し、しきい値未満が min_silence_sec 以上
+  続いた区間を検出する。silence = mark は記録のみ、trim は keep_silence_sec だけ残して短縮する
+- モノラル化: 録音開始から mono_probe_sec 秒の左右の差分を調べ、両チャンネルが
+  ほぼ同じ（VoiceMeeter B1 の一般的な構成）であればモノラルにダウンミックスしてエンコードする
+- ビットレート: bitrate_mode = cbr（固定）/ vbr（可変、vbr_quality で品質を指定）
+
+短縮した区間は元の録音時刻とともにサイドカー（<録音名>.silence.json）に記録し、
+MP3 上の位置から元の時刻を復元できるようにする。
+ジャーナル（journal.py）には常に加工前の音声を書き込む。
+"""
+
+import json
+import logging
+import os
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+from peaks import PeakTracker
+
+logger = logging.getLogger(__name__)
+
+SILENCE_OFF = "off"
+SILENCE_MARK = "mark"
+SILENCE_TRIM = "trim"
+
+# 無音判定の窓（秒）
+_WINDOW_SEC = 0.02
+# RMS が 0 のときの dBFS
+_FLOOR_DB = -120.0
+SIDECAR_SUFFIX = ".silence.json"
+
+
+class EncodeSettings:
+    """録音のエンコード設定。"""
+
+    def __init__(
+        self,
+        silence: str = SILENCE_OFF,
+        silence_threshold_db: float = -50.0,
+        min_silence_sec: float = 3.0,
+        keep_silence_sec: float = 0.5,
+        mono_detect: bool = False,
+        mono_probe_sec: float = 5.0,
+        mono_tolerance_db: float = -40.0,
+        bitrate_mode: str = "cbr",
+        bitrate: int = 128,
+        vbr_quality: int = 4,
+        peaks: bool = True,
+    ) -> None:
+        if silence not in (SILENCE_OFF, SILENCE_MARK, SILENCE_TRIM):
+            raise ValueError(f"silence は off / mark / trim のいずれかです: {silence}")
+        if bitrate_mode not in ("cbr", "vbr"):
+            raise ValueError(f"bitrate_mode は cbr / vbr のいずれかです: {bitrate_mode}")
+        if mono_tolerance_db > 0:
+            raise ValueError(f"mono_tolerance_db は 0 以下で指定してください: {mono_tolerance_db}")
+        self.silence = silence
+        self.silence_threshold_db = silence_threshold_db
+        self.min_silence_sec = min_silence_sec
+        self.keep_silence_sec = min(keep_silence_sec, min_silence_sec)
+        self.mono_detect = mono_detect
+        self.mono_probe_sec = mono_probe_sec
+        self.mono_tolerance_db = mono_tolerance_db
+        self.bitrate_mode = bitrate_mode
+        self.bitrate = bitrate
+        self.vbr_quality = vbr_quality
+        self.peaks = peaks
+
+    @classmethod
+    def from_config(cls, config) -> "EncodeSettings":
+        """config.ini の [recording] セクションから設定を読み込む（無効な値は既定値に戻す）。"""
+        section = "recording"
+        try:
+            return cls(
+                silence=config.get(section, "silence", fallback=SILENCE_OFF).strip().lower(),
+                silence_threshold_db=config.getfloat(section, "silence_threshold_db", fallback=-50.0),
+                min_silence_sec=config.getfloat(section, "min_silence_sec", fallback=3.0),
+                keep_silence_sec=config.getfloat(section, "keep_silence_sec", fallback=0.5),
+                mono_detect=config.getboolean(section, "mono_detect", fallback=False),
+                mono_probe_sec=config.getfloat(section, "mono_probe_sec", fallback=5.0),
+                mono_tolerance_db=config.getfloat(section, "mono_tolerance_db", fallback=-40.0),
+                bitrate_mode=config.get(section, "bitrate_mode", fallback="cbr").strip().lower(),
+                bitrate=config.getint(section, "bitrate", fallback=128),
+                vbr_quality=config.getint(section, "vbr_quality", fallback=4),
+                peaks=config.getboolean(section, "peaks", fallback=True),
+            )
+        except ValueError:
+            logger.exception("エンコード設定が不正です。既定の設定（ステレオ 128kbps CBR）で録音します")
+            return cls()
+
+    @property
+    def vbr(self) -> bool:
+        return self.bitrate_mode == "vbr"
+
+    def describe(self) -> str:
+        rate = (f"VBR (品質 {self.vbr_quality})" if self.bitrate_mode == "vbr"
+                else f"CBR {self.bitrate}kbps")
+        return f"{rate}, 無音={self.silence}, モノラル検出={'on' if self.mono_detect else 'off'}"
+
+
+# ---------- 解析 ----------
+
+def window_rms_db(block: np.ndarray, window: int) -> np.ndarray:
+    """(frames, channels) の int16 ブロックの窓ごとの RMS (dBFS) を返す。
+
+    末尾の半端な窓もそれ自身の長さで計算する。
+    """
+    n = len(block)
+    if n == 0:
+        return np.empty(0, dtype=np.float32)
+    samples = block.astype(np.float32) / 32768.0
+    squares = np.square(samples).mean(axis=1)
+    full = n // window
+    power = squares[: full * window].reshape(full, window).mean(axis=1)
+    if n % window:
+        power = np.append(power, squares[full * window:].mean())
+    return 10.0 * np.log10(np.maximum(power, 10 ** (_FLOOR_DB / 10)))
+
+
+def channels_match(probe: np.ndarray, tolerance_db: float) -> bool:
+    """左右のチャンネルの差分が信号に比べて十分小さければ True を返す。"""
+    if probe.ndim != 2 or probe.shape[1] < 2 or len(probe) == 0:
+        return False
+    left = probe[:, 0].astype(np.float32)
+    right = probe[:, 1].astype(np.float32)
+    diff_power = float(np.mean(np.square(left - right)))
+    if diff_power == 0.0:
+        return True
+    signal_power = float(np.mean(np.square((left + right) * 0.5)))
+    if signal_power == 0.0:
+        return False
+    return 10.0 * np.log10(diff_power / signal_power) <= tolerance_db
+
+
+def downmix(block: np.ndarray) -> np.ndarray:
+    """(frames, channels) の int16 ブロックを (frames, 1) にダウンミックスする。"""
+    return (block.astype(np.int32).sum(axis=1, keepdims=True) // block.shape[1]).astype(np.int16)
+
+
+class SilenceTracker:
+    """ブロックを順に受け取り、長い無音区間を記録（mark）または短縮（trim）する。
+
+    無音が min_silence_sec 以上続くかどうかは続きを見るまでわからないため、
+    keep_silence_sec を超えた無音は min_silence_sec に達するまで保留し、
+    達しなければそのまま出力、達した時点で保留分以降を捨てる。
+    """
+
+    def __init__(self, settings: EncodeSettings, sample_rate: int) -> None:
+        self.mode = settings.silence
+        self.sample_rate = sample_rate
+        self._threshold_db = settings.silence_threshold_db
+        self._window = max(1, int(sample_rate * _WINDOW_SEC))
+        self._min_frames = int(settings.min_silence_sec * sample_rate)
+        self._keep_frames = int(settings.keep_silence_sec * sample_rate)
+        self.frames_in = 0
+        self.frames_out = 0
+        self.regions: list[dict] = []
+        # 継続中の無音区間
+        self._run_start: Optional[int] = None
+        self._run_len = 0
+        self._run_out_at = 0
+        self._pending: list[np.ndarray] = []
+
+    def _segments(self, block: np.ndarray):
+        """ブロックを (開始, 終了, 無音か) の区間に分ける（窓単位）。"""
+        silent = window_rms_db(block, self._window) < self._threshold_db
+        edges = np.flatnonzero(np.diff(silent.astype(np.int8))) + 1
+        starts = np.concatenate(([0], edges))
+        ends = np.concatenate((edges, [len(silent)]))
+        for s, e in zip(starts, ends):
+            yield int(s) * self._window, min(int(e) * self._window, len(block)), bool(silent[s])
+
+    def process(self, block: np.ndarray) -> list[np.ndarray]:
+        """ブロックを処理し、エンコードすべき部分（ビュー）の一覧を返す。"""
+        out: list[np.ndarray] = []
+        for start, end, silent in self._segments(block):
+            part = block[start:end]
+            if silent:
+                self._silence(part, out)
+            else:
+                self._end_run(out)
+                out.append(part)
+                self.frames_out += len(part)
+            self.frames_in += len(part)
+        return out
+
+    def _silence(self, part: np.ndarray, out: list[np.ndarray]) -> None:
+        if self._run_start is None:
+            self._run_start = self.frames_in
+            self._run_len = 0
+            self._run_out_at = self.frames_out
+        pos = self._run_len
+        self._run_len += len(part)
+        if self.mode != SILENCE_TRIM:
+            out.append(part)
+            self.frames_out += len(part)
+            return
+
+        # keep_silence_sec までは出力する
+        if pos < self._keep_frames:
+            head = part[: self._keep_frames - pos]
+            out.append(head)
+            self.frames_out += len(head)
+            part = part[len(head):]
+            pos += len(head)
+        if not len(part) or pos >= self._min_frames:
+            return
+        # min_silence_sec に達するまでは保留（コピーして保持する）
+        take = part[: self._min_frames - pos]
+        self._pending.append(take.copy())
+        if pos + len(take) >= self._min_frames:
+            self._pending.clear()
+
+    def _end_run(self, out: list[np.ndarray]) -> None:
+        """継続中の無音区間を閉じる。"""
+        if self._run_start is None:
+            return
+        start, length = self._run_start, self._run_len
+        self._run_start = None
+        if length < self._min_frames:
+            for pending in self._pending:
+                out.append(pending)
+                self.frames_out += len(pending)
+            self._pending.clear()
+            return
+
+        sr = self.sample_rate
+        region = {
+            "start_sec": round(start / sr, 3),
+            "end_sec": round((start + length) / sr, 3),
+            "output_at_sec": round(self._run_out_at / sr, 3),
+        }
+        if self.mode == SILENCE_TRIM:
+            region["removed_sec"] = round((length - self._keep_frames) / sr, 3)
+        self.regions.append(region)
+
+    def finish(self) -> list[np.ndarray]:
+        """録音終了時に継続中の無音区間を閉じ、残りの出力を返す。"""
+        out: list[np.ndarray] = []
+        self._end_run(out)
+        return out
+
+    def sidecar(self) -> dict:
+        sr = self.sample_rate
+        return {
+            "version": 1,
+            "mode": self.mode,
+            "sample_rate": sr,
+            "original_duration_sec": round(self.frames_in / sr, 3),
+            "output_duration_sec": round(self.frames_out / sr, 3),
+            "removed_sec": round((self.frames_in - self.frames_out) / sr, 3),
+            "regions": self.regions,
+        }
+
+
+# ---------- エンコード ----------
+
+class _PcmSpool:
+    """エンコーダーの代わりに PCM をファイルへ書き出す（RecordingEncoder の spool 用）。"""
+
+    def __init__(self, file: BinaryIO) -> None:
+        self._file = file
+
+    def encode(self, data: bytes) -> bytes:
+        self._file.write(data)
+        return b""
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class RecordingEncoder:
+    """EncodeSettings に従って PCM ブロックを MP3 にエンコードするエンコーダー。
+
+    モノラル検出が有効な場合は、最初の mono_probe_sec 秒を保持してから
+    チャンネル数を決め、エンコーダーを生成する。
+    settings.peaks が有効な場合は、エンコードする PCM から波形概要（peaks.PeakTracker）も求める。
+    *spool* を指定すると MP3 にはエンコードせず、加工後の PCM をそこへ書き出す
+    （mp3codec.encode_segments で区間ごとに並列にエンコードするため）。
+    """
+
+    def __init__(self, sample_rate: int, channels: int, settings: Optional[EncodeSettings] = None,
+                 spool: Optional[BinaryIO] = None) -> None:
+        self.settings = settings or EncodeSettings()
+        self._spool = spool
+        self.sample_rate = sample_rate
+        self.channels_in = channels
+        self.channels_out: Optional[int] = None
+        self._encoder = None
+        self._probe: list[np.ndarray] = []
+        self._probe_frames = 0
+        self._probe_limit = int(self.settings.mono_probe_sec * sample_rate)
+        self.silence = (SilenceTracker(self.settings, sample_rate)
+                        if self.settings.silence != SILENCE_OFF else None)
+        self.peaks = PeakTracker(sample_rate) if self.settings.peaks else None
+        if not (self.settings.mono_detect and channels == 2):
+            self._start(channels)
+
+    def _start(self, channels: int) -> None:
+        from mp3codec import create_encoder
+
+        s = self.settings
+        self.channels_out = channels
+        if self._spool is not None:
+            self._encoder = _PcmSpool(self._spool)
+            return
+        self._encoder = create_encoder(
+            self.sample_rate, channels, bitrate=s.bitrate,
+            vbr_quality=s.vbr_quality if s.vbr else None,
+        )
+
+    def _decide(self) -> bytes:
+        """保持した先頭部分からチャンネル数を決め、保持分をエンコードする。"""
+        probe = np.concatenate(self._probe) if self._probe else np.empty((0, 2), dtype=np.int16)
+        mono = channels_match(probe, self.settings.mono_tolerance_db)
+        logger.info("チャンネル判定: %s (先頭 %.1f 秒)", "モノラルでエンコード" if mono else "ステレオ",
+                    len(probe) / self.sample_rate)
+        self._start(1 if mono else 2)
+        self._probe = []
+        return self._encode(probe) if len(probe) else b""
+
+    def _encode(self, block: np.ndarray) -> bytes:
+        parts = self.silence.process(block) if self.silence is not None else [block]
+        return b"".join(self._encode_part(p) for p in parts)
+
+    def _encode_part(self, part: np.ndarray) -> bytes:
+        if not len(part):
+            return b""
+        if self.channels_out == 1 and self.channels_in > 1:
+            part = downmix(part)
+        if self.peaks is not None:
+            self.peaks.process(part)
+        return self._encoder.encode(np.ascontiguousarray(part).tobytes())
+
+    def encode(self, block: np.ndarray) -> bytes:
+        """ブロックをエンコードし、出力できた MP3 データを返す。"""
+        if self._encoder is not None:
+            return self._encode(block)
+        self._probe.append(block.copy())
+        self._probe_frames += len(block)
+        if self._probe_frames < self._probe_limit:
+            return b""
+        return self._decide()
+
+    def flush(self) -> bytes:
+        """残りをすべてエンコードして MP3 データを返す。"""
+        data = self._decide() if self._encoder is None else b""
+        if self.silence is not None:
+            data += b"".join(self._encode_part(p) for p in self.silence.finish())
+        return data + self._encoder.flush()
+
+    def sidecar(self) -> Optional[dict]:
+        """サイドカーに保存する内容を返す（無音処理が無効なら None）。"""
+        if self.silence is None:
+            return None
+        return {**self.silence.sidecar(), "channels_in": self.channels_in,
+                "channels_out": self.channels_out, "encoding": self.settings.describe()}
+
+
+def sidecar_path(mp3_path: str) -> str:
+    return os.path.splitext(mp3_path)[0] + SIDECAR_SUFFIX
+
+
+def write_sidecar(mp3_path: str, content: dict) -> str:
+    """サイドカーを MP3 の隣に書き出し、そのパスを返す。"""
+    path = sidecar_path(mp3_path)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+    if content.get("regions"):
+        logger.info("無音区間 %d 件を記録しました (短縮 %.1f 秒): %s",
+                    len(content["regions"]), content.get("removed_sec", 0.0), path)
+    return path
@@ -0,0 +1,606 @@
+"""オーディオ入出力のバックエンド。
+
+incoming / recorder / audio_devices は、デバイスの一覧取得・再生・録音・ミュート操作を
+すべて get_backend() が返すバックエンド経由で行う。
+
+- SoundDeviceBackend: 実機（sounddevice + pycaw）。既定
+- VirtualAudioBackend: 仮想デバイス。WAV フィクスチャを入力として流し、
+  再生した音声はメモリに記録する。デバイス一覧とミュート状態もメモリ上で模擬し、
+  時計を N 倍速で進められる（Windows の実機が無い環境での負荷試験・--mode=simulate 用）
+
+config.ini の [audio] backend = virtual で仮想バックエンドに切り替わる。
+仮想バックエンドの設定は [virtual] セクション（input_file, speed）で行う。
+"""
+
+import collections
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- 時計 ----------
+
+class Clock:
+    """バックエンドの時計。speed 倍の速さで進む（1.0 = 実時間、0 以下 = 待機なし）。"""
+
+    def __init__(self, speed: float = 1.0) -> None:
+        self.speed = speed
+        self._t0 = time.time()
+        self._m0 = time.monotonic()
+
+    def time(self) -> float:
+        """現在時刻（time.time() 相当）を返す。"""
+        if self.speed == 1.0:
+            return time.time()
+        if self.speed <= 0:
+            # 待機なしの場合は経過時間を測れないため実時間を返す
+            return time.time()
+        return self._t0 + (time.monotonic() - self._m0) * self.speed
+
+    def real_seconds(self, sec: float) -> float:
+        """この時計での *sec* 秒に相当する実時間（秒）を返す。"""
+        if self.speed <= 0:
+            return 0.0
+        return sec / self.speed
+
+    def sleep(self, sec: float) -> None:
+        real = self.real_seconds(sec)
+        if real > 0:
+            time.sleep(real)
+
+
+# ---------- エンドポイント操作（ミュート）のバックエンド ----------
+
+class EndpointBackend:
+    """EndpointController が使うミュート操作のバックエンド。
+
+    実機では audio_devices.PycawEndpointBackend を使う。
+    キャッシュや復元のロジックを Windows 以外で検証する場合は VirtualEndpointBackend を使う。
+    """
+
+    def resolve(self, flow: int):
+        """*flow* のデフォルトエンドポイントの音量インターフェースを取得する。"""
+        raise NotImplementedError
+
+    def get_mute(self, volume) -> bool:
+        raise NotImplementedError
+
+    def set_mute(self, volume, mute: bool) -> None:
+        raise NotImplementedError
+
+    def watch_default_device(self, callback: Callable[[], None]) -> bool:
+        """デフォルトデバイス変更時に callback() を呼ぶよう登録する。
+
+        通知に対応していない場合は False を返す（操作失敗時の再取得のみで対応する）。
+        """
+        return False
+
+
+class VirtualEndpointBackend(EndpointBackend):
+    """ミュート状態をメモリ上で管理するエンドポイント。操作履歴を history に残す。"""
+
+    def __init__(self, clock: Clock) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.muted: dict[int, bool] = {}
+        # (時刻, flow, ミュート) の履歴（直近のみ）
+        self.history: collections.deque = collections.deque(maxlen=10000)
+
+    def resolve(self, flow: int):
+        return flow
+
+    def get_mute(self, volume) -> bool:
+        with self._lock:
+            return self.muted.get(volume, False)
+
+    def set_mute(self, volume, mute: bool) -> None:
+        with self._lock:
+            self.muted[volume] = bool(mute)
+            self.history.append((self._clock.time(), volume, bool(mute)))
+
+
+# ---------- コールバックの status ----------
+
+# 同じストリームのコールバック status をまとめてログに出す間隔（秒）
+_STATUS_LOG_INTERVAL_SEC = 5.0
+
+
+class CallbackStatusLog:
+    """PortAudio コールバックの status（input overflow など）を集計してログに出す。
+
+    コールバックのたびにログを出すと、オーバーフローが続いたときに 1 秒に何十行も出力される。
+    interval 秒ごとに 1 回だけ、その間の status ごとの回数をまとめて出力する
+    （最初の 1 回はすぐに出力する）。add() はコールバックからだけ呼び、
+    flush() はストリームを止めてから呼ぶこと。
+    """
+
+    def __init__(self, label: str, interval: float = _STATUS_LOG_INTERVAL_SEC) -> None:
+        self._label = label
+        self._interval = interval
+        self._counts: dict[str, int] = {}
+        self._window_start = time.monotonic()
+        self._last_emit: Optional[float] = None
+        self.total = 0
+
+    def add(self, status) -> None:
+        key = str(status)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self.total += 1
+        now = time.monotonic()
+        if self._last_emit is None or now - self._last_emit >= self._interval:
+            self._emit(now)
+
+    def flush(self) -> None:
+        """まだ出力していない集計を出力する（ストリームを閉じるときに呼ぶ）。"""
+        if self._counts:
+            self._emit(time.monotonic())
+
+    def _emit(self, now: float) -> None:
+        summary = ", ".join(f"{key} ×{n}" for key, n in self._counts.items())
+        if self._last_emit is None:
+            logger.warning("%s status: %s", self._label, summary)
+        else:
+            logger.warning("%s status: %s (直近 %.1f 秒)", self._label, summary, now - self._window_start)
+        self._counts.clear()
+        self._window_start = now
+        self._last_emit = now
+
+
+# ---------- ガイダンスの再生ストリーム ----------
+
+class OutputPlayer:
+    """事前に開いておく再生ストリーム。
+
+    着信のたびにストリームを開く代わりに、事前準備フェーズで open_output() しておき、
+    ミュート直後は start() で再生を開始するだけにする。再生が終われば再び start() できる。
+    """
+
+    # 最初のサンプルがデバイスから出力された（される）時刻（time.perf_counter() 基準）
+    first_sample_time: Optional[float] = None
+
+    def start(self) -> None:
+        """先頭から再生を開始する（完了は待たない）。"""
+        raise NotImplementedError
+
+    def wait(self) -> None:
+        """start() で開始した再生の完了を待つ。"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """ストリームを閉じる。"""
+
+
+class _PlayOutput(OutputPlayer):
+    """ストリームを事前に開けないバックエンド用: start() のたびに backend.play() を呼ぶ。"""
+
+    def __init__(self, backend: "AudioBackend", data: np.ndarray, samplerate: int, device: int) -> None:
+        self._backend = backend
+        self._data = data
+        self._samplerate = samplerate
+        self._device = device
+
+    def start(self) -> None:
+        self.first_sample_time = None
+        self._backend.play(self._data, samplerate=self._samplerate, device=self._device)
+        self.first_sample_time = time.perf_counter()
+
+    def wait(self) -> None:
+        self._backend.wait()
+
+
+# ---------- バックエンド ----------
+
+class AudioBackend:
+    """オーディオ入出力バックエンドのインターフェース。"""
+
+    name = ""
+    clock: Clock
+    # デバイス情報の問い合わせで送出される例外（インデックスが無効な場合など）
+    device_errors: tuple = ()
+
+    def query_devices(self, index: Optional[int] = None):
+        """デバイス一覧（*index* 指定時はそのデバイスの情報）を返す。"""
+        raise NotImplementedError
+
+    def query_hostapis(self, index: Optional[int] = None):
+        """ホスト API 一覧（*index* 指定時はその API の情報）を返す。"""
+        raise NotImplementedError
+
+    def reinitialize(self) -> None:
+        """デバイス一覧を取り直せるよう再初期化する（開いているストリームは閉じられる）。"""
+
+    def play(self, data: np.ndarray, samplerate: int, device: int) -> None:
+        """*data* の再生を開始する（完了は待たない）。"""
+        raise NotImplementedError
+
+    def wait(self) -> None:
+        """play() で開始した再生の完了を待つ。"""
+        raise NotImplementedError
+
+    def open_output(self, data: np.ndarray, samplerate: int, device: int,
+                    blocksize: int = 0, latency=None) -> OutputPlayer:
+        """*data* を再生する OutputPlayer を開く（再生は start() で開始する）。
+
+        *blocksize* (0 = 自動) と *latency* ("low" / "high" / 秒数) は対応するバックエンドのみ使う。
+        """
+        return _PlayOutput(self, data, samplerate, device)
+
+    def input_stream(self, *, samplerate: int, channels: int, dtype: str, device: int,
+                     callback: Callable):
+        """sd.InputStream と同じ引数・コールバックの録音ストリーム（コンテキストマネージャ）を返す。"""
+        raise NotImplementedError
+
+    def endpoint_backend(self) -> EndpointBackend:
+        """ミュート操作に使う EndpointBackend を返す。"""
+        raise NotImplementedError
+
+
+class SoundDeviceBackend(AudioBackend):
+    """sounddevice（PortAudio）と pycaw による実機のバックエンド。"""
+
+    name = "sounddevice"
+
+    def __init__(self) -> None:
+        import sounddevice as sd
+
+        self._sd = sd
+        self.clock = Clock()
+        self.device_errors = (sd.PortAudioError,)
+
+    def query_devices(self, index: Optional[int] = None):
+        return self._sd.query_devices(index)
+
+    def query_hostapis(self, index: Optional[int] = None):
+        return self._sd.query_hostapis(index)
+
+    def reinitialize(self) -> None:
+        self._sd._terminate()
+        self._sd._initialize()
+
+    def play(self, data: np.ndarray, samplerate: int, device: int) -> None:
+        self._sd.play(data, samplerate=samplerate, device=device)
+
+    def wait(self) -> None:
+        self._sd.wait()
+
+    def open_output(self, data: np.ndarray, samplerate: int, device: int,
+                    blocksize: int = 0, latency=None) -> OutputPlayer:
+        return _PrimedOutputStream(self._sd, data, samplerate, device, blocksize, latency)
+
+    def input_stream(self, *, samplerate: int, channels: int, dtype: str, device: int,
+                     callback: Callable):
+        return self._sd.InputStream(
+            samplerate=samplerate, channels=channels, dtype=dtype, device=device, callback=callback
+        )
+
+    def endpoint_backend(self) -> EndpointBackend:
+        from audio_devices import PycawEndpointBackend
+
+        return PycawEndpointBackend()
+
+
+class _PrimedOutputStream(OutputPlayer):
+    """開いたまま保持する sd.OutputStream。
+
+    コールバックでガイダンスを先頭から書き出し、最後まで書いたら CallbackStop で止まる。
+    開始時の出力バッファはコールバックで埋めてから再生する（無音で始まらない）。
+    ガイダンスはデバイスのサンプルレートに合わせて事前にリサンプリングしておくこと。
+    """
+
+    def __init__(self, sd, data: np.ndarray, samplerate: int, device: int,
+                 blocksize: int, latency) -> None:
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        self._sd = sd
+        self._data = data
+        self._pos = 0
+        self._done = threading.Event()
+        self._done.set()
+        self._status_log = CallbackStatusLog("再生コールバック")
+        self._stream = sd.OutputStream(
+            samplerate=samplerate,
+            channels=data.shape[1],
+            dtype="float32",
+            device=device,
+            blocksize=blocksize,
+            latency=latency,
+            callback=self._callback,
+            finished_callback=self._done.set,
+            prime_output_buffers_using_stream_callback=True,
+        )
+        logger.info("再生ストリームを開きました (デバイス %d, %dHz, blocksize=%s, レイテンシー %.1fms)",
+                    device, samplerate, blocksize or "自動", self._stream.latency * 1000)
+
+    def _callback(self, outdata, frames, time_info, status) -> None:
+        if status:
+            self._status_log.add(status)
+        if self.first_sample_time is None:
+            # PortAudio のストリーム時刻で、このバッファが DAC に届くまでの時間を求める
+            ahead = time_info.outputBufferDacTime - time_info.currentTime
+            if not 0 < ahead < 1.0:
+                ahead = self._stream.latency
+            self.first_sample_time = time.perf_counter() + ahead
+        pos = self._pos
+        n = min(frames, len(self._data) - pos)
+        outdata[:n] = self._data[pos:pos + n]
+        self._pos = pos + n
+        if n < frames:
+            outdata[n:] = 0
+            raise self._sd.CallbackStop
+
+    def start(self) -> None:
+        if not self._stream.stopped:
+            # 前回の再生が CallbackStop で終わったストリームは stop してから再開する
+            self._stream.stop()
+        self._pos = 0
+        self.first_sample_time = None
+        self._done.clear()
+        try:
+            self._stream.start()
+        except Exception:
+            self._done.set()
+            raise
+
+    def wait(self) -> None:
+        self._done.wait()
+        self._status_log.flush()
+
+    def close(self) -> None:
+        self._stream.close()
+
+
+# ---------- 仮想バックエンド ----------
+
+class VirtualDeviceError(LookupError):
+    """仮想バックエンドに存在しないデバイス・ホスト API を指定した。"""
+
+
+_VIRTUAL_HOSTAPIS = ["MME", "Windows WASAPI"]
+
+
+def _virtual_device(name: str, hostapi: int, inputs: int, outputs: int, samplerate: int) -> dict:
+    return {
+        "name": name,
+        "hostapi": hostapi,
+        "max_input_channels": inputs,
+        "max_output_channels": outputs,
+        "default_samplerate": float(samplerate),
+    }
+
+
+# 本番環境（VB-CABLE + VoiceMeeter）を模したデバイス一覧
+_VIRTUAL_DEVICES = [
+    _virtual_device("Microsoft Sound Mapper - Output", 0, 0, 2, 44100),
+    _virtual_device("CABLE Input (VB-Audio Virtual Cable)", 0, 0, 2, 44100),
+    _virtual_device("Voicemeeter Out B1 (VB-Audio Voicemeeter VAIO)", 0, 2, 0, 44100),
+    _virtual_device("Speakers (Realtek High Definition Audio)", 1, 0, 2, 48000),
+    _virtual_device("CABLE Input (VB-Audio Virtual Cable)", 1, 0, 2, 48000),
+    _virtual_device("Microphone (Realtek High Definition Audio)", 1, 2, 0, 48000),
+    _virtual_device("Voicemeeter Out B1 (VB-Audio Voicemeeter VAIO)", 1, 2, 0, 48000),
+]
+
+# 入力フィクスチャが無い場合に流す信号（440Hz の正弦波）
+_TONE_HZ = 440.0
+_TONE_AMPLITUDE = 0.1
+# 仮想録音ストリームのブロック長（秒）。PortAudio の既定に近い 10ms
+_BLOCK_SEC = 0.01
+# 記録しておく再生履歴の件数
+_PLAYBACK_HISTORY = 1000
+
+
+class _TimeInfo:
+    """録音コールバックに渡す time_info（PortAudio の構造体と同じ属性名）。"""
+
+    __slots__ = ("inputBufferAdcTime", "currentTime", "outputBufferDacTime")
+
+    def __init__(self, adc_time: float, current_time: float) -> None:
+        self.inputBufferAdcTime = adc_time
+        self.currentTime = current_time
+        self.outputBufferDacTime = 0.0
+
+
+class _VirtualInputStream:
+    """入力ソースの音声をブロックごとに録音コールバックへ渡すストリーム。
+
+    ブロックは時計の速さに合わせて渡す（N 倍速なら実時間の 1/N 間隔）。
+    """
+
+    def __init__(self, backend: "VirtualAudioBackend", samplerate: int, channels: int,
+                 dtype: str, callback: Callable) -> None:
+        self._clock = backend.clock
+        self._source = backend.input_source(samplerate, channels, dtype)
+        self._samplerate = samplerate
+        self._blocksize = max(1, int(samplerate * _BLOCK_SEC))
+        self._callback = callback
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="virtual-input", daemon=True)
+        self.frames = 0
+
+    def __enter__(self) -> "_VirtualInputStream":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stopping.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        n = self._blocksize
+        block = np.empty((n, self._source.shape[1]), dtype=self._source.dtype)
+        interval = self._clock.real_seconds(n / self._samplerate)
+        pos = 0
+        next_t = time.monotonic()
+        while not self._stopping.is_set():
+            np.take(self._source, np.arange(pos, pos + n), axis=0, mode="wrap", out=block)
+            adc_time = self.frames / self._samplerate
+            try:
+                self._callback(block, n, _TimeInfo(adc_time, adc_time), None)
+            except Exception:
+                logger.exception("仮想録音ストリームのコールバックでエラーが発生しました")
+                return
+            pos = (pos + n) % len(self._source)
+            self.frames += n
+            if interval > 0:
+                next_t += interval
+                delay = next_t - time.monotonic()
+                if delay > 0:
+                    self._stopping.wait(delay)
+
+
+class VirtualAudioBackend(AudioBackend):
+    """WAV フィクスチャを入力とし、出力をメモリに記録する仮想バックエンド。
+
+    同じ入力・同じ設定であれば毎回同じ音声が録音される。
+
+    Parameters
+    ----------
+    input_file : str | None
+        録音ストリームに流す音声ファイル（末尾まで来たら先頭に戻る）。
+        None の場合は 440Hz の正弦波を流す。
+    speed : float
+        時計の速さ（1.0 = 実時間、60 = 1 分の通話を 1 秒で模擬、0 以下 = 待機なし）。
+    devices, hostapis : list | None
+        模擬するデバイス一覧・ホスト API 名の一覧（省略時は本番環境を模した一覧）。
+    """
+
+    name = "virtual"
+    device_errors = (VirtualDeviceError,)
+
+    def __init__(self, input_file: Optional[str] = None, speed: float = 1.0,
+                 devices: Optional[list[dict]] = None, hostapis: Optional[list[str]] = None) -> None:
+        self.clock = Clock(speed)
+        self.input_file = input_file
+        self._devices = [dict(dev) for dev in (devices or _VIRTUAL_DEVICES)]
+        self._hostapis = list(hostapis or _VIRTUAL_HOSTAPIS)
+        self._sources: dict[tuple, np.ndarray] = {}
+        self._sources_lock = threading.Lock()
+        self._play_done = threading.Event()
+        self._play_done.set()
+        self._play_timer: Optional[threading.Timer] = None
+        self.endpoints = VirtualEndpointBackend(self.clock)
+        # (時刻, デバイス, サンプルレート, データ) の再生履歴（データはコピーしない）
+        self.played: collections.deque = collections.deque(maxlen=_PLAYBACK_HISTORY)
+
+    # ---------- デバイス一覧 ----------
+
+    def query_devices(self, index: Optional[int] = None):
+        if index is None:
+            return [dict(dev) for dev in self._devices]
+        if not 0 <= index < len(self._devices):
+            raise VirtualDeviceError(f"仮想デバイスがありません: {index}")
+        return dict(self._devices[index])
+
+    def query_hostapis(self, index: Optional[int] = None):
+        if index is None:
+            return [{"name": name} for name in self._hostapis]
+        if not 0 <= index < len(self._hostapis):
+            raise VirtualDeviceError(f"仮想ホスト API がありません: {index}")
+        return {"name": self._hostapis[index]}
+
+    # ---------- 再生 ----------
+
+    def play(self, data: np.ndarray, samplerate: int, device: int) -> None:
+        dev = self.query_devices(device)
+        if dev["max_output_channels"] <= 0:
+            raise VirtualDeviceError(f"出力デバイスではありません: [{device}] {dev['name']}")
+        if self._play_timer is not None:
+            self._play_timer.cancel()
+        self.played.append((self.clock.time(), device, samplerate, data))
+        self._play_done.clear()
+        self._play_timer = threading.Timer(
+            self.clock.real_seconds(len(data) / samplerate), self._play_done.set
+        )
+        self._play_timer.daemon = True
+        self._play_timer.start()
+
+    def wait(self) -> None:
+        self._play_done.wait()
+
+    # ---------- 録音 ----------
+
+    def input_source(self, samplerate: int, channels: int, dtype: str) -> np.ndarray:
+        """録音ストリームに流す (frames, channels) の音声を返す（条件ごとに一度だけ作る）。"""
+        key = (samplerate, channels, dtype)
+        with self._sources_lock:
+            source = self._sources.get(key)
+            if source is None:
+                source = self._make_source(samplerate, channels, dtype)
+                self._sources[key] = source
+            return source
+
+    def _make_source(self, samplerate: int, channels: int, dtype: str) -> np.ndarray:
+        if self.input_file:
+            import soundfile as sf
+
+            from guidance_cache import resample
+
+            data, file_rate = sf.read(self.input_file, dtype="float32", always_2d=True)
+            data = resample(data, file_rate, samplerate)
+            if len(data) == 0:
+                raise ValueError(f"入力フィクスチャが空です: {self.input_file}")
+        else:
+            t = np.arange(samplerate, dtype=np.float64) / samplerate
+            data = (np.sin(2 * np.pi * _TONE_HZ * t) * _TONE_AMPLITUDE).astype(np.float32)[:, None]
+
+        if data.shape[1] < channels:
+            data = np.repeat(data[:, :1], channels, axis=1)
+        data = data[:, :channels]
+        if np.dtype(dtype) == np.int16:
+            return (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)
+        return np.ascontiguousarray(data, dtype=dtype)
+
+    def input_stream(self, *, samplerate: int, channels: int, dtype: str, device: int,
+                     callback: Callable):
+        dev = self.query_devices(device)
+        if dev["max_input_channels"] < channels:
+            raise VirtualDeviceError(f"入力チャンネル数が不足しています: [{device}] {dev['name']}")
+        return _VirtualInputStream(self, samplerate, channels, dtype, callback)
+
+    def endpoint_backend(self) -> EndpointBackend:
+        return self.endpoints
+
+
+# ---------- バックエンドの選択 ----------
+
+_backend: Optional[AudioBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend() -> AudioBackend:
+    from config_loader import load_config
+
+    try:
+        config = load_config()
+    except FileNotFoundError:
+        return SoundDeviceBackend()
+    kind = config.get("audio", "backend", fallback="sounddevice").strip().lower()
+    if kind == "virtual":
+        input_file = config.get("virtual", "input_file", fallback="").strip() or None
+        speed = config.getfloat("virtual", "speed", fallback=1.0)
+        logger.info("仮想オーディオバックエンドを使用します (入力=%s, %.1f 倍速)",
+                    input_file or "正弦波", speed)
+        return VirtualAudioBackend(input_file=input_file, speed=speed)
+    if kind != "sounddevice":
+        logger.warning("不明なオーディオバックエンドです: %s（sounddevice を使用します）", kind)
+    return SoundDeviceBackend()
+
+
+def get_backend() -> AudioBackend:
+    """プロセス共通のオーディオバックエンドを返す（初回呼び出し時に config.ini から生成）。"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend()
+        return _backend
+
+
+def set_backend(backend: AudioBackend) -> None:
+    """プロセス共通のオーディオバックエンドを差し替える（デバイスを使う処理の前に呼ぶ）。"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -1,26 +1,34 @@
 """オーディオデバイス操作ユーティリティ。
 
-- 物理マイクのミュート / ミュート解除 (pycaw)
-- デフォルトスピーカーのミュート / ミュート解除 (pycaw)
-- VB-CABLE Input デバイスの検索 (sounddevice)
+- 物理マイク・デフォルトスピーカーのミュート制御 (pycaw)
+  EndpointController が COM インターフェースを保持して再利用する
+- VB-CABLE Input / 録音デバイスの検索 (sounddevice)
+  DeviceRegistry がデバイス一覧を一度だけ取得し、解決結果をファイルにキャッシュする
+
+デバイスへのアクセスは audio_backend.get_backend() 経由で行うため、
+仮想バックエンドでは Windows の実機が無くても同じ処理を実行できる。
 """
 
+import json
 import logging
+import os
 import sys
-from typing import Optional
+import threading
+from typing import Callable, Optional
 
-import comtypes
-import sounddevice as sd
-from ctypes import POINTER, cast
-from comtypes import CLSCTX_ALL
-from pycaw.pycaw import IAudioEndpointVolume
+import metrics
+from audio_backend import EndpointBackend, get_backend
+from config_loader import _base_dir
 
 logger = logging.getLogger(__name__)
 
-# COM DeviceEnumerator の CLSID（Windows 標準、不変）
-_CLSID_MMDeviceEnumerator = comtypes.GUID(
-    "{BCDE0395-E52F-467C-8E3D-C4579291692E}"
-)
+# EDataFlow（Windows 標準、不変）
+RENDER = 0   # eRender: 再生デバイス（スピーカー）
+CAPTURE = 1  # eCapture: 録音デバイス（マイク）
+# ERole: eMultimedia
+_ROLE_MULTIMEDIA = 1
+
+_FLOW_NAMES = {RENDER: "デフォルトスピーカー", CAPTURE: "物理マイク"}
 
 
 # ---------- comtypes COM 解放エラーの抑制 ----------
@@ -41,31 +49,234 @@ def _suppress_com_cleanup_error(unraisable):
 sys.unraisablehook = _suppress_com_cleanup_error
 
 
-# ---------- 物理マイクのミュート制御 ----------
+# ---------- エンドポイント操作のバックエンド ----------
+
+class PycawEndpointBackend(EndpointBackend):
+    """pycaw / comtypes による Windows Core Audio バックエンド。"""
+
+    def __init__(self) -> None:
+        # 取得したインターフェースをスレッド間で共有するため MTA で初期化する
+        # （comtypes は import 時に sys.coinit_flags を参照する）
+        if "comtypes" not in sys.modules:
+            sys.coinit_flags = 0  # COINIT_MULTITHREADED
+        import comtypes
+        from pycaw.pycaw import IAudioEndpointVolume, IMMDeviceEnumerator
+
+        self._comtypes = comtypes
+        self._volume_iface = IAudioEndpointVolume
+        self._thread_state = threading.local()
+        self._init_thread()
+        # COM DeviceEnumerator の CLSID（Windows 標準、不変）
+        self._enumerator = comtypes.CoCreateInstance(
+            comtypes.GUID("{BCDE0395-E52F-467C-8E3D-C4579291692E}"),
+            IMMDeviceEnumerator,
+            comtypes.CLSCTX_INPROC_SERVER,
+        )
+        self._notification_client = None
+
+    def _init_thread(self) -> None:
+        """呼び出しスレッドの COM を（未初期化であれば）初期化する。"""
+        if not getattr(self._thread_state, "initialized", False):
+            try:
+                self._comtypes.CoInitializeEx(self._comtypes.COINIT_MULTITHREADED)
+            except OSError:
+                pass  # 既に別のモードで初期化済みのスレッド
+            self._thread_state.initialized = True
+
+    def resolve(self, flow: int):
+        from ctypes import POINTER, cast
+
+        self._init_thread()
+        device = self._enumerator.GetDefaultAudioEndpoint(flow, _ROLE_MULTIMEDIA)
+        if device is None:
+            raise RuntimeError(f"{_FLOW_NAMES[flow]}のデバイスが見つかりません")
+        interface = device.Activate(self._volume_iface._iid_, self._comtypes.CLSCTX_ALL, None)
+        return cast(interface, POINTER(self._volume_iface))
+
+    def get_mute(self, volume) -> bool:
+        self._init_thread()
+        return bool(volume.GetMute())
+
+    def set_mute(self, volume, mute: bool) -> None:
+        self._init_thread()
+        volume.SetMute(1 if mute else 0, None)
+
+    def watch_default_device(self, callback: Callable[[], None]) -> bool:
+        try:
+            from pycaw.callbacks import MMNotificationClient
+        except ImportError:
+            return False
+
+        class _Client(MMNotificationClient):
+            def on_default_device_changed(self, *args):
+                callback()
+
+        try:
+            client = _Client()
+            self._enumerator.RegisterEndpointNotificationCallback(client)
+        except Exception:
+            logger.warning("デフォルトデバイス変更通知の登録に失敗しました", exc_info=True)
+            return False
+        # COM オブジェクトが回収されないよう参照を保持する
+        self._notification_client = client
+        return True
+
+
+# ---------- エンドポイント（ミュート）制御 ----------
+
+class EndpointController:
+    """マイク・スピーカーの IAudioEndpointVolume を保持して再利用するコントローラー。
+
+    インターフェースは初回に一度だけ取得し、デフォルトデバイス変更の通知を受けたとき
+    （または操作が失敗したとき）にのみ取得し直す。
+    mute_all() はミュート前の状態を記録し、restore_all() はその状態に戻す
+    （元からミュートされていたエンドポイントを解除しない）。
+    mute_all() / restore_all() は参照カウントで対になり、再生が重なった場合は
+    最初の mute_all() でミュートし、最後の restore_all() で元に戻す。
+    """
 
-def _set_mic_mute(mute: bool) -> None:
-    """デフォルト録音デバイスのミュート状態を設定する。"""
-    comtypes.CoInitialize()
-    from pycaw.pycaw import IMMDeviceEnumerator
-
-    enumerator = comtypes.CoCreateInstance(
-        _CLSID_MMDeviceEnumerator,
-        IMMDeviceEnumerator,
-        comtypes.CLSCTX_INPROC_SERVER,
-    )
-    # eCapture=1, eMultimedia=1
-    mic = enumerator.GetDefaultAudioEndpoint(1, 1)
-    if mic is None:
-        raise RuntimeError("デフォルトの録音デバイスが見つかりません")
-    interface = mic.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
-    volume = cast(interface, POINTER(IAudioEndpointVolume))
-    volume.SetMute(1 if mute else 0, None)
+    def __init__(self, backend: Optional[EndpointBackend] = None) -> None:
+        self._backend = backend if backend is not None else get_backend().endpoint_backend()
+        self._lock = threading.RLock()
+        self._volumes: dict[int, object] = {}
+        self._saved: dict[int, bool] = {}
+        # mute_all() の参照カウントと、最初の mute_all() でスピーカーをミュートできたか
+        self._mute_refs = 0
+        self._speaker_muted = False
+        self._watching = False
+
+    # ---------- インターフェースのキャッシュ ----------
+
+    def _volume(self, flow: int):
+        with self._lock:
+            if not self._watching:
+                self._watching = True
+                if self._backend.watch_default_device(self.invalidate):
+                    logger.info("デフォルトデバイス変更通知を登録しました")
+            volume = self._volumes.get(flow)
+            if volume is None:
+                volume = self._backend.resolve(flow)
+                self._volumes[flow] = volume
+            return volume
+
+    def invalidate(self, flow: Optional[int] = None) -> None:
+        """キャッシュ済みインターフェースを破棄する（次回操作時に取得し直す）。"""
+        with self._lock:
+            if flow is None:
+                self._volumes.clear()
+            else:
+                self._volumes.pop(flow, None)
+        logger.info("オーディオエンドポイントのキャッシュを破棄しました (flow=%s)", flow)
+
+    def prepare(self) -> None:
+        """マイク・スピーカーのインターフェースを事前に取得しておく。"""
+        for flow in (CAPTURE, RENDER):
+            try:
+                self._volume(flow)
+            except Exception:
+                logger.warning("%sのインターフェース取得に失敗しました", _FLOW_NAMES[flow], exc_info=True)
+
+    def _call(self, flow: int, op: Callable):
+        """キャッシュ済みインターフェースで op を実行する。失敗時は一度だけ取得し直して再試行する。"""
+        try:
+            return op(self._volume(flow))
+        except Exception:
+            metrics.count("endpoint_retry")
+            self.invalidate(flow)
+            return op(self._volume(flow))
+
+    # ---------- 単一エンドポイントの操作 ----------
+
+    def get_mute(self, flow: int) -> bool:
+        return self._call(flow, self._backend.get_mute)
+
+    def set_mute(self, flow: int, mute: bool) -> None:
+        self._call(flow, lambda volume: self._backend.set_mute(volume, mute))
+
+    # ---------- 一括ミュート / 復元 ----------
+
+    def mute_all(self) -> bool:
+        """マイクとスピーカーをまとめてミュートする。
+
+        マイクのミュートに失敗した場合は例外を送出する（ガイダンスを流してはいけないため）。
+        スピーカーのミュート失敗は警告のみとし、スピーカーをミュートできたかを返す。
+        既にミュート中（参照カウント > 0）の場合は状態を変えずに参照カウントだけ増やす。
+        """
+        with self._lock:
+            if self._mute_refs > 0:
+                self._mute_refs += 1
+                logger.info("既にミュート中です (参照数: %d)", self._mute_refs)
+                return self._speaker_muted
+            self._saved.clear()
+            with metrics.span("mute_mic"):
+                previous = self.get_mute(CAPTURE)
+                self.set_mute(CAPTURE, True)
+            self._saved[CAPTURE] = previous
+            self._mute_refs = 1
+            logger.info("物理マイクをミュートしました (元の状態: %s)", _state(previous))
+
+            try:
+                with metrics.span("mute_speaker"):
+                    previous = self.get_mute(RENDER)
+                    self.set_mute(RENDER, True)
+            except Exception:
+                logger.warning("スピーカーミュートに失敗しました（ガイダンス再生は続行します）", exc_info=True)
+                self._speaker_muted = False
+                return False
+            self._saved[RENDER] = previous
+            self._speaker_muted = True
+            logger.info("デフォルトスピーカーをミュートしました (元の状態: %s)", _state(previous))
+            return True
+
+    def restore_all(self) -> bool:
+        """mute_all() でミュートしたエンドポイントを元の状態に戻す。
+
+        一方の復元に失敗しても他方の復元は続行する。すべて成功すれば True を返す。
+        他の再生がまだミュートを必要としている（参照カウント > 1）場合は戻さない。
+        """
+        ok = True
+        with self._lock:
+            if self._mute_refs > 1:
+                self._mute_refs -= 1
+                logger.info("他の再生がミュート中のため元に戻しません (残りの参照数: %d)", self._mute_refs)
+                return True
+            self._mute_refs = 0
+            saved, self._saved = self._saved, {}
+            for flow, previous in saved.items():
+                try:
+                    with metrics.span("restore_mic" if flow == CAPTURE else "restore_speaker"):
+                        self.set_mute(flow, previous)
+                    logger.info("%sを元の状態に戻しました (%s)", _FLOW_NAMES[flow], _state(previous))
+                except Exception:
+                    logger.exception("%sのミュート状態の復元に失敗しました — 手動で解除してください",
+                                     _FLOW_NAMES[flow])
+                    ok = False
+        return ok
+
+
+def _state(muted: bool) -> str:
+    return "ミュート" if muted else "ミュート解除"
+
+
+_controller: Optional[EndpointController] = None
+_controller_lock = threading.Lock()
+
+
+def get_controller() -> EndpointController:
+    """プロセス共通の EndpointController を返す（初回呼び出し時に生成）。"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = EndpointController()
+        return _controller
 
 
+# ---------- 物理マイクのミュート制御 ----------
+
 def mute_physical_mic() -> None:
     """デフォルト物理マイクをミュートする。"""
     try:
-        _set_mic_mute(True)
+        get_controller().set_mute(CAPTURE, True)
         logger.info("物理マイクをミュートしました")
     except Exception:
         logger.exception("物理マイクのミュートに失敗しました")
@@ -75,7 +286,7 @@ def mute_physical_mic() -> None:
 def unmute_physical_mic() -> None:
     """デフォルト物理マイクのミュートを解除する。"""
     try:
-        _set_mic_mute(False)
+        get_controller().set_mute(CAPTURE, False)
         logger.info("物理マイクのミュートを解除しました")
     except Exception:
         logger.exception("物理マイクのミュート解除に失敗しました")
@@ -84,29 +295,10 @@ def unmute_physical_mic() -> None:
 
 # ---------- デフォルトスピーカーのミュート制御 ----------
 
-def _set_speaker_mute(mute: bool) -> None:
-    """デフォルト再生デバイス（スピーカー）のミュート状態を設定する。"""
-    comtypes.CoInitialize()
-    from pycaw.pycaw import IMMDeviceEnumerator
-
-    enumerator = comtypes.CoCreateInstance(
-        _CLSID_MMDeviceEnumerator,
-        IMMDeviceEnumerator,
-        comtypes.CLSCTX_INPROC_SERVER,
-    )
-    # eRender=0, eMultimedia=1
-    speaker = enumerator.GetDefaultAudioEndpoint(0, 1)
-    if speaker is None:
-        raise RuntimeError("デフォルトの再生デバイスが見つかりません")
-    interface = speaker.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
-    volume = cast(interface, POINTER(IAudioEndpointVolume))
-    volume.SetMute(1 if mute else 0, None)
-
-
 def mute_default_speaker() -> None:
     """デフォルトスピーカーをミュートする（ガイダンス再生中のハウリング防止）。"""
     try:
-        _set_speaker_mute(True)
+        get_controller().set_mute(RENDER, True)
         logger.info("デフォルトスピーカーをミュートしました")
     except Exception:
         logger.exception("スピーカーミュートに失敗しました")
@@ -116,26 +308,229 @@ def mute_default_speaker() -> None:
 def unmute_default_speaker() -> None:
     """デフォルトスピーカーのミュートを解除する。"""
     try:
-        _set_speaker_mute(False)
+        get_controller().set_mute(RENDER, False)
         logger.info("デフォルトスピーカーのミュートを解除しました")
     except Exception:
         logger.exception("スピーカーミュート解除に失敗しました")
         raise
 
 
+# ---------- デバイスレジストリ ----------
+
+# 解決結果キャッシュのファイル名（EXE ディレクトリに作成）
+_DEVICE_CACHE_FILE = ".device_cache.json"
+
+
+class DeviceRegistry:
+    """オーディオバックエンドのデバイス一覧をプロセス内で一度だけ取得して索引化するレジストリ。
+
+    設定名 → デバイス（名前・ホスト API・インデックス）の解決結果をファイルに保存し、
+    次回以降はそのインデックスのデバイス情報だけを照合して再利用する。
+    デバイスの抜き差しを反映するには refresh() を呼ぶ。
+    """
+
+    def __init__(self, cache_path: Optional[str] = None) -> None:
+        self._audio = get_backend()
+        if cache_path is None:
+            cache_file = _DEVICE_CACHE_FILE
+            if self._audio.name != "sounddevice":
+                # 仮想バックエンドのインデックスを実機のキャッシュに混ぜない
+                cache_file = f".device_cache.{self._audio.name}.json"
+            cache_path = os.path.join(_base_dir(), cache_file)
+        self._cache_path = cache_path
+        self._lock = threading.RLock()
+        self._devices: Optional[list[dict]] = None
+        self._hostapi_names: Optional[list[str]] = None
+        # (小文字化したデバイス名, インデックス) の一覧
+        self._names: list[tuple[str, int]] = []
+        # 一覧全体を取得せずに個別に問い合わせたデバイス
+        self._known: dict[int, tuple[dict, str]] = {}
+        self._resolved: Optional[dict[str, dict]] = None
+
+    # ---------- 一覧と索引 ----------
+
+    def _load(self) -> None:
+        if self._devices is not None:
+            return
+        self._devices = [dict(dev) for dev in self._audio.query_devices()]
+        self._hostapi_names = [api["name"] for api in self._audio.query_hostapis()]
+        self._names = [(dev["name"].lower(), idx) for idx, dev in enumerate(self._devices)]
+
+    def _info(self, index: int) -> tuple[dict, str]:
+        """デバイス *index* の情報とホスト API 名を返す。
+
+        一覧を取得済みでなければ、一覧全体ではなく該当デバイスだけを問い合わせる。
+        """
+        if self._devices is not None:
+            dev = self._devices[index]
+            api = dev.get("hostapi")
+            return dev, self._hostapi_names[api] if api is not None else "unknown"
+        info = self._known.get(index)
+        if info is None:
+            dev = dict(self._audio.query_devices(index))
+            api = dev.get("hostapi")
+            info = (dev, self._audio.query_hostapis(api)["name"] if api is not None else "unknown")
+            self._known[index] = info
+        return info
+
+    def devices(self) -> list[dict]:
+        with self._lock:
+            self._load()
+            return self._devices
+
+    def device(self, index: int) -> dict:
+        with self._lock:
+            return self._info(index)[0]
+
+    def hostapi_name(self, index: int) -> str:
+        """デバイス *index* のホスト API 名を返す。"""
+        with self._lock:
+            return self._info(index)[1]
+
+    def refresh(self) -> None:
+        """PortAudio を再初期化してデバイス一覧を取り直す（デバイスの抜き差し後に呼ぶ）。
+
+        PortAudio の再初期化は開いているストリームをすべて閉じるため、
+        再生中・録音中には呼ばないこと。
+        """
+        with self._lock:
+            self._audio.reinitialize()
+            self._devices = None
+            self._hostapi_names = None
+            self._names = []
+            self._known.clear()
+            self._load()
+        logger.info("デバイス一覧を再取得しました (%d 件)", len(self._devices))
+
+    # ---------- 解決結果キャッシュ ----------
+
+    def _resolved_cache(self) -> dict[str, dict]:
+        if self._resolved is None:
+            try:
+                with open(self._cache_path, "r", encoding="utf-8") as f:
+                    self._resolved = json.load(f)
+            except (OSError, ValueError):
+                self._resolved = {}
+        return self._resolved
+
+    def _cached_index(self, key: str, kind: str) -> Optional[int]:
+        """キャッシュ済みの解決結果を返す。インデックスのデバイスが一致しなければ None。"""
+        entry = self._resolved_cache().get(key)
+        if entry is None:
+            return None
+        index = entry["index"]
+        try:
+            dev, api_name = self._info(index)
+        except (IndexError, ValueError, *self._audio.device_errors):
+            return None
+        if (dev["name"] != entry["name"] or api_name != entry["hostapi"]
+                or dev[f"max_{kind}_channels"] <= 0):
+            return None
+        return index
+
+    def _remember(self, key: str, index: int) -> None:
+        cache = self._resolved_cache()
+        dev, api_name = self._info(index)
+        entry = {"name": dev["name"], "hostapi": api_name, "index": index,
+                 "samplerate": dev.get("default_samplerate")}
+        if cache.get(key) == entry:
+            return
+        cache[key] = entry
+        try:
+            tmp_path = self._cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self._cache_path)
+        except OSError:
+            logger.warning("デバイスキャッシュを保存できませんでした: %s", self._cache_path, exc_info=True)
+
+    def cached_output(self, device_name: str) -> Optional[dict]:
+        """前回の出力デバイス *device_name* の解決結果（index / samplerate など）を返す。
+
+        デバイスには問い合わせず、ロックも取らない（他のスレッドが一覧を取得中でも待たない）。
+        現在のデバイスと照合していないため、事前準備での予測と予算超過時の代替にだけ使う。
+        """
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as f:
+                return json.load(f).get(f"output:{device_name}")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    # ---------- 検索 ----------
+
+    def _matches(self, device_name: str, kind: str) -> list[int]:
+        search = device_name.lower()
+        return [
+            idx for name, idx in self._names
+            if search in name and self._devices[idx][f"max_{kind}_channels"] > 0
+        ]
+
+    def find_output(self, device_name: str) -> Optional[int]:
+        """*device_name* を含む出力デバイスのインデックスを返す。"""
+        key = f"output:{device_name}"
+        with self._lock:
+            index = self._cached_index(key, "output")
+            if index is not None:
+                logger.info("出力デバイスをキャッシュから解決: [%d] %s", index, device_name)
+                metrics.count("device_cache_hit")
+                return index
+
+            metrics.count("device_cache_miss")
+            with metrics.span("device_enumerate"):
+                self._load()
+            matches = self._matches(device_name, "output")
+            if not matches:
+                return None
+            self._remember(key, matches[0])
+            return matches[0]
+
+    def find_input(self, device_name: str, preferred_api: str = "WASAPI") -> Optional[int]:
+        """*device_name* を含む入力デバイスのインデックスを返す（*preferred_api* を優先）。"""
+        key = f"input:{device_name}"
+        with self._lock:
+            index = self._cached_index(key, "input")
+            if index is not None:
+                logger.info("入力デバイスをキャッシュから解決: [%d] %s", index, device_name)
+                metrics.count("device_cache_hit")
+                return index
+
+            metrics.count("device_cache_miss")
+            with metrics.span("device_enumerate"):
+                self._load()
+            matches = self._matches(device_name, "input")
+            if not matches:
+                return None
+            preferred = [idx for idx in matches if preferred_api in self.hostapi_name(idx)]
+            index = preferred[0] if preferred else matches[0]
+            self._remember(key, index)
+            return index
+
+
+_registry: Optional[DeviceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> DeviceRegistry:
+    """プロセス共通の DeviceRegistry を返す（初回呼び出し時に生成）。"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DeviceRegistry()
+        return _registry
+
+
 # ---------- 仮想オーディオデバイスの検索 ----------
 
 def find_virtual_cable_device(device_name: str) -> Optional[int]:
-    """sounddevice のデバイスリストから *device_name* を含む出力デバイスを検索する。
+    """デバイスレジストリから *device_name* を含む出力デバイスを検索する。
 
     見つかった場合はデバイスインデックスを、見つからなければ None を返す。
     """
-    devices = sd.query_devices()
-    search = device_name.lower()
-    for idx, dev in enumerate(devices):
-        if search in dev["name"].lower() and dev["max_output_channels"] > 0:
-            logger.info("仮想ケーブルデバイスを検出: [%d] %s", idx, dev["name"])
-            return idx
+    registry = get_registry()
+    idx = registry.find_output(device_name)
+    if idx is not None:
+        logger.info("仮想ケーブルデバイスを検出: [%d] %s", idx, registry.device(idx)["name"])
+        return idx
 
     logger.warning("仮想ケーブルデバイス '%s' が見つかりません", device_name)
     return None
@@ -144,48 +539,23 @@ def find_virtual_cable_device(device_name: str) -> Optional[int]:
 # ---------- 入力デバイスの検索 ----------
 
 def find_input_device(device_name: str) -> Optional[int]:
-    """sounddevice のデバイスリストから *device_name* を含む入力デバイスを検索する。
+    """デバイスレジストリから *device_name* を含む入力デバイスを検索する。
 
     WASAPI デバイスを優先的に選択する（最も信頼性が高い）。
     見つかった場合はデバイスインデックスを、見つからなければ None を返す。
     """
-    devices = sd.query_devices()
-    hostapis = sd.query_hostapis()
-    search = device_name.lower()
-
-    # WASAPI の hostapi インデックスを特定
-    wasapi_api_idx = None
-    for api_idx, api in enumerate(hostapis):
-        if "WASAPI" in api["name"]:
-            wasapi_api_idx = api_idx
-            break
-
-    # 全マッチを収集し、WASAPI を優先
-    candidates = []
-    for idx, dev in enumerate(devices):
-        if search in dev["name"].lower() and dev["max_input_channels"] > 0:
-            is_wasapi = (dev.get("hostapi") == wasapi_api_idx) if wasapi_api_idx is not None else False
-            candidates.append((idx, dev, is_wasapi))
-
-    if candidates:
-        # WASAPI デバイスを優先選択
-        for idx, dev, is_wasapi in candidates:
-            if is_wasapi:
-                api_name = hostapis[dev["hostapi"]]["name"] if dev.get("hostapi") is not None else "unknown"
-                logger.info("入力デバイスを検出 (WASAPI優先): [%d] %s (API=%s, 入力ch=%d)",
-                            idx, dev["name"], api_name, dev["max_input_channels"])
-                return idx
-        # WASAPI が無ければ最初のマッチを返す
-        idx, dev, _ = candidates[0]
-        api_name = hostapis[dev["hostapi"]]["name"] if dev.get("hostapi") is not None else "unknown"
+    registry = get_registry()
+    idx = registry.find_input(device_name)
+    if idx is not None:
+        dev = registry.device(idx)
         logger.info("入力デバイスを検出: [%d] %s (API=%s, 入力ch=%d)",
-                    idx, dev["name"], api_name, dev["max_input_channels"])
+                    idx, dev["name"], registry.hostapi_name(idx), dev["max_input_channels"])
         return idx
 
     # デバッグ用: 全入力デバイスを列挙
     logger.warning("入力デバイス '%s' が見つかりません。利用可能な入力デバイス一覧:", device_name)
-    for idx, dev in enumerate(devices):
+    for idx, dev in enumerate(registry.devices()):
         if dev["max_input_channels"] > 0:
-            api_name = hostapis[dev["hostapi"]]["name"] if dev.get("hostapi") is not None else "unknown"
-            logger.warning("  [%d] %s (API=%s, 入力ch=%d)", idx, dev["name"], api_name, dev["max_input_channels"])
+            logger.warning("  [%d] %s (API=%s, 入力ch=%d)",
+                           idx, dev["name"], registry.hostapi_name(idx), dev["max_input_channels"])
     return None
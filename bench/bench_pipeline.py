@@ -0,0 +1,405 @@
+"""録音パイプライン（キャプチャ → エンコード → 保存）のベンチマーク。
+
+recorder.run が実際に扱う条件（44.1/48kHz、モノラル/ステレオ、1〜120 分）の
+合成 PCM を生成し、段階ごとの処理時間・ピークメモリ（RSS）・出力バイト数を計測する。
+各計測は子プロセスで行うため、ピーク RSS は計測ごとに独立している。
+
+使い方（リポジトリのルートで実行）:
+    python bench/bench_pipeline.py run --out bench/results/before.json
+    python bench/bench_pipeline.py run --minutes 120 --rates 48000 --channels 2 --out long.json
+    python bench/bench_pipeline.py compare bench/results/before.json bench/results/after.json
+
+段階:
+    concatenate       10ms ブロックのリストを np.concatenate で結合（旧来の一括方式）
+    tobytes           結合済み配列の tobytes()
+    sf_write_wav      sf.write によるデバッグ用 WAV の書き出し
+    pcm_to_mp3        一括エンコード（mp3codec.pcm_to_mp3）
+    streaming_mp3     録音中の逐次エンコード（recorder._Mp3Sink に 1 秒ずつ渡す）
+    journal           ジャーナルへの追記（journal.Journal）
+    wav_to_mp3        変換ワーカーの WAV → MP3 変換（mp3codec.wav_to_mp3）
+    segments_mp3      区間に分けた並列エンコード（mp3codec.encode_segments、CPU コア数のプロセス）
+    guidance_load     ガイダンス読み込み（guidance_cache のキャッシュ無し / 有り）
+    encode_sweep      エンコーダーの quality × bitrate ごとの一括エンコード
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+# recorder のコールバックが受け取るブロック長（10ms）
+_CALLBACK_BLOCK_SEC = 0.01
+# 合成 PCM を生成する単位（秒）
+_SYNTH_CHUNK_SEC = 60
+# 比較時に回帰とみなす悪化率の既定値
+_DEFAULT_THRESHOLD = 0.10
+# 計測誤差で回帰と判定しないよう、これ未満の悪化は無視する
+_MIN_WALL_DELTA_SEC = 0.05
+_MIN_RSS_DELTA_BYTES = 8 * 1024 * 1024
+
+_STAGES = [
+    "concatenate", "tobytes", "sf_write_wav", "pcm_to_mp3", "streaming_mp3",
+    "journal", "wav_to_mp3", "segments_mp3", "guidance_load",
+]
+
+
+# ---------- 計測の補助 ----------
+
+def _peak_rss_bytes() -> int:
+    """このプロセスのピーク RSS（バイト）を返す。"""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class _Counters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = _Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb
+        )
+        return counters.PeakWorkingSetSize
+
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト、Linux は KiB
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def synth_pcm(minutes: float, rate: int, channels: int, seed: int = 0):
+    """通話を模した決定的な int16 PCM (frames, channels) を生成する。
+
+    話者の交代を模して 0.5〜3 秒ごとに音量が変わる帯域制限ノイズと、
+    小さな 440Hz の成分を重ねる（無音ばかりのデータでエンコードが速く見えないように）。
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * rate)
+    out = np.empty((total, channels), dtype=np.int16)
+    chunk = _SYNTH_CHUNK_SEC * rate
+    for start in range(0, total, chunk):
+        n = min(chunk, total - start)
+        t = (np.arange(start, start + n) / rate).astype(np.float32)
+        noise = rng.standard_normal((n, channels), dtype=np.float32)
+        # 簡易ローパス（隣接サンプルの平均）で音声帯域に寄せる
+        noise[1:] = (noise[1:] + noise[:-1]) * 0.5
+        seg_len = int(rate * rng.uniform(0.5, 3.0))
+        levels = rng.uniform(0.0, 0.3, size=n // seg_len + 1).astype(np.float32)
+        envelope = np.repeat(levels, seg_len)[:n, None]
+        signal = noise * envelope + 0.02 * np.sin(2 * np.pi * 440.0 * t)[:, None]
+        out[start:start + n] = np.clip(signal * 32767, -32768, 32767).astype(np.int16)
+    return out
+
+
+def _blocks(pcm, block_frames: int):
+    for start in range(0, len(pcm), block_frames):
+        yield pcm[start:start + block_frames]
+
+
+# ---------- 各段階（子プロセスで実行） ----------
+
+def _stage_concatenate(pcm, params, workdir):
+    import numpy as np
+
+    block = int(params["rate"] * _CALLBACK_BLOCK_SEC)
+    chunks = [b.copy() for b in _blocks(pcm, block)]
+    t0 = time.perf_counter()
+    joined = np.concatenate(chunks, axis=0)
+    return time.perf_counter() - t0, joined.nbytes
+
+
+def _stage_tobytes(pcm, params, workdir):
+    t0 = time.perf_counter()
+    data = pcm.tobytes()
+    return time.perf_counter() - t0, len(data)
+
+
+def _stage_sf_write_wav(pcm, params, workdir):
+    import soundfile as sf
+
+    path = os.path.join(workdir, "bench.wav")
+    t0 = time.perf_counter()
+    sf.write(path, pcm, params["rate"], subtype="PCM_16")
+    return time.perf_counter() - t0, os.path.getsize(path)
+
+
+def _stage_pcm_to_mp3(pcm, params, workdir):
+    from mp3codec import pcm_to_mp3
+
+    data = pcm.tobytes()
+    t0 = time.perf_counter()
+    mp3 = pcm_to_mp3(data, params["rate"], params["channels"])
+    return time.perf_counter() - t0, len(mp3)
+
+
+def _stage_streaming_mp3(pcm, params, workdir):
+    from recorder import _Mp3Sink
+
+    path = os.path.join(workdir, "bench.mp3")
+    t0 = time.perf_counter()
+    sink = _Mp3Sink(path, params["rate"], params["channels"])
+    for block in _blocks(pcm, params["rate"]):
+        sink.write(block)
+    sink.close()
+    return time.perf_counter() - t0, sink.bytes_written
+
+
+def _stage_journal(pcm, params, workdir):
+    from journal import Journal
+
+    t0 = time.perf_counter()
+    journal = Journal(workdir, "bench", params["rate"], params["channels"])
+    for block in _blocks(pcm, params["rate"]):
+        journal.append(block)
+    journal.close()
+    elapsed = time.perf_counter() - t0
+    size = sum(os.path.getsize(os.path.join(journal.path, n)) for n in os.listdir(journal.path))
+    return elapsed, size
+
+
+def _stage_wav_to_mp3(pcm, params, workdir):
+    import soundfile as sf
+
+    from mp3codec import wav_to_mp3
+
+    wav_path = os.path.join(workdir, "bench.wav")
+    sf.write(wav_path, pcm, params["rate"], subtype="PCM_16")
+    t0 = time.perf_counter()
+    size = wav_to_mp3(wav_path, os.path.join(workdir, "bench.mp3"))
+    return time.perf_counter() - t0, size
+
+
+def _stage_segments_mp3(pcm, params, workdir):
+    from concurrent.futures import ProcessPoolExecutor
+
+    from mp3codec import encode_segments
+
+    raw_path = os.path.join(workdir, "bench.pcm")
+    pcm.tofile(raw_path)
+    workers = os.cpu_count() or 1
+    out = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        segments = encode_segments(raw_path, params["rate"], params["channels"], out.append, pool, workers)
+    return time.perf_counter() - t0, sum(map(len, out)), {"workers": workers, "segments": segments}
+
+
+def _stage_guidance_load(pcm, params, workdir):
+    import soundfile as sf
+
+    import guidance_cache
+
+    # ガイダンスは数秒〜数十秒のため、minutes に関わらず先頭 30 秒を使う
+    path = os.path.join(workdir, "guidance.wav")
+    sf.write(path, pcm[: params["rate"] * 30], params["rate"], subtype="PCM_16")
+    t0 = time.perf_counter()
+    data, _, hit = guidance_cache.load_guidance(path)
+    miss_sec = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    data, _, hit = guidance_cache.load_guidance(path)
+    hit_sec = time.perf_counter() - t0
+    return miss_sec, data.nbytes, {"cache_hit_sec": round(hit_sec, 6)}
+
+
+def _stage_encode_sweep(pcm, params, workdir):
+    import lameenc
+
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(params["bitrate"])
+    encoder.set_in_sample_rate(params["rate"])
+    encoder.set_channels(params["channels"])
+    encoder.set_quality(params["quality"])
+    data = pcm.tobytes()
+    t0 = time.perf_counter()
+    mp3 = encoder.encode(data) + encoder.flush()
+    return time.perf_counter() - t0, len(mp3)
+
+
+def _run_child(spec: dict) -> dict:
+    """子プロセス側: PCM を生成して 1 つの段階を計測し、結果を返す。"""
+    params = spec["params"]
+    pcm = synth_pcm(params["minutes"], params["rate"], params["channels"], seed=spec.get("seed", 0))
+    rss_before = _peak_rss_bytes()
+    stage = globals()[f"_stage_{spec['stage']}"]
+    with tempfile.TemporaryDirectory(prefix="call_helper_bench_") as workdir:
+        outcome = stage(pcm, params, workdir)
+    wall_sec, bytes_out = outcome[0], outcome[1]
+    extra = outcome[2] if len(outcome) > 2 else {}
+    rss_after = _peak_rss_bytes()
+    audio_sec = params["minutes"] * 60
+    return {
+        "stage": spec["stage"],
+        "params": params,
+        "wall_sec": round(wall_sec, 6),
+        "realtime_factor": round(audio_sec / wall_sec, 1) if wall_sec > 0 else None,
+        "peak_rss_bytes": rss_after,
+        "stage_rss_bytes": max(0, rss_after - rss_before),
+        "input_bytes": pcm.nbytes,
+        "bytes_out": bytes_out,
+        **extra,
+    }
+
+
+def _measure(stage: str, params: dict) -> dict:
+    spec = json.dumps({"stage": stage, "params": params})
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "_child", spec],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"stage": stage, "params": params, "error": proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# ---------- 実行・比較 ----------
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_ROOT,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.stdout.strip() or None
+
+
+def _meta() -> dict:
+    import lameenc  # noqa: F401  (インストールされていることの確認)
+    import numpy as np
+    import soundfile as sf
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "soundfile": sf.__version__,
+    }
+
+
+def _csv(value: str, cast=int) -> list:
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def run(args) -> dict:
+    stages = _csv(args.stages, str) if args.stages else _STAGES
+    grid = list(itertools.product(_csv(args.minutes, float), _csv(args.rates), _csv(args.channels)))
+    jobs = [(stage, {"minutes": m, "rate": r, "channels": c}) for m, r, c in grid for stage in stages]
+    if not args.no_sweep:
+        # エンコード時間は通話時間に比例するため、設定の比較は短い録音で行う
+        for quality, bitrate, rate, channels in itertools.product(
+            _csv(args.qualities), _csv(args.bitrates), _csv(args.rates), _csv(args.channels)
+        ):
+            jobs.append(("encode_sweep", {"minutes": args.sweep_minutes, "rate": rate,
+                                          "channels": channels, "quality": quality, "bitrate": bitrate}))
+
+    results = []
+    for i, (stage, params) in enumerate(jobs, 1):
+        result = _measure(stage, params)
+        results.append(result)
+        if "error" in result:
+            print(f"[{i}/{len(jobs)}] {stage} {params}: エラー {result['error']}", flush=True)
+        else:
+            print(f"[{i}/{len(jobs)}] {stage} {params}: {result['wall_sec']:.3f}s, "
+                  f"RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB, {result['bytes_out']} bytes", flush=True)
+
+    report = {"meta": _meta(), "results": results}
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"レポートを保存しました: {args.out}")
+    return report
+
+
+def _key(result: dict) -> str:
+    return result["stage"] + " " + json.dumps(result["params"], sort_keys=True)
+
+
+def compare(base_path: str, new_path: str, threshold: float) -> int:
+    """2 つのレポートを比較し、しきい値を超えて悪化した計測があれば 1 を返す。"""
+    with open(base_path, encoding="utf-8") as f:
+        base = {_key(r): r for r in json.load(f)["results"] if "error" not in r}
+    with open(new_path, encoding="utf-8") as f:
+        new = {_key(r): r for r in json.load(f)["results"] if "error" not in r}
+
+    regressions = 0
+    print(f"{'計測':<70}{'wall':>10}{'Δwall':>9}{'RSS MiB':>10}{'ΔRSS':>9}")
+    for key in sorted(base.keys() & new.keys()):
+        b, n = base[key], new[key]
+        d_wall = n["wall_sec"] / b["wall_sec"] - 1 if b["wall_sec"] > 0 else 0.0
+        d_rss = n["peak_rss_bytes"] / b["peak_rss_bytes"] - 1 if b["peak_rss_bytes"] > 0 else 0.0
+        mark = ""
+        wall_worse = d_wall > threshold and n["wall_sec"] - b["wall_sec"] >= _MIN_WALL_DELTA_SEC
+        rss_worse = (d_rss > threshold
+                     and n["peak_rss_bytes"] - b["peak_rss_bytes"] >= _MIN_RSS_DELTA_BYTES)
+        if wall_worse or rss_worse:
+            regressions += 1
+            mark = "  ← 悪化"
+        print(f"{key:<70}{n['wall_sec']:>10.3f}{d_wall:>+9.1%}"
+              f"{n['peak_rss_bytes'] / 2**20:>10.0f}{d_rss:>+9.1%}{mark}")
+    for key in sorted(base.keys() - new.keys()):
+        print(f"{key:<70}（比較先にありません）")
+    print(f"\n悪化 {regressions} 件（しきい値 {threshold:.0%}）")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    if len(sys.argv) == 3 and sys.argv[1] == "_child":
+        print(json.dumps(_run_child(json.loads(sys.argv[2]))))
+        return 0
+
+    parser = argparse.ArgumentParser(description="録音パイプラインのベンチマーク")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="ベンチマークを実行する")
+    p_run.add_argument("--minutes", default="1,10,60,120", help="録音時間（分）のカンマ区切り")
+    p_run.add_argument("--rates", default="44100,48000", help="サンプルレートのカンマ区切り")
+    p_run.add_argument("--channels", default="1,2", help="チャンネル数のカンマ区切り")
+    p_run.add_argument("--stages", default="", help=f"計測する段階（省略時: {','.join(_STAGES)}）")
+    p_run.add_argument("--qualities", default="0,2,5,7", help="encode_sweep の quality")
+    p_run.add_argument("--bitrates", default="64,96,128", help="encode_sweep のビットレート (kbps)")
+    p_run.add_argument("--sweep-minutes", type=float, default=5.0, help="encode_sweep の録音時間（分）")
+    p_run.add_argument("--no-sweep", action="store_true", help="encode_sweep を行わない")
+    p_run.add_argument("--out", default=None, help="レポート（JSON）の保存先")
+
+    p_cmp = sub.add_parser("compare", help="2 つのレポートを比較する")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=_DEFAULT_THRESHOLD,
+                       help="回帰とみなす悪化率（既定 0.10 = 10%%）")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        report = run(args)
+        return 1 if any("error" in r for r in report["results"]) else 0
+    return compare(args.base, args.new, args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""区間に分けた並列エンコード（mp3codec.encode_segments）のプロセス数ごとの処理時間。
+
+同じ合成 PCM を 1 つのエンコーダーと encode_segments（プロセス数ごと）でエンコードし、
+処理時間と区間の数を表示する。継ぎ目の正しさは tests/test_mp3_segments.py で確認する。
+
+使い方（リポジトリのルートで実行）:
+    python bench/bench_segments.py
+    python bench/bench_segments.py --minutes 30 --rates 48000 --channels 2 --workers 1,2,4,8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+from bench_pipeline import synth_pcm  # noqa: E402
+
+
+def bench(minutes: float, rate: int, channels: int, vbr_quality, worker_counts: list[int],
+          workdir: str) -> None:
+    from mp3codec import _encode_range, encode_segments
+
+    pcm = synth_pcm(minutes, rate, channels, seed=1)
+    raw_path = os.path.join(workdir, "bench.pcm")
+    pcm.tofile(raw_path)
+    label = f"{minutes:g} 分 {rate}Hz {channels}ch {'VBR' if vbr_quality is not None else 'CBR'}"
+
+    t0 = time.perf_counter()
+    _encode_range(raw_path, 0, len(pcm), rate, channels, 128, vbr_quality)
+    print(f"{label}: 1 エンコーダー {time.perf_counter() - t0:.2f}s", flush=True)
+    for workers in worker_counts:
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            segments = encode_segments(raw_path, rate, channels, lambda data: None, pool, workers,
+                                       vbr_quality=vbr_quality)
+        print(f"{label}: {workers} プロセス {time.perf_counter() - t0:.2f}s (区間 {segments})", flush=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="区間に分けた並列エンコードの処理時間")
+    parser.add_argument("--minutes", type=float, default=5.0, help="録音時間（分）")
+    parser.add_argument("--rates", default="44100,48000", help="サンプルレートのカンマ区切り")
+    parser.add_argument("--channels", default="1,2", help="チャンネル数のカンマ区切り")
+    parser.add_argument("--workers", default=str(max(2, os.cpu_count() or 1)),
+                        help="プロセス数のカンマ区切り")
+    args = parser.parse_args()
+
+    worker_counts = [int(v) for v in args.workers.split(",")]
+    with tempfile.TemporaryDirectory(prefix="call_helper_segments_") as workdir:
+        for rate in (int(v) for v in args.rates.split(",")):
+            for channels in (int(v) for v in args.channels.split(",")):
+                for vbr_quality in (None, 4):
+                    bench(args.minutes, rate, channels, vbr_quality, worker_counts, workdir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,34 +3,151 @@
 使い方:
     python call_helper.py --mode=incoming [--number=09012345678]
     python call_helper.py --mode=record [--number=09012345678]
-    python call_helper.py --mode=stop-recording
+    python call_helper.py --mode=stop-recording [--session=ID|all] [--number=09012345678]
+    python call_helper.py --mode=status [--session=ID] [--number=09012345678]
+    python call_helper.py --mode=recover
+    python call_helper.py --mode=transcode
+    python call_helper.py --mode=stats
+    python call_helper.py --mode=search [--number=0312] [--since=2026-02-01] [--until=2026-02-28]
+    python call_helper.py --mode=import-catalog
+    python call_helper.py --mode=simulate [--calls=100] [--call-seconds=180] [--speed=60]
+    python call_helper.py --mode=daemon
+
+常駐デーモン（--mode=daemon）が起動している場合、incoming / record は
+ローカル IPC でデーモンにコマンドを送るだけで終了する。
+デーモンが起動していなければ従来どおり自プロセスで処理する。
+stop-recording / status は録音セッションごとのコントロールチャンネルへ直接送る
+（デーモン内の録音も別プロセスの録音も同じ方法で停止できる）。
+
+フックの起動時間を短く保つため、重いライブラリ（numpy / sounddevice / lameenc など）は
+各モードの処理の中で import する。--profile-startup でモジュールごとの import 時間を表示できる。
 """
 
+import sys
+
+if "--profile-startup" in sys.argv:
+    # 以降のすべての import を計測するため、他のモジュールより先に有効にする
+    import startup_profile
+
+    startup_profile.install()
+
 import argparse
+import atexit
 import logging
 import os
-import sys
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+_LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+# call_helper.log のローテーション（[logging] max_kb / backup_count の既定値）
+_LOG_MAX_KB = 5 * 1024
+_LOG_BACKUP_COUNT = 5
+# 他のプロセスがログを開いていてローテーションできなかった場合に再試行するまでの秒数
+_ROLLOVER_RETRY_SEC = 60.0
+
+
+class _RotatingFileHandler(RotatingFileHandler):
+    """ローテーションに失敗しても追記を続ける RotatingFileHandler。
+
+    Windows では常駐デーモンや録音プロセスが同じログを開いている間はファイル名を変更できないため、
+    失敗した場合はそのまま追記を続け、_ROLLOVER_RETRY_SEC 秒後に再試行する。
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._retry_at = 0.0
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.monotonic() < self._retry_at:
+            return False
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        try:
+            super().doRollover()
+        except OSError:
+            self._retry_at = time.monotonic() + _ROLLOVER_RETRY_SEC
+            if self.stream is None:
+                self.stream = self._open()
+
+
+def _log_rotation() -> tuple[int, int]:
+    """config.ini の [logging] から (max_kb, backup_count) を読む（読めなければ既定値）。"""
+    try:
+        from config_loader import load_config
+
+        config = load_config()
+        return (config.getint("logging", "max_kb", fallback=_LOG_MAX_KB),
+                config.getint("logging", "backup_count", fallback=_LOG_BACKUP_COUNT))
+    except (OSError, ValueError):
+        return _LOG_MAX_KB, _LOG_BACKUP_COUNT
 
 
 def _setup_logging() -> None:
-    """ファイル＋コンソールの両方にログを出力する設定。"""
+    """ファイル（サイズでローテーション）＋コンソールの両方にログを出力する設定。
+
+    ファイル・コンソールへの書き込みは QueueListener のスレッドが行い、
+    ログを出すスレッド（ミュート→再生の区間や録音コールバック）はキューに入れるだけにする。
+    """
     if getattr(sys, "frozen", False):
         log_dir = os.path.dirname(sys.executable)
     else:
         log_dir = os.path.dirname(os.path.abspath(__file__))
 
     log_file = os.path.join(log_dir, "call_helper.log")
+    max_kb, backup_count = _log_rotation()
 
     handlers: list[logging.Handler] = [
-        logging.FileHandler(log_file, encoding="utf-8"),
+        _RotatingFileHandler(log_file, maxBytes=max(0, max_kb) * 1024,
+                             backupCount=max(0, backup_count), encoding="utf-8"),
         logging.StreamHandler(sys.stdout),
     ]
+    formatter = logging.Formatter(_LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-        handlers=handlers,
-    )
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # 終了時にキューに残ったログを書き出す
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(QueueHandler(log_queue))
+
+
+# デーモンへ転送するモードと応答待ちの上限（秒）
+_DAEMON_COMMAND_TIMEOUTS = {
+    "incoming": 5.0,
+    "record": 5.0,
+}
+
+
+def _send_to_daemon(mode: str, number: str | None) -> bool:
+    """常駐デーモンにコマンドを送信する。デーモンが処理した場合は True を返す。"""
+    import ipc
+
+    logger = logging.getLogger(__name__)
+    try:
+        reply = ipc.send_command(
+            ipc.DAEMON_CHANNEL,
+            {"command": mode, "number": number},
+            timeout=_DAEMON_COMMAND_TIMEOUTS[mode],
+        )
+    except Exception:
+        logger.exception("デーモンとの通信に失敗しました（自プロセスで処理します）")
+        return False
+
+    if reply is None:
+        return False
+    if not reply.get("ok"):
+        logger.warning("デーモンがコマンドを処理できませんでした: %s（自プロセスで処理します）", reply)
+        return False
+    logger.info("デーモンにコマンドを送信しました: %s", reply)
+    return True
 
 
 def main() -> None:
@@ -40,13 +157,72 @@ def main() -> None:
     parser.add_argument(
         "--mode",
         required=True,
-        choices=["incoming", "record", "stop-recording"],
-        help="実行モード: incoming=着信時ガイダンス, record=通話録音, stop-recording=録音停止",
+        choices=["incoming", "record", "stop-recording", "status", "recover", "transcode", "stats",
+                 "search", "import-catalog", "simulate", "daemon"],
+        help=(
+            "実行モード: incoming=着信時ガイダンス, record=通話録音, "
+            "stop-recording=録音停止, status=録音状態の表示, "
+            "recover=異常終了した録音の復旧, transcode=未変換 WAV の MP3 変換, "
+            "stats=処理時間の集計 (p50/p95/p99), search=録音の検索, "
+            "import-catalog=既存の録音を録音カタログに登録, "
+            "simulate=仮想デバイスでの通話シミュレーション, "
+            "daemon=常駐デーモン"
+        ),
     )
     parser.add_argument(
         "--number",
         default=None,
-        help="着信番号（ログ記録用、incoming モード時のみ使用）",
+        help="着信番号（incoming / record ではファイル名・ログに使用、"
+             "stop-recording / status では対象の録音をこの番号に絞り込む、search では前方一致で検索）",
+    )
+    parser.add_argument(
+        "--session",
+        default=None,
+        help="stop-recording / status の対象の録音セッション ID（all または省略時はすべて）",
+    )
+    parser.add_argument(
+        "--since",
+        default=None,
+        help="search モードで検索する開始日時の下限（YYYY-MM-DD または YYYY-MM-DD HH:MM）",
+    )
+    parser.add_argument(
+        "--until",
+        default=None,
+        help="search モードで検索する開始日時の上限（日付のみの場合はその日を含む）",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=100,
+        help="search モードで表示する最大件数（0 = すべて）",
+    )
+    parser.add_argument(
+        "--calls",
+        type=int,
+        default=10,
+        help="simulate モードで模擬する通話の件数",
+    )
+    parser.add_argument(
+        "--call-seconds",
+        type=float,
+        default=60.0,
+        help="simulate モードでの 1 件あたりの通話時間（秒）",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=None,
+        help="simulate モードの時計の速さ（省略時は config.ini の [virtual] speed、既定 60 倍速）",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="常駐デーモンを使わず、自プロセスで処理する",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="モジュールごとの import 時間をログに出力する",
     )
     args = parser.parse_args()
 
@@ -55,24 +231,97 @@ def main() -> None:
     logger.info("=== call_helper 起動 (mode=%s) ===", args.mode)
 
     try:
-        if args.mode == "incoming":
-            import incoming
-
-            incoming.run(number=args.number)
-        elif args.mode == "record":
-            import recorder
-
-            recorder.run(number=args.number)
-        elif args.mode == "stop-recording":
-            import recorder
-
-            recorder.stop()
+        if not _dispatch(args, logger):
+            logger.info("=== call_helper 終了 ===")
     except Exception:
         logger.exception("予期しないエラーが発生しました")
         sys.exit(1)
+    finally:
+        if args.profile_startup:
+            import startup_profile
+
+            startup_profile.report(logger)
+
+
+def _dispatch(args: argparse.Namespace, logger: logging.Logger) -> bool:
+    """モードに応じた処理を実行する。デーモンで処理した場合は True を返す。"""
+    if (
+        args.mode in _DAEMON_COMMAND_TIMEOUTS
+        and not args.no_daemon
+        and _send_to_daemon(args.mode, args.number)
+    ):
+        logger.info("=== call_helper 終了 (デーモンで処理) ===")
+        return True
+
+    if args.mode == "incoming":
+        import incoming
+
+        incoming.run(number=args.number)
+    elif args.mode == "record":
+        import recorder
+
+        recorder.run(number=args.number)
+    elif args.mode == "stop-recording":
+        import recording_control
+
+        recording_control.stop(session=args.session, number=args.number)
+    elif args.mode == "status":
+        import json
 
-    logger.info("=== call_helper 終了 ===")
+        import recording_control
+
+        print(json.dumps(recording_control.status(session=args.session, number=args.number),
+                         ensure_ascii=False, indent=2))
+    elif args.mode == "recover":
+        import recorder
+
+        recorder.recover()
+    elif args.mode == "transcode":
+        import transcoder
+
+        transcoder.run_pending()
+    elif args.mode == "stats":
+        import metrics
+
+        path = metrics.metrics_path()
+        if path is None:
+            print("メトリクスは無効になっています（config.ini の [metrics] enabled）")
+        else:
+            print(metrics.format_summary(metrics.summarize(metrics.read_records(path))))
+    elif args.mode in ("search", "import-catalog"):
+        import catalog
+        from config_loader import get_settings
+
+        output_folder = get_settings().output_folder
+        if args.mode == "import-catalog":
+            print(f"{catalog.import_folder(output_folder)} 件を登録しました")
+        else:
+            try:
+                since = catalog.parse_time(args.since) if args.since else None
+                until = catalog.parse_time(args.until, end=True) if args.until else None
+            except ValueError:
+                print("日時は YYYY-MM-DD または YYYY-MM-DD HH:MM の形式で指定してください")
+                return False
+            results = catalog.search(output_folder, number=args.number, since=since, until=until,
+                                     limit=args.limit or None)
+            print(catalog.format_results(results))
+    elif args.mode == "simulate":
+        import metrics
+        import simulate
+
+        summary = simulate.run(calls=args.calls, call_seconds=args.call_seconds, speed=args.speed)
+        print(metrics.format_summary(summary))
+    elif args.mode == "daemon":
+        import daemon
+
+        daemon.run()
+    return False
 
 
 if __name__ == "__main__":
+    if getattr(sys, "frozen", False):
+        # EXE 化した場合、変換ワーカーのプロセスプールに必要
+        import multiprocessing
+
+        multiprocessing.freeze_support()
     main()
@@ -5,8 +5,8 @@ a = Analysis(
     ['call_helper.py'],
     pathex=[],
     binaries=[],
-    datas=[('incoming.py', '.'), ('audio_devices.py', '.'), ('config_loader.py', '.'), ('recorder.py', '.')],
-    hiddenimports=['incoming', 'audio_devices', 'config_loader', 'recorder', 'pycaw', 'comtypes', 'sounddevice', 'soundfile', 'numpy', 'lameenc', 'wave'],
+    datas=[('incoming.py', '.'), ('audio_devices.py', '.'), ('config_loader.py', '.'), ('recorder.py', '.'), ('ipc.py', '.'), ('daemon.py', '.'), ('guidance_cache.py', '.'), ('journal.py', '.'), ('mp3codec.py', '.'), ('transcoder.py', '.'), ('ringbuffer.py', '.'), ('metrics.py', '.'), ('audio_backend.py', '.'), ('simulate.py', '.'), ('recording_control.py', '.'), ('startup_profile.py', '.'), ('analysis.py', '.'), ('sessions.py', '.'), ('scheduler.py', '.'), ('catalog.py', '.'), ('mp3frames.py', '.'), ('peaks.py', '.'), ('health.py', '.'), ('locks.py', '.')],
+    hiddenimports=['incoming', 'audio_devices', 'config_loader', 'recorder', 'ipc', 'daemon', 'guidance_cache', 'journal', 'mp3codec', 'transcoder', 'ringbuffer', 'metrics', 'audio_backend', 'simulate', 'recording_control', 'startup_profile', 'analysis', 'sessions', 'scheduler', 'catalog', 'mp3frames', 'peaks', 'health', 'locks', 'pycaw', 'comtypes', 'sounddevice', 'soundfile', 'numpy', 'lameenc', 'wave'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,282 @@
+"""録音カタログ（output_folder/recordings.db の SQLite インデックス）。
+
+output_folder には数万件の録音ファイルが溜まるため、電話番号や日付で録音を探すたびに
+フォルダを列挙してファイル名を解析するのは遅い。録音が確定するたびにここへ 1 行登録し、
+--mode=search は電話番号（前方一致）・日付範囲のインデックスで検索する。
+
+- 登録元: 録音の保存（ok / queued / wav-fallback）、変換ワーカー（queued → ok / wav-fallback）、
+  ジャーナルからの復旧（recovered）
+- 既存のフォルダは --mode=import-catalog で一度だけ取り込む（ファイル名とヘッダーから登録）
+- カタログへの書き込みに失敗しても録音そのものには影響させない（警告ログのみ）
+
+sqlite3 は標準ライブラリのため、--mode=search は numpy などを読み込まずに動作する。
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import wave
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from mp3frames import read_info
+from sessions import normalize_number
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = "recordings.db"
+# 他のプロセスが書き込み中の場合に待つ上限（秒）
+_BUSY_TIMEOUT_SEC = 10.0
+# 一括登録でまとめてコミットする件数
+_IMPORT_BATCH = 500
+
+# 録音の状態
+OK = "ok"
+QUEUED = "queued"
+WAV_FALLBACK = "wav-fallback"
+RECOVERED = "recovered"
+
+_COLUMNS = ("name", "file", "session_id", "number", "started_at", "ended_at", "duration_sec",
+            "samplerate", "channels", "bytes", "status")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    name TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    session_id TEXT,
+    number TEXT,
+    started_at REAL,
+    ended_at REAL,
+    duration_sec REAL,
+    samplerate INTEGER,
+    channels INTEGER,
+    bytes INTEGER,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recordings_number ON recordings (number, started_at);
+CREATE INDEX IF NOT EXISTS recordings_started ON recordings (started_at);
+"""
+
+# recording_<YYYYmmdd_HHMMSS>[_<番号>][-<連番>].mp3 / .wav
+# 番号の "-" はセッション ID を作るときに取り除くが、以前の録音には "-" を含む番号もあるため、
+# 連番（-2 〜 -100、sessions._MAX_SUFFIX まで）だけを末尾の "-数字" として扱う
+# （0120-123-456 の "-456" は番号の一部）
+_NAME_RE = re.compile(r"^recording_(\d{8}_\d{6})(?:_(.+?))?(?:-([2-9]|[1-9]\d|100))?\.(mp3|wav)$")
+
+
+def catalog_path(output_folder: str) -> str:
+    return os.path.join(output_folder, CATALOG_FILE)
+
+
+def _connect(output_folder: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(catalog_path(output_folder), timeout=_BUSY_TIMEOUT_SEC)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def recording_name(path: str) -> str:
+    """録音ファイルのパスからカタログのキー（拡張子を除いたファイル名）を返す。"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# ---------- 登録 ----------
+
+def add(output_folder: str, path: str, status: str, *, session_id: Optional[str] = None,
+        number: Optional[str] = None, started_at: Optional[float] = None,
+        ended_at: Optional[float] = None, duration_sec: Optional[float] = None,
+        samplerate: Optional[int] = None, channels: Optional[int] = None,
+        size: Optional[int] = None) -> bool:
+    """録音 *path* をカタログに登録（同じ録音があれば置き換え）し、成功すれば True を返す。
+
+    電話番号は sessions.normalize_number() で正規化して保存する（"-" や空白を取り除く）。
+    """
+    row = (recording_name(path), os.path.basename(path), session_id, normalize_number(number),
+           started_at, ended_at, duration_sec, samplerate, channels, size, status)
+    try:
+        with closing(_connect(output_folder)) as conn, conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO recordings ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                row,
+            )
+    except (sqlite3.Error, OSError):
+        logger.warning("録音カタログに登録できませんでした: %s", path, exc_info=True)
+        return False
+    return True
+
+
+def update(output_folder: str, path: str, status: str, size: Optional[int] = None) -> bool:
+    """登録済みの録音のファイル・状態・バイト数を更新する（変換ワーカーで MP3 になった場合など）。
+
+    カタログに無い録音（カタログ導入前の録音など）は何もせずに False を返す。
+    """
+    try:
+        with closing(_connect(output_folder)) as conn, conn:
+            cursor = conn.execute(
+                "UPDATE recordings SET file = ?, status = ?, bytes = COALESCE(?, bytes) WHERE name = ?",
+                (os.path.basename(path), status, size, recording_name(path)),
+            )
+            return cursor.rowcount > 0
+    except (sqlite3.Error, OSError):
+        logger.warning("録音カタログを更新できませんでした: %s", path, exc_info=True)
+        return False
+
+
+# ---------- 検索 ----------
+
+def _prefix_upper(prefix: str) -> str:
+    """前方一致の上限（*prefix* で始まる文字列はすべてこれより小さい）を返す。"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def parse_time(text: str, end: bool = False) -> datetime:
+    """--since / --until の日時（YYYY-MM-DD または YYYY-MM-DD HH:MM[:SS]）を解釈する。
+
+    *end* が True で日付だけが指定された場合は、その日を含むよう翌日 0 時を返す。
+    """
+    text = text.strip()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M"):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    day = datetime.strptime(text, "%Y-%m-%d")
+    return day + timedelta(days=1) if end else day
+
+
+def search(output_folder: str, number: Optional[str] = None, since: Optional[datetime] = None,
+           until: Optional[datetime] = None, limit: Optional[int] = None) -> list[dict]:
+    """電話番号の前方一致・開始日時の範囲（since 以上 until 未満）で録音を新しい順に返す。
+
+    前方一致は範囲条件にしているため、電話番号のインデックスで検索される。
+    *number* は保存時と同じく正規化してから比べる（0312 でも 03-12 でも同じ録音が見つかる）。
+    """
+    conditions: list[str] = []
+    params: list = []
+    number = normalize_number(number)
+    if number:
+        conditions.append("number >= ? AND number < ?")
+        params += [number, _prefix_upper(number)]
+    if since is not None:
+        conditions.append("started_at >= ?")
+        params.append(since.timestamp())
+    if until is not None:
+        conditions.append("started_at < ?")
+        params.append(until.timestamp())
+    sql = "SELECT * FROM recordings"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY started_at DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    if not os.path.isfile(catalog_path(output_folder)):
+        return []
+    with closing(_connect(output_folder)) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    results = []
+    for row in rows:
+        entry = dict(row)
+        entry["path"] = os.path.join(output_folder, entry["file"])
+        results.append(entry)
+    return results
+
+
+def format_results(results: list[dict]) -> str:
+    """search() の結果を表形式の文字列にする（--mode=search の表示用）。"""
+    if not results:
+        return "該当する録音はありません"
+    lines = [f"{'開始日時':<19}  {'電話番号':<14}  {'時間':>8}  {'状態':<12}  ファイル"]
+    for entry in results:
+        started = (datetime.fromtimestamp(entry["started_at"]).strftime("%Y-%m-%d %H:%M:%S")
+                   if entry["started_at"] else "-")
+        duration = entry["duration_sec"]
+        lines.append(
+            f"{started:<19}  {entry['number'] or '-':<14}  "
+            f"{_format_duration(duration) if duration is not None else '-':>8}  "
+            f"{entry['status']:<12}  {entry['path']}"
+        )
+    lines.append(f"{len(results)} 件")
+    return "\n".join(lines)
+
+
+def _format_duration(sec: float) -> str:
+    minutes, seconds = divmod(int(round(sec)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+# ---------- 既存フォルダの一括登録 ----------
+
+def _wav_info(path: str) -> Optional[tuple[int, int, float]]:
+    with wave.open(path, "rb") as w:
+        samplerate = w.getframerate()
+        return samplerate, w.getnchannels(), w.getnframes() / samplerate
+
+
+def _scan(output_folder: str, known: set[str]) -> Iterable[tuple]:
+    """output_folder の録音ファイルのうちカタログに無いものを、登録する行として返す。
+
+    同じ録音の MP3 と WAV がある場合（変換前）は MP3 を優先する。
+    """
+    found: dict[str, os.DirEntry] = {}
+    with os.scandir(output_folder) as entries:
+        for entry in entries:
+            match = _NAME_RE.match(entry.name)
+            if match is None or not entry.is_file():
+                continue
+            name = recording_name(entry.name)
+            if name in known:
+                continue
+            if name not in found or match.group(4) == "mp3":
+                found[name] = entry
+
+    for name, entry in sorted(found.items()):
+        timestamp, number, _suffix, ext = _NAME_RE.match(entry.name).groups()
+        size = entry.stat().st_size
+        started_at = datetime.strptime(timestamp, "%Y%m%d_%H%M%S").timestamp()
+        try:
+            info = read_info(entry.path, size) if ext == "mp3" else _wav_info(entry.path)
+        except (OSError, EOFError, wave.Error):
+            logger.warning("録音ファイルのヘッダーを読めません（日時と番号だけ登録します）: %s", entry.path)
+            info = None
+        samplerate, channels, duration = info if info is not None else (None, None, None)
+        yield (name, entry.name, None, normalize_number(number), started_at,
+               started_at + duration if duration is not None else None,
+               round(duration, 1) if duration is not None else None,
+               samplerate, channels, size, OK if ext == "mp3" else WAV_FALLBACK)
+
+
+def import_folder(output_folder: str) -> int:
+    """output_folder の既存の録音ファイルをカタログに一括登録し、登録した件数を返す（--mode=import-catalog）。
+
+    既にカタログにある録音はそのままにするため、何度実行してもよい。
+    """
+    count = 0
+    with closing(_connect(output_folder)) as conn:
+        known = {row[0] for row in conn.execute("SELECT name FROM recordings")}
+        batch: list[tuple] = []
+        for row in _scan(output_folder, known):
+            batch.append(row)
+            if len(batch) >= _IMPORT_BATCH:
+                count += _insert_batch(conn, batch)
+                logger.info("録音カタログに登録中... (%d 件)", count)
+        count += _insert_batch(conn, batch)
+    logger.info("録音カタログに %d 件を登録しました: %s", count, catalog_path(output_folder))
+    return count
+
+
+def _insert_batch(conn: sqlite3.Connection, batch: list[tuple]) -> int:
+    with conn:
+        conn.executemany(
+            f"INSERT OR IGNORE INTO recordings ({', '.join(_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+            batch,
+        )
+    n = len(batch)
+    batch.clear()
+    return n
@@ -1,11 +1,43 @@
 """config.ini の読み込みユーティリティ。
 
 EXE化された場合でも、実行ファイルと同じディレクトリにある config.ini を自動検出する。
+
+読み込んだ内容は検証済みのスナップショット（Settings）として、config.ini の更新日時と
+サイズをキーにプロセス内でキャッシュする。2 回目以降の get_settings() / load_config() は
+ファイルの stat だけで済み、常駐モードでは config.ini を書き換えると次の呼び出しで
+読み込み直される（実行中の通話は読み込み済みのスナップショットを使い続ける）。
+
+- 値を囲むダブルクォート（"）・シングルクォートは取り除き、警告を記録する
+- パスは _base_dir() を基準に絶対パスへ正規化する
+- 型・範囲の誤りは起動時（最初の読み込み）に ConfigError としてまとめて報告する
+- 再読み込みした設定が不正な場合は、エラーを記録して前回の設定で動作を続ける
 """
 
 import configparser
+import logging
 import os
 import sys
+import threading
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = "config.ini"
+
+_DEFAULT_OUTPUT_FOLDER = "D:\\CallRecordings"
+_DEFAULT_RECORDING_DEVICE = "VoiceMeeter Output"
+# 事前準備フェーズの既定の予算（ミリ秒、[audio] prepare_budget_ms）
+_DEFAULT_PREPARE_BUDGET_MS = 1000.0
+_QUOTES = ('"', "'")
+
+
+class ConfigError(ValueError):
+    """config.ini の内容が不正な場合に送出する（problems に問題の一覧）。"""
+
+    def __init__(self, path: str, problems: list[str]) -> None:
+        super().__init__(f"設定ファイルの内容が不正です: {path}\n  " + "\n  ".join(problems))
+        self.path = path
+        self.problems = problems
 
 
 def _base_dir() -> str:
@@ -16,15 +48,204 @@ def _base_dir() -> str:
     return os.path.dirname(os.path.abspath(__file__))
 
 
-def load_config() -> configparser.ConfigParser:
-    """config.ini を読み込んで ConfigParser を返す。
+def config_path() -> str:
+    return os.path.join(_base_dir(), CONFIG_FILE)
+
+
+def resolve_path(path: str) -> str:
+    """設定値のパスを、相対パスなら _base_dir() を基準にした絶対パスへ正規化する。"""
+    path = os.path.expandvars(os.path.expanduser(path.strip()))
+    if not os.path.isabs(path):
+        path = os.path.join(_base_dir(), path)
+    return os.path.normpath(path)
+
+
+def _strip_quotes(config: configparser.ConfigParser) -> list[str]:
+    """値を囲むクォートを取り除き、取り除いた項目（[セクション] キー）の一覧を返す。"""
+    fixed = []
+    for section in config.sections():
+        for option, value in config.items(section, raw=True):
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in _QUOTES:
+                config.set(section, option, value[1:-1])
+                fixed.append(f"[{section}] {option}")
+    return fixed
+
+
+class _Reader:
+    """ConfigParser から型付きの値を読み、問題を problems に集める。"""
+
+    def __init__(self, config: configparser.ConfigParser) -> None:
+        self.config = config
+        self.problems: list[str] = []
+
+    def text(self, section: str, option: str, fallback: Optional[str] = None) -> str:
+        value = self.config.get(section, option, fallback=None)
+        if value is None or not value.strip():
+            if fallback is None:
+                self.problems.append(f"[{section}] {option} を指定してください")
+                return ""
+            return fallback
+        return value.strip()
+
+    def boolean(self, section: str, option: str, fallback: Optional[bool]) -> Optional[bool]:
+        try:
+            return self.config.getboolean(section, option, fallback=fallback)
+        except ValueError:
+            self.problems.append(f"[{section}] {option} は true / false で指定してください")
+            return fallback
+
+    def number(self, section: str, option: str, fallback, cast=float, minimum=None):
+        raw = self.config.get(section, option, fallback=None)
+        if raw is None or not raw.strip():
+            return fallback
+        try:
+            value = cast(raw.strip())
+        except ValueError:
+            kind = "整数" if cast is int else "数値"
+            self.problems.append(f"[{section}] {option} は{kind}で指定してください: {raw}")
+            return fallback
+        if minimum is not None and value < minimum:
+            self.problems.append(f"[{section}] {option} は {minimum} 以上で指定してください: {raw}")
+            return fallback
+        return value
+
+
+def _output_latency(reader: _Reader) -> object:
+    """[audio] output_latency（low / high / 秒数）を sounddevice の latency に変換する。"""
+    value = reader.text("audio", "output_latency", "low").lower()
+    if value in ("low", "high"):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        reader.problems.append(f"[audio] output_latency は low / high / 秒数で指定してください: {value}")
+        return "low"
+
+
+class Settings:
+    """config.ini を検証・正規化した設定のスナップショット（読み取り専用として扱う）。
 
-    ファイルが存在しない場合は FileNotFoundError を送出する。
+    着信処理・録音で毎回使う値を型付きで持つ。[recording] の圧縮設定や [scheduler] など
+    各モジュールが from_config() で読む項目は、config（クォートを取り除いた ConfigParser）から読む。
     """
-    config_path = os.path.join(_base_dir(), "config.ini")
-    if not os.path.isfile(config_path):
-        raise FileNotFoundError(f"設定ファイルが見つかりません: {config_path}")
 
+    def __init__(self, config: configparser.ConfigParser) -> None:
+        self.config = config
+        reader = _Reader(config)
+
+        # [general]
+        guidance_file = reader.text("general", "guidance_file")
+        self.guidance_file = resolve_path(guidance_file) if guidance_file else ""
+        self.guidance_cache = reader.boolean("general", "guidance_cache", True)
+
+        # [audio]
+        self.virtual_cable_name = reader.text("audio", "virtual_cable_name")
+        self.prepare_budget_ms = reader.number("audio", "prepare_budget_ms", _DEFAULT_PREPARE_BUDGET_MS,
+                                               minimum=0)
+        self.preopen_output = reader.boolean("audio", "preopen_output", True)
+        self.output_blocksize = reader.number("audio", "output_blocksize", 0, cast=int, minimum=0)
+        self.output_latency = _output_latency(reader)
+
+        # [recording]
+        self.output_folder = resolve_path(reader.text("recording", "output_folder", _DEFAULT_OUTPUT_FOLDER))
+        self.recording_device = reader.text("recording", "recording_device", _DEFAULT_RECORDING_DEVICE)
+        self.pre_roll_sec = reader.number("recording", "pre_roll_sec", 3.0, minimum=0)
+        self.max_duration_minutes = reader.number("recording", "max_duration_minutes", 120, cast=int,
+                                                  minimum=1)
+        self.streaming_encode = reader.boolean("recording", "streaming_encode", True)
+        self.journal = reader.boolean("recording", "journal", True)
+        # 省略時（None）は常駐デーモンでは有効、単発の --mode=incoming では無効
+        self.early_capture: Optional[bool] = reader.boolean("recording", "early_capture", None)
+        self.health_report = reader.boolean("recording", "health_report", True)
+
+        self.problems = reader.problems
+
+
+class _Snapshot(NamedTuple):
+    key: tuple[int, int]
+    config: configparser.ConfigParser
+    settings: Optional[Settings]
+    error: Optional[ConfigError]
+
+
+_lock = threading.Lock()
+_current: Optional[_Snapshot] = None
+# 読み込みに失敗した config.ini の (更新日時, サイズ)。同じ内容でエラーを繰り返し記録しない
+_failed_key: Optional[tuple[int, int]] = None
+
+
+def _parse(path: str, key: tuple[int, int]) -> _Snapshot:
     config = configparser.ConfigParser()
-    config.read(config_path, encoding="utf-8")
-    return config
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config.read_file(f, source=path)
+        fixed = _strip_quotes(config)
+        settings = Settings(config)
+    except (configparser.Error, UnicodeDecodeError, ValueError) as exc:
+        raise ConfigError(path, [str(exc).strip()]) from exc
+    for item in fixed:
+        logger.warning("設定値のクォートを取り除きました（値にクォートは不要です）: %s", item)
+    if settings.problems:
+        return _Snapshot(key, config, None, ConfigError(path, settings.problems))
+    return _Snapshot(key, config, settings, None)
+
+
+def _snapshot() -> _Snapshot:
+    """config.ini が前回から変わっていなければキャッシュを、変わっていれば読み込み直した結果を返す。"""
+    global _current, _failed_key
+
+    path = config_path()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        if _current is not None:
+            return _current
+        raise FileNotFoundError(f"設定ファイルが見つかりません: {path}") from None
+    key = (st.st_mtime_ns, st.st_size)
+    current = _current
+    if current is not None and (current.key == key or key == _failed_key):
+        return current
+
+    with _lock:
+        current = _current
+        if current is not None and (current.key == key or key == _failed_key):
+            return current
+        try:
+            snapshot = _parse(path, key)
+        except ConfigError as exc:
+            if current is None:
+                raise
+            snapshot = _Snapshot(key, current.config, None, exc)
+        if snapshot.error is not None and current is not None and current.settings is not None:
+            # 実行中の常駐プロセスは止めず、前回の設定で動作を続ける
+            _failed_key = key
+            logger.error("%s\n前回読み込んだ設定で動作を続けます", snapshot.error)
+            return current
+        if current is not None:
+            logger.info("設定ファイルの変更を読み込みました: %s", path)
+        _current = snapshot
+        _failed_key = None
+        return snapshot
+
+
+def get_settings() -> Settings:
+    """検証済みの設定（Settings）を返す。
+
+    config.ini が無ければ FileNotFoundError、内容が不正なら ConfigError を送出する
+    （読み込み済みの設定がある常駐プロセスでは、不正な変更は無視して前回の設定を返す）。
+    """
+    snapshot = _snapshot()
+    if snapshot.settings is None:
+        raise snapshot.error
+    return snapshot.settings
+
+
+def load_config() -> configparser.ConfigParser:
+    """config.ini を読み込んで ConfigParser を返す（get_settings() と同じキャッシュを使う）。
+
+    ファイルが存在しない場合は FileNotFoundError、書式が壊れている場合は ConfigError を送出する。
+    個別の値の誤りはここでは送出しない（各モジュールの from_config() が既定値に戻す）。
+    返した ConfigParser はプロセス内で共有されるため、書き換えないこと。
+    """
+    return _snapshot().config
@@ -0,0 +1,236 @@
+"""常駐デーモンモード。
+
+BlueBean のフックごとにプロセスを起動すると、インタプリタの起動と
+numpy / sounddevice / soundfile / lameenc / pycaw の import に毎回時間がかかる。
+デーモンモードではこれらを起動時に一度だけ済ませ、ガイダンス音声のデコードと
+仮想ケーブルデバイスの検索も事前に行っておく。
+
+--mode=incoming / record / stop-recording は、デーモンが起動していれば
+ローカル IPC でコマンドを送るだけの薄いクライアントとして動作する
+（デーモンが起動していなければ従来どおり自プロセスで処理する）。
+
+config.ini は 1 秒ごとに更新を確認し、変更されていれば着信処理の合間に
+新しい設定で事前準備をやり直す（再生中の着信は読み込み済みの設定のまま続ける）。
+"""
+
+import logging
+import os
+import threading
+from typing import Any
+
+import incoming
+import ipc
+import recorder
+import transcoder
+from scheduler import IncomingScheduler, SchedulerSettings
+from audio_devices import get_registry
+from config_loader import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 録音停止要求から録音スレッド終了までの最大待機時間（秒）
+_STOP_TIMEOUT_SEC = 30
+
+
+class _Daemon:
+    """デーモンの状態（事前準備済みガイダンスと録音スレッド）を保持する。"""
+
+    def __init__(self) -> None:
+        self._prepare_lock = threading.Lock()
+        self._record_lock = threading.RLock()
+        self._prepared: incoming.PreparedGuidance | None = None
+        # 事前準備に使った設定のスナップショット（config.ini が変われば別のオブジェクトになる）
+        self._settings = get_settings()
+        # 着信処理（事前準備の取得〜再生）中は、設定の変更による事前準備のやり直しを待たせる
+        self._call_lock = threading.Lock()
+        # 実行中の録音スレッド → 停止イベント（同時に複数のセッションを録音できる）
+        self._recordings: dict[threading.Thread, threading.Event] = {}
+        # 着信は 1 件ずつ処理し、重複した着信はまとめる（[scheduler] の設定）
+        self.scheduler = IncomingScheduler(SchedulerSettings.from_config(self._settings.config))
+        self.shutdown = threading.Event()
+
+    # ---------- 事前準備 ----------
+
+    def get_prepared(self) -> incoming.PreparedGuidance | None:
+        """事前準備済みガイダンスを返す（ファイルや設定が更新されていれば準備し直す）。"""
+        settings = get_settings()
+        with self._prepare_lock:
+            if self._prepared is None or self._prepared.is_stale() or settings is not self._settings:
+                self._discard_prepared()
+                self._settings = settings
+                self._prepared = incoming.prepare(settings)
+            if self._prepared is None and not self.is_recording():
+                # デバイスの抜き差しで見つからなくなった可能性があるため一覧を取り直す
+                get_registry().refresh()
+                self._prepared = incoming.prepare(settings)
+            return self._prepared
+
+    def check_config(self) -> None:
+        """config.ini が変更されていれば、着信処理の合間に新しい設定で事前準備をやり直す。"""
+        try:
+            settings = get_settings()
+        except (OSError, ValueError):
+            # 起動時の設定は検証済みのため、ここに来るのは設定ファイルを読めない場合だけ
+            logger.exception("設定ファイルを確認できませんでした")
+            return
+        if settings is self._settings:
+            return
+        self.scheduler.settings = SchedulerSettings.from_config(settings.config)
+        with self._call_lock:
+            if self.get_prepared() is None:
+                logger.warning("新しい設定での事前準備に失敗しました（着信時に再試行します）")
+
+    def _discard_prepared(self) -> None:
+        """事前準備済みガイダンスの再生ストリームを閉じて破棄する（_prepare_lock 内で呼ぶ）。"""
+        if self._prepared is not None:
+            self._prepared.close()
+            self._prepared = None
+
+    def close(self) -> None:
+        self.scheduler.close()
+        with self._prepare_lock:
+            self._discard_prepared()
+
+    # ---------- コマンド処理 ----------
+
+    def handle(self, message: dict[str, Any]) -> dict[str, Any]:
+        command = message.get("command")
+        number = message.get("number")
+        logger.info("コマンドを受信しました: %s (number=%s)", command, number)
+
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if command == "incoming":
+            return {"ok": True, **self.scheduler.submit(number, self._incoming)}
+        if command == "record":
+            return {"ok": True, "started": self.start_recording(number)}
+        if command == "stop-recording":
+            results = self.stop_recording(message.get("session"), number)
+            return {"ok": True, "stopped": [r for r in results if r.get("ok")], "results": results}
+        if command == "refresh-devices":
+            return {"ok": self.refresh_devices()}
+        if command == "shutdown":
+            self.shutdown.set()
+            return {"ok": True}
+        return {"ok": False, "error": f"不明なコマンドです: {command}"}
+
+    def _incoming(self, number: str | None) -> None:
+        try:
+            with self._call_lock:
+                prepared = self.get_prepared()
+                if prepared is None:
+                    return
+                # early_capture を省略した場合、デーモンではミュート前から録音を始める
+                early = self._settings.early_capture is not False
+                incoming.run(number=number, prepared=prepared, start_recording=self.start_recording,
+                             start_capture=self.start_capture if early else None)
+        except Exception:
+            logger.exception("着信処理中に予期しないエラーが発生しました")
+
+    def refresh_devices(self) -> bool:
+        """デバイス一覧を取り直し、事前準備をやり直す（着信処理・録音の最中は行わない）。
+
+        ガイダンスの再生中に再生ストリームを閉じないよう、着信処理が終わるまで待ってから行う。
+        """
+        with self._call_lock:
+            if self.is_recording():
+                logger.warning("録音中のためデバイス一覧の再取得を見送ります")
+                return False
+            with self._prepare_lock:
+                # デバイスの再初期化で開いているストリームは無効になるため先に閉じる
+                self._discard_prepared()
+                get_registry().refresh()
+            return self.get_prepared() is not None
+
+    # ---------- 録音制御 ----------
+
+    def _alive_recordings(self) -> dict[threading.Thread, threading.Event]:
+        """実行中の録音スレッドと停止イベント（_record_lock 内で呼ぶ）。終了したものは取り除く。"""
+        self._recordings = {t: e for t, e in self._recordings.items() if t.is_alive()}
+        return self._recordings
+
+    def is_recording(self) -> bool:
+        with self._record_lock:
+            return bool(self._alive_recordings())
+
+    def start_recording(self, number: str | None = None) -> bool:
+        """録音スレッドを開始する（録音中でも別のセッションとして並行して録音する）。"""
+        stop_event = threading.Event()
+        thread = threading.Thread(
+            target=self._record, args=(number, stop_event), name="recorder", daemon=True
+        )
+        with self._record_lock:
+            self._recordings[thread] = stop_event
+            thread.start()
+            logger.info("録音スレッドを開始しました (同時録音 %d 件)", len(self._alive_recordings()))
+        return True
+
+    def start_capture(self, number: str | None = None) -> recorder.CaptureThread:
+        """プリロールから始まる録音スレッドを開始する。"""
+        thread = recorder.CaptureThread(number)
+        with self._record_lock:
+            self._recordings[thread] = thread.stop_event
+            thread.start()
+            logger.info("録音スレッドを開始しました（プリロール, 同時録音 %d 件）",
+                        len(self._alive_recordings()))
+        return thread
+
+    @staticmethod
+    def _record(number: str | None, stop_event: threading.Event) -> None:
+        try:
+            recorder.run(number=number, stop_event=stop_event)
+        except Exception:
+            logger.exception("録音中に予期しないエラーが発生しました")
+
+    @staticmethod
+    def stop_recording(session: str | None = None, number: str | None = None) -> list[dict]:
+        """録音セッションを停止し、保存結果の一覧を返す。
+
+        デーモン内の録音も別プロセスの録音も、セッションのコントロールチャンネルで停止する。
+        """
+        return recorder.stop(session=session, number=number)
+
+    def stop_all(self) -> None:
+        """デーモン内のすべての録音スレッドを停止し、終了を待機する（デーモン終了時）。"""
+        with self._record_lock:
+            recordings = dict(self._alive_recordings())
+        for stop_event in recordings.values():
+            stop_event.set()
+        for thread in recordings:
+            thread.join(_STOP_TIMEOUT_SEC)
+            if thread.is_alive():
+                logger.warning("録音スレッドが %d 秒以内に終了しませんでした", _STOP_TIMEOUT_SEC)
+
+
+def _recover() -> None:
+    try:
+        recorder.recover()
+    except Exception:
+        logger.exception("録音ジャーナルの復旧に失敗しました")
+    # 以前の変換失敗で残った WAV があれば変換ワーカーでまとめて変換する
+    transcoder.launch_worker()
+
+
+def run() -> None:
+    """デーモンを起動し、shutdown コマンドまたは Ctrl+C まで待機する。"""
+    daemon = _Daemon()
+    if daemon.get_prepared() is None:
+        logger.warning("ガイダンスの事前準備に失敗しました（着信時に再試行します）")
+
+    # 前回異常終了した録音のジャーナルと未変換の WAV を裏で処理する
+    threading.Thread(target=_recover, name="recover", daemon=True).start()
+
+    server = ipc.Server(ipc.DAEMON_CHANNEL, daemon.handle)
+    server.start()
+    logger.info("デーモンを起動しました: %s (PID=%d)", ipc.address(ipc.DAEMON_CHANNEL), os.getpid())
+
+    try:
+        while not daemon.shutdown.wait(1.0):
+            daemon.check_config()
+    except KeyboardInterrupt:
+        logger.info("中断されました")
+    finally:
+        daemon.stop_all()
+        daemon.close()
+        server.close()
+        logger.info("デーモンを終了します")
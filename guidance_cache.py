@@ -0,0 +1,189 @@
+"""ガイダンス音声のデコード済み PCM キャッシュ。
+
+着信のたびに MP3 をデコードする代わりに、guidance_file の隣へ
+float32 の生 PCM と小さなヘッダーを保存し、2 回目以降は np.memmap で読み込む。
+
+- キャッシュのキー: ソースのパス・mtime・サイズ・目標サンプルレート
+- キーが変わる（MP3 が差し替えられる）と別名のキャッシュを自動で作り直し、
+  差し替え前の MP3 のキャッシュを削除する（目標サンプルレート違いのキャッシュは残す）
+- 一時ファイルに書いてから os.replace するため、同時に起動した
+  2 つの着信処理が壊れたキャッシュを読むことはない
+
+ファイル形式:
+    マジック (8 bytes) + ヘッダー長 (uint32 LE) + JSON ヘッダー + パディング + float32 PCM
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"CHPCM\x00\x01\x00"
+_SUFFIX = ".pcmcache"
+# PCM データの開始位置をこの境界に揃える
+_ALIGN = 64
+
+
+def _cache_key(path: str, target_rate: Optional[int]) -> dict:
+    st = os.stat(path)
+    return {
+        "source": os.path.abspath(path),
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+        "target_rate": target_rate,
+    }
+
+
+def _cache_path(path: str, key: dict) -> str:
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return f"{path}.{digest}{_SUFFIX}"
+
+
+def resample(data: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """線形補間で *data* を *dst_rate* にリサンプリングする（オフライン処理用）。"""
+    if src_rate == dst_rate or len(data) == 0:
+        return data
+    n_out = int(round(len(data) * dst_rate / src_rate))
+    src_t = np.arange(len(data), dtype=np.float64)
+    dst_t = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+    if data.ndim == 1:
+        return np.interp(dst_t, src_t, data).astype(np.float32)
+    out = np.empty((n_out, data.shape[1]), dtype=np.float32)
+    for ch in range(data.shape[1]):
+        out[:, ch] = np.interp(dst_t, src_t, data[:, ch])
+    return out
+
+
+def _data_offset(header_len: int) -> int:
+    """PCM データの開始位置（_ALIGN 境界に切り上げ）を返す。"""
+    prefix_len = len(_MAGIC) + 4 + header_len
+    return -(-prefix_len // _ALIGN) * _ALIGN
+
+
+def _read_header(cache_path: str) -> Optional[tuple[dict, int]]:
+    """キャッシュの JSON ヘッダーとその長さを返す。存在しない・破損の場合は None を返す。"""
+    try:
+        with open(cache_path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                return None
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+    except (OSError, ValueError, struct.error):
+        return None
+    if not isinstance(header, dict):
+        return None
+    return header, header_len
+
+
+def _read_cache(cache_path: str, key: dict) -> Optional[tuple[np.ndarray, int]]:
+    """キャッシュを memmap で開く。存在しない・キー不一致・破損の場合は None を返す。"""
+    read = _read_header(cache_path)
+    if read is None:
+        return None
+    header, header_len = read
+    if header.get("key") != key:
+        return None
+    try:
+        file_size = os.path.getsize(cache_path)
+    except OSError:
+        return None
+    shape = tuple(header["shape"])
+    offset = _data_offset(header_len)
+    expected = offset + int(np.prod(shape)) * 4
+    if file_size != expected:
+        logger.warning("ガイダンスキャッシュのサイズが不正です: %s", cache_path)
+        return None
+
+    data = np.memmap(cache_path, dtype=np.float32, mode="r", offset=offset, shape=shape)
+    return data, header["samplerate"]
+
+
+def _write_cache(cache_path: str, key: dict, data: np.ndarray, samplerate: int) -> None:
+    """キャッシュを一時ファイルに書き出し、アトミックに配置する。"""
+    header = {"key": key, "samplerate": samplerate, "shape": list(data.shape)}
+    header_bytes = json.dumps(header).encode("utf-8")
+    padding = _data_offset(len(header_bytes)) - (len(_MAGIC) + 4 + len(header_bytes))
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(cache_path) or ".", prefix=".guidance-", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<I", len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b"\x00" * padding)
+            f.write(np.ascontiguousarray(data, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _remove_old_caches(path: str, key: dict) -> None:
+    """差し替え前の MP3 から作られた古いキャッシュを削除する（使用中なら残す）。
+
+    ソースの mtime・サイズが *key* と同じキャッシュは、目標サンプルレートが違っても残す
+    （出力デバイスごとにサンプルレートが異なる場合に、互いのキャッシュを消し合わないように）。
+    """
+    for old in glob.glob(glob.escape(path) + ".*" + _SUFFIX):
+        read = _read_header(old)
+        if read is not None:
+            old_key = read[0].get("key") or {}
+            if all(old_key.get(k) == key[k] for k in ("source", "mtime_ns", "size")):
+                continue
+        try:
+            os.remove(old)
+            logger.info("古いガイダンスキャッシュを削除しました: %s", old)
+        except OSError:
+            pass
+
+
+def load_guidance(path: str, target_rate: Optional[int] = None) -> tuple[np.ndarray, int, bool]:
+    """ガイダンス音声を float32 で読み込む。
+
+    キャッシュがあれば memmap で開き、無ければデコードしてキャッシュを作成する。
+    *target_rate* を指定した場合はそのサンプルレートにリサンプリングした結果を返す。
+
+    Returns
+    -------
+    (data, samplerate, cache_hit)
+    """
+    key = _cache_key(path, target_rate)
+    cache_path = _cache_path(path, key)
+
+    cached = _read_cache(cache_path, key)
+    if cached is not None:
+        data, samplerate = cached
+        return data, samplerate, True
+
+    import soundfile as sf
+
+    data, samplerate = sf.read(path, dtype="float32")
+    if target_rate is not None and target_rate != samplerate:
+        data = resample(data, samplerate, target_rate)
+        samplerate = target_rate
+
+    try:
+        _write_cache(cache_path, key, data, samplerate)
+        logger.info("ガイダンスキャッシュを作成しました: %s", cache_path)
+    except OSError:
+        # 書き込み権限が無い・同時に別プロセスが置き換え中などの場合はキャッシュせずに続行
+        logger.warning("ガイダンスキャッシュを作成できませんでした: %s", cache_path, exc_info=True)
+        return data, samplerate, False
+
+    _remove_old_caches(path, key)
+    return data, samplerate, False
@@ -0,0 +1,200 @@
+"""録音ストリームの健全性（音切れ・クリップ）の監視。
+
+PortAudio のコールバックが間に合わなかった場合（xrun）、ドライバーが捨てた分のサンプルは
+コールバックに渡されず、そのまま繋ぐと録音が短くなり、以降の時刻がずれる。
+コールバックの time_info.inputBufferAdcTime と受け取ったフレーム数から欠けたサンプル数を求め、
+その分の無音を補って録音の時間軸を実時間に合わせる。
+
+- 欠落の検出（GapDetector）はストリームごとにコールバックから呼ぶ
+- 1 秒ごとのレベル・クリップ数（CaptureHealth.process）はライタースレッドで、秒の区切りごとの
+  スライスの max / min と内積だけで求める（クリップ数はピークがフルスケールに達した秒だけ数える）
+- 通話ごとの集計（xrun 回数・欠落の合計・クリップ率）を <録音名>.health.json に保存する
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEALTH_SUFFIX = ".health.json"
+# これ未満のタイムスタンプのずれは揺らぎとみなし、欠落として扱わない（秒）
+_GAP_TOLERANCE_SEC = 0.005
+# 1 回の欠落で補う無音の上限（秒）。これを超える分はタイムスタンプの飛びとみなす
+_MAX_GAP_SEC = 5.0
+# int16 でクリップとみなす値
+_CLIP_HIGH = 32767
+_CLIP_LOW = -32768
+# 無音（0）の dBFS として記録する値
+_FLOOR_DB = -120.0
+
+
+class GapDetector:
+    """inputBufferAdcTime と受け取ったフレーム数から、コールバック間で欠けたフレーム数を求める。
+
+    前回のブロックの先頭時刻 + 長さと今回の先頭時刻を比べるため、デバイスとホストの
+    クロックのずれは蓄積しない。タイムスタンプを返さないホスト API（常に 0）では何もしない。
+    """
+
+    def __init__(self, sample_rate: int, tolerance_sec: float = _GAP_TOLERANCE_SEC,
+                 max_gap_sec: float = _MAX_GAP_SEC) -> None:
+        self.sample_rate = sample_rate
+        self._tolerance = tolerance_sec
+        self._max_gap = int(max_gap_sec * sample_rate)
+        self._expected: Optional[float] = None
+
+    def check(self, adc_time: float, frames: int) -> int:
+        """今回のブロックの前に欠けていたフレーム数を返す（コールバックから呼ぶ）。"""
+        if not adc_time:
+            return 0
+        expected, self._expected = self._expected, adc_time + frames / self.sample_rate
+        if expected is None or adc_time - expected < self._tolerance:
+            return 0
+        return min(round((adc_time - expected) * self.sample_rate), self._max_gap)
+
+
+class CaptureHealth:
+    """1 件の録音の欠落・xrun と、1 秒ごとのレベル・クリップ数を集計する。
+
+    note() は録音コールバックから、process() はライタースレッドから呼ぶ。
+    欠落の位置はリングバッファへの累積書き込み位置で記録し、summary() で
+    保存を始めた位置（origin）からの時刻に直す。
+    """
+
+    def __init__(self, sample_rate: int, channels: int) -> None:
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.xruns = 0
+        self.overflows = 0
+        # (リングバッファ上の位置, 補ったフレーム数)
+        self.gaps: list[tuple[int, int]] = []
+        self.frames = 0
+        self._lock = threading.Lock()
+        # 確定した 1 秒ごとのピーク（絶対値の最大）・二乗和・クリップしたサンプル数
+        self._peak: list[int] = []
+        self._sumsq: list[float] = []
+        self._clipped: list[int] = []
+        # 集計中の秒
+        self._cur_peak = 0
+        self._cur_sumsq = 0.0
+        self._cur_clipped = 0
+
+    def note(self, position: int, missing: int, overflow: bool) -> None:
+        """コールバック 1 回分の欠落（*missing* フレーム）と input overflow を記録する。"""
+        if overflow:
+            self.overflows += 1
+        if missing or overflow:
+            self.xruns += 1
+        if missing:
+            with self._lock:
+                self.gaps.append((position, missing))
+
+    def process(self, block: np.ndarray) -> None:
+        """int16 の PCM ブロックを秒の区切りで分け、秒ごとのピーク・二乗和・クリップ数に加える。"""
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        sr = self.sample_rate
+        pos, n = 0, len(block)
+        while pos < n:
+            offset = self.frames % sr
+            take = min(n - pos, sr - offset)
+            part = block[pos:pos + take]
+            high, low = int(part.max()), int(part.min())
+            self._cur_peak = max(self._cur_peak, high, -low)
+            flat = part.astype(np.float32).ravel()
+            self._cur_sumsq += float(np.dot(flat, flat))
+            if high >= _CLIP_HIGH or low <= _CLIP_LOW:
+                self._cur_clipped += int(np.count_nonzero(part >= _CLIP_HIGH)
+                                         + np.count_nonzero(part <= _CLIP_LOW))
+            pos += take
+            self.frames += take
+            if offset + take == sr:
+                self._close_second()
+
+    def _close_second(self) -> None:
+        self._peak.append(self._cur_peak)
+        self._sumsq.append(self._cur_sumsq)
+        self._clipped.append(self._cur_clipped)
+        self._cur_peak, self._cur_sumsq, self._cur_clipped = 0, 0.0, 0
+
+    def summary(self, origin: int = 0, dropped_frames: int = 0) -> dict:
+        """集計結果をサイドカーの内容として返す。
+
+        *origin* は保存を始めたときのリングバッファ上の位置（プリロールで捨てた欠落は含めない）、
+        *dropped_frames* はライターが追いつかずに破棄したフレーム数。
+        """
+        sr = self.sample_rate
+        with self._lock:
+            gaps = list(self.gaps)
+        events = []
+        for position, missing in gaps:
+            start = max(position, origin)
+            if position + missing <= origin:
+                continue
+            events.append({"at_sec": round((start - origin) / sr, 3),
+                           "ms": round((position + missing - start) * 1000 / sr, 1)})
+        gap_ms = sum(e["ms"] for e in events)
+
+        peak = np.array(self._peak, dtype=np.int32)
+        sumsq = np.array(self._sumsq, dtype=np.float64)
+        clipped = np.array(self._clipped, dtype=np.int64)
+        if self.frames % sr:
+            # 途中までの最後の秒
+            peak = np.append(peak, self._cur_peak)
+            sumsq = np.append(sumsq, self._cur_sumsq)
+            clipped = np.append(clipped, self._cur_clipped)
+        counts = np.full(len(sumsq), sr * self.channels, dtype=np.float64)
+        if len(counts) and self.frames % sr:
+            counts[-1] = (self.frames % sr) * self.channels
+        samples = self.frames * self.channels
+        total_clipped = int(clipped.sum())
+        return {
+            "version": 1,
+            "sample_rate": sr,
+            "channels": self.channels,
+            "duration_sec": round(self.frames / sr, 3),
+            "xruns": self.xruns,
+            "input_overflows": self.overflows,
+            "gap_count": len(events),
+            "gap_ms_total": round(gap_ms, 1),
+            "gaps": events,
+            "dropped_frames": dropped_frames,
+            "clipped_samples": total_clipped,
+            "clipped_pct": round(total_clipped * 100 / samples, 4) if samples else 0.0,
+            "peak_dbfs": _dbfs(np.array([peak.max()]))[0] if len(peak) else _FLOOR_DB,
+            "rms_dbfs": _dbfs(np.sqrt([sumsq.sum() / samples]))[0] if samples else _FLOOR_DB,
+            "per_second": {
+                "peak_dbfs": _dbfs(peak),
+                "rms_dbfs": _dbfs(np.sqrt(sumsq / counts)) if len(counts) else [],
+                "clipped": clipped.tolist(),
+            },
+        }
+
+
+def _dbfs(values: np.ndarray) -> list[float]:
+    """int16 のフルスケールを 0 dB とした dBFS のリスト（小数 1 桁）に変換する。"""
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore"):
+        db = 20 * np.log10(values / _CLIP_HIGH)
+    return np.round(np.maximum(db, _FLOOR_DB), 1).tolist()
+
+
+def health_path(mp3_path: str) -> str:
+    return os.path.splitext(mp3_path)[0] + HEALTH_SUFFIX
+
+
+def write_health(mp3_path: str, content: dict) -> str:
+    """健全性の集計を MP3 の隣に書き出し、そのパスを返す。"""
+    path = health_path(mp3_path)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    if content.get("xruns") or content.get("dropped_frames"):
+        logger.warning("録音に音切れがありました (xrun %d 回, 無音で補完 %.1fms, 破棄 %d フレーム): %s",
+                       content["xruns"], content["gap_ms_total"], content["dropped_frames"], path)
+    return path
+
@@ -5,36 +5,46 @@
 ミュート→再生の間のラグを最小化する。
 
 処理順序:
-1. 音声ファイルを事前にメモリへ読み込み（重いI/O）
-2. VB-CABLE デバイスを事前検索（デバイス列挙）
-3. 物理マイクをミュート + スピーカーをミュート
-4. 即座に音声ガイダンスを再生開始
-5. 録音サブプロセスを起動（再生と並行）
+1. VB-CABLE デバイスの検索（デバイス列挙）、音声ファイルの読み込み
+   （デバイスのサンプルレートにリサンプリング済み、2 回目以降はデコード済みキャッシュを memmap）、
+   マイク・スピーカーの COM インターフェースの取得を並行して実行する
+   （予算 prepare_budget_ms を超えたステップは前回の結果で代替する）
+2. 再生ストリームを開いておく
+3. 物理マイクをミュート + スピーカーをミュート（COM インターフェースは事前取得済み）
+4. 即座に音声ガイダンスを再生開始（開いておいたストリームを start するだけ）
+5. 録音を開始（再生と並行）。ミュート前に開始しておいた録音スレッドのプリロールから
+   そのまま録音に切り替えるため、ガイダンスの冒頭から録音される
+   （単発の --mode=incoming では early_capture = true の場合だけ。それ以外は従来どおり
+   録音サブプロセスを起動する）
 6. 再生完了を待機
-7. マイク・スピーカーのミュート解除（通常通話に復帰）
+7. マイク・スピーカーをミュート前の状態に戻す（通常通話に復帰）
+
+常駐デーモンでは 1〜2 を prepare() で事前に済ませておき、
+run() に PreparedGuidance を渡して 3 以降のみを実行する。
 """
 
+import contextvars
 import logging
 import os
 import subprocess
 import sys
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Callable
 
-import sounddevice as sd
-import soundfile as sf
+import guidance_cache
+import metrics
+import scheduler
+from audio_backend import OutputPlayer, get_backend
+from audio_devices import find_virtual_cable_device, get_controller, get_registry
+from config_loader import Settings, get_settings
+from scheduler import SchedulerSettings
 
-from audio_devices import (
-    find_virtual_cable_device,
-    mute_physical_mic,
-    unmute_physical_mic,
-    mute_default_speaker,
-    unmute_default_speaker,
-)
-from config_loader import load_config, _base_dir
+if TYPE_CHECKING:
+    from recorder import CaptureThread
 
 logger = logging.getLogger(__name__)
 
-
 def _launch_recording_subprocess(number: str | None = None) -> None:
     """録音サブプロセスをバックグラウンドで起動する。"""
     try:
@@ -56,48 +66,310 @@ def _launch_recording_subprocess(number: str | None = None) -> None:
         logger.exception("録音サブプロセスの起動に失敗しました（ガイダンス再生は続行します）")
 
 
-def run(number: str | None = None) -> None:
+class PreparedGuidance:
+    """事前準備フェーズの結果（デコード済みガイダンス音声・出力デバイス・再生ストリーム）。"""
+
+    def __init__(self, path: str, data, samplerate: int, device_index: int,
+                 output: OutputPlayer | None = None) -> None:
+        self.path = path
+        self.data = data
+        self.samplerate = samplerate
+        self.device_index = device_index
+        self.output = output
+        # 再生ストリームが使えなくなった（デバイスの再初期化などで）場合に True
+        self.broken = False
+        self.mtime = os.path.getmtime(path)
+
+    def close(self) -> None:
+        """開いておいた再生ストリームを閉じる。"""
+        if self.output is not None:
+            try:
+                self.output.close()
+            except Exception:
+                logger.warning("再生ストリームを閉じられませんでした", exc_info=True)
+            self.output = None
+
+    def is_stale(self) -> bool:
+        """ガイダンスファイルが読み込み後に更新・削除された（または再生ストリームが壊れた）場合に True を返す。"""
+        if self.broken:
+            return True
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return True
+
+
+def _lookup_device(cable_name: str) -> tuple[int, int] | None:
+    """仮想ケーブルデバイスを検索し、(インデックス, サンプルレート) を返す。"""
+    device_index = find_virtual_cable_device(cable_name)
+    if device_index is None:
+        return None
+    return device_index, int(get_registry().device(device_index)["default_samplerate"])
+
+
+def _load_guidance(path: str, target_rate: int | None, use_cache: bool):
+    """ガイダンス音声を *target_rate* に変換して読み込み、(data, samplerate, cache_hit) を返す。"""
+    if use_cache:
+        return guidance_cache.load_guidance(path, target_rate=target_rate)
+    import soundfile as sf
+
+    data, samplerate = sf.read(path, dtype="float32")
+    if target_rate is not None:
+        data = guidance_cache.resample(data, samplerate, target_rate)
+        samplerate = target_rate
+    return data, samplerate, False
+
+
+def _submit_step(executor: ThreadPoolExecutor, timings: dict[str, float], name: str,
+                 fn: Callable, *args) -> Future:
+    """事前準備のステップを並行実行する（区間 *name* を記録し、所要時間を *timings* に入れる）。"""
+    context = contextvars.copy_context()
+
+    def step():
+        t0 = time.perf_counter()
+        try:
+            with metrics.span(name):
+                return fn(*args)
+        finally:
+            timings[name] = (time.perf_counter() - t0) * 1000
+
+    return executor.submit(context.run, step)
+
+
+def prepare(settings: Settings) -> PreparedGuidance | None:
+    """事前準備フェーズ: 仮想ケーブルデバイスの検索、ガイダンス音声の読み込み、再生ストリームの準備を行う。
+
+    互いに依存しないデバイス検索・音声の読み込み・COM インターフェースの取得は並行して実行する。
+    音声はデバイス検索の結果を待たず、前回解決したデバイスのサンプルレートで読み込む
+    （実際のサンプルレートが異なれば読み込み直す）。
+    [audio] prepare_budget_ms を超えた場合は、デバイスは前回の解決結果を使い、
+    COM インターフェースの取得は待たずに（ミュート時に取得される）準備を終える。
+    準備できなかった場合はログを出力して None を返す。
+    """
+    guidance_file = settings.guidance_file
+    if not os.path.isfile(guidance_file):
+        logger.warning("音声ファイルが見つかりません: %s", guidance_file)
+        return None
+
+    cable_name = settings.virtual_cable_name
+    use_cache = settings.guidance_cache
+    budget_ms = settings.prepare_budget_ms
+
+    # 前回の解決結果（デバイスに問い合わせずに読める）から出力デバイスのサンプルレートを予測する
+    cached = get_registry().cached_output(cable_name)
+    cached_rate = int(cached["samplerate"]) if cached and cached.get("samplerate") else None
+
+    t0 = time.perf_counter()
+    deadline = t0 + budget_ms / 1000
+    timings: dict[str, float] = {}
+    overrun: list[str] = []
+    executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="prepare")
+    try:
+        device_future = _submit_step(executor, timings, "device_lookup", _lookup_device, cable_name)
+
+        def guidance_rate() -> int | None:
+            if cached_rate is not None:
+                return cached_rate
+            # 前回の解決結果が無い（初回）場合だけデバイス検索の完了を待つ
+            device = device_future.result()
+            return device[1] if device is not None else None
+
+        guidance_future = _submit_step(executor, timings, "guidance_load",
+                                       lambda: _load_guidance(guidance_file, guidance_rate(), use_cache))
+        endpoint_future = _submit_step(executor, timings, "endpoint_prepare",
+                                       lambda: get_controller().prepare())
+        wait((device_future, guidance_future, endpoint_future), timeout=max(0.0, deadline - time.perf_counter()))
+
+        # --- 仮想ケーブルデバイス ---
+        if device_future.done() or cached is None:
+            if not device_future.done():
+                logger.warning("デバイス検索が予算 (%.0fms) を超えました（前回の結果が無いため完了を待ちます）",
+                               budget_ms)
+            device = device_future.result()
+            if device is None:
+                logger.error("仮想ケーブルデバイス '%s' が見つかりません", cable_name)
+                return None
+            device_index, device_rate = device
+        else:
+            overrun.append("device_lookup")
+            device_index, device_rate = int(cached["index"]), cached_rate
+            logger.warning("デバイス検索が予算 (%.0fms) を超えたため前回の結果を使います: [%d] %s",
+                           budget_ms, device_index, cached.get("name"))
+
+        # --- ガイダンス音声（デバイスのサンプルレートに変換済み） ---
+        if not guidance_future.done():
+            # 再生する音声が無いとミュートできないため、予算を超えても完了を待つ
+            logger.warning("音声ファイルの読み込みが予算 (%.0fms) を超えました（完了を待ちます）", budget_ms)
+        data, samplerate, cache_hit = guidance_future.result()
+        if device_rate is not None and samplerate != device_rate:
+            logger.info("デバイスのサンプルレートが前回と異なるため読み込み直します (%dHz → %dHz)",
+                        samplerate, device_rate)
+            t_reload = time.perf_counter()
+            with metrics.span("guidance_load"):
+                data, samplerate, cache_hit = _load_guidance(guidance_file, device_rate, use_cache)
+            timings["guidance_load"] += (time.perf_counter() - t_reload) * 1000
+
+        # --- マイク・スピーカーの COM インターフェース（待たなくてもミュート時に取得される） ---
+        if not endpoint_future.done():
+            overrun.append("endpoint_prepare")
+            logger.warning("COM インターフェースの取得が予算 (%.0fms) を超えました（完了を待たずに続行します）",
+                           budget_ms)
+    finally:
+        executor.shutdown(wait=False)
+
+    metrics.count("guidance_cache_hit" if cache_hit else "guidance_cache_miss")
+    logger.info(
+        "音声ファイルを事前読み込み完了: %s (%.1f秒, %dHz, キャッシュ=%s)",
+        guidance_file, len(data) / samplerate, samplerate,
+        "hit" if cache_hit else ("miss" if use_cache else "off"),
+    )
+
+    # --- 再生ストリームを開いておく（ミュート後は start するだけにする） ---
+    output = None
+    if settings.preopen_output:
+        if time.perf_counter() >= deadline:
+            overrun.append("output_open")
+            logger.warning("事前準備が予算 (%.0fms) を超えたため、再生ストリームは再生時に開きます", budget_ms)
+        else:
+            try:
+                t_open = time.perf_counter()
+                with metrics.span("output_open"):
+                    output = get_backend().open_output(
+                        data, samplerate, device_index,
+                        blocksize=settings.output_blocksize,
+                        latency=settings.output_latency,
+                    )
+                timings["output_open"] = (time.perf_counter() - t_open) * 1000
+            except Exception:
+                logger.exception("再生ストリームを開けませんでした（再生時に開きます）")
+
+    if overrun:
+        metrics.count("prepare_overrun")
+    logger.info(
+        "事前準備の各ステップ: %s (合計 %.0fms)",
+        ", ".join(
+            f"{name}={timings[name]:.0f}ms" if name in timings else f"{name}=未完了"
+            for name in ("device_lookup", "guidance_load", "endpoint_prepare", "output_open")
+            if name in timings or name in overrun
+        ),
+        (time.perf_counter() - t0) * 1000,
+    )
+
+    return PreparedGuidance(guidance_file, data, samplerate, device_index, output)
+
+
+def _start_capture_thread(number: str | None) -> "CaptureThread":
+    """自プロセスの録音スレッドを開始する（プリロールから始まる）。"""
+    from recorder import CaptureThread
+
+    thread = CaptureThread(number)
+    thread.start()
+    return thread
+
+
+def run(
+    number: str | None = None,
+    prepared: PreparedGuidance | None = None,
+    start_recording: Callable[[str | None], None] | None = None,
+    start_capture: Callable[[str | None], "CaptureThread | None"] | None = None,
+) -> None:
     """着信時ガイダンス処理を実行する。
 
     Parameters
     ----------
     number : str | None
         着信番号（ログ記録用）。
+    prepared : PreparedGuidance | None
+        事前準備済みのガイダンス（常駐デーモンから渡される）。
+        None の場合はここで事前準備フェーズを実行する。
+    start_recording : Callable | None
+        再生開始後に録音を開始する関数。None の場合は録音サブプロセスを起動する。
+    start_capture : Callable | None
+        ミュート前にプリロールを始めた録音スレッド（recorder.CaptureThread）を返す関数。
+        指定した場合は再生開始後に commit() して録音に切り替え、start_recording は使わない
+        （None を返した場合は start_recording で録音を開始する）。
+        自プロセスで事前準備する場合、config.ini の early_capture が true のときだけ
+        自プロセスの録音スレッドを使い、録音が停止されるまで待ってから戻る
+        （省略時は従来どおりガイダンス後に戻り、録音はサブプロセスが行う）。
     """
+    with metrics.call("incoming", number=number) as call:
+        capture = _run(call, number, prepared, start_recording, start_capture)
+
+    # 着信処理の記録（wall_ms）に通話時間を含めないよう、記録を書き込んでから待つ
+    if capture is not None and capture.is_alive():
+        # このプロセスが録音プロセスを兼ねる（停止要求まで録音を続ける）
+        logger.info("録音の停止を待機します")
+        capture.join()
+
+
+def _run(
+    call: metrics.CallMetrics,
+    number: str | None,
+    prepared: PreparedGuidance | None,
+    start_recording: Callable[[str | None], None] | None,
+    start_capture: Callable[[str | None], "CaptureThread | None"] | None,
+) -> "CaptureThread | None":
+    """着信処理の本体。自プロセスの録音スレッドを使った場合はそれを返す（run() が終了を待つ）。"""
     if number:
         logger.info("着信番号: %s", number)
 
     t_start = time.perf_counter()
-    config = load_config()
 
     # ============================================================
     # 事前準備フェーズ（時間のかかるI/O処理をミュート前に実行）
     # ============================================================
+    call.set("prepared", prepared is not None)
+    if prepared is not None:
+        _play(call, number, prepared, start_recording, start_capture, t_start)
+        return None
 
-    # --- 音声ファイルの事前読み込み ---
-    guidance_file = config.get("general", "guidance_file")
-    if not os.path.isabs(guidance_file):
-        guidance_file = os.path.join(_base_dir(), guidance_file)
+    # 他のプロセスの着信処理とミュート・再生が重ならないよう排他する
+    settings = get_settings()
+    capture = None
+    with scheduler.exclusive(number, SchedulerSettings.from_config(settings.config)) as action:
+        if action != scheduler.RUN:
+            call.status = action
+            return None
+        with call.span("prepare"):
+            prepared = prepare(settings)
+        if prepared is None:
+            call.status = "not-prepared"
+            return None
+        if start_recording is None and start_capture is None and settings.early_capture:
+            start_capture = _start_capture_thread
+        try:
+            capture = _play(call, number, prepared, start_recording, start_capture, t_start)
+        finally:
+            prepared.close()
+    return capture
 
-    if not os.path.isfile(guidance_file):
-        logger.warning("音声ファイルが見つかりません: %s", guidance_file)
-        return
 
-    t0 = time.perf_counter()
-    data, samplerate = sf.read(guidance_file, dtype="float32")
-    t1 = time.perf_counter()
-    duration_sec = len(data) / samplerate
-    logger.info(
-        "音声ファイルを事前読み込み完了: %s (%.1f秒, %dHz, 読み込み %.0fms)",
-        guidance_file, duration_sec, samplerate, (t1 - t0) * 1000,
-    )
+def _play(
+    call: metrics.CallMetrics,
+    number: str | None,
+    prepared: PreparedGuidance,
+    start_recording: Callable[[str | None], None] | None,
+    start_capture: Callable[[str | None], "CaptureThread | None"] | None,
+    t_start: float,
+) -> "CaptureThread | None":
+    """ミュート→再生→復帰を行い、録音に切り替えた録音スレッド（使わなかった場合は None）を返す。"""
+    if start_recording is None:
+        start_recording = _launch_recording_subprocess
 
-    # --- 仮想ケーブルデバイスの事前検索 ---
-    cable_name = config.get("audio", "virtual_cable_name")
-    device_index = find_virtual_cable_device(cable_name)
-    if device_index is None:
-        logger.error("仮想ケーブルデバイス '%s' が見つかりません", cable_name)
-        return
+    # --- 録音スレッドのプリロールをミュート前に開始（ストリームは並行して開く） ---
+    capture = None
+    committed = False
+    if start_capture is not None:
+        try:
+            with call.span("capture_start"):
+                capture = start_capture(number)
+        except Exception:
+            logger.exception("録音スレッドを開始できませんでした（再生後に録音を開始します）")
+
+    data = prepared.data
+    samplerate = prepared.samplerate
+    device_index = prepared.device_index
+    output = prepared.output
 
     t_ready = time.perf_counter()
     logger.info("事前準備完了 (%.0fms)", (t_ready - t_start) * 1000)
@@ -106,20 +378,18 @@ def run(number: str | None = None) -> None:
     # 時間クリティカルフェーズ（ミュート→再生を最速で実行）
     # ============================================================
 
-    # --- マイクミュート ---
-    try:
-        mute_physical_mic()
-    except Exception:
-        logger.error("マイクミュートに失敗しました。処理を中断します。")
-        return
-
-    # --- スピーカーミュート（ハウリング防止） ---
-    speaker_muted = False
+    # --- マイク + スピーカー（ハウリング防止）を一括ミュート ---
+    controller = get_controller()
+    backend = get_backend()
     try:
-        mute_default_speaker()
-        speaker_muted = True
+        with call.span("mute"):
+            call.set("speaker_muted", controller.mute_all())
     except Exception:
-        logger.warning("スピーカーミュートに失敗しました（ガイダンス再生は続行します）")
+        logger.exception("マイクミュートに失敗しました。処理を中断します。")
+        call.status = "mute-failed"
+        if capture is not None:
+            capture.cancel()
+        return None
 
     try:
         # --- 即座にガイダンス再生開始 ---
@@ -128,25 +398,46 @@ def run(number: str | None = None) -> None:
             "音声ガイダンスを再生します (ミュート→再生: %.0fms)",
             (t_play - t_ready) * 1000,
         )
-        sd.play(data, samplerate=samplerate, device=device_index)
+        with call.span("play_start"):
+            if output is not None:
+                try:
+                    output.start()
+                except Exception:
+                    logger.exception("事前に開いた再生ストリームを開始できませんでした（開き直して再生します）")
+                    prepared.broken = True
+                    output = None
+            if output is None:
+                backend.play(data, samplerate=samplerate, device=device_index)
+        call.add_span("mute_to_play", (time.perf_counter() - t_ready) * 1000)
 
-        # --- 再生開始後に録音サブプロセスを起動（再生と並行） ---
-        _launch_recording_subprocess(number)
+        # --- 再生開始後に録音を開始（再生と並行） ---
+        with call.span("start_recording"):
+            if capture is not None:
+                capture.commit()
+                committed = True
+            else:
+                start_recording(number)
 
         # --- 再生完了待機 ---
-        sd.wait()
+        with call.span("playback"):
+            if output is not None:
+                output.wait()
+            else:
+                backend.wait()
         logger.info("音声ガイダンスの再生が完了しました")
+        if output is not None and output.first_sample_time is not None:
+            first_ms = (output.first_sample_time - t_ready) * 1000
+            call.add_span("mute_to_first_sample", first_ms)
+            logger.info("ガイダンスの最初のサンプルを出力しました (ミュート→出力: %.0fms)", first_ms)
 
     except Exception:
         logger.exception("ガイダンス再生中にエラーが発生しました")
+        call.status = "play-failed"
     finally:
-        # --- 必ずミュート解除 ---
-        try:
-            unmute_physical_mic()
-        except Exception:
-            logger.exception("マイクミュート解除に失敗しました — 手動で解除してください")
-        if speaker_muted:
-            try:
-                unmute_default_speaker()
-            except Exception:
-                logger.exception("スピーカーミュート解除に失敗しました — 手動で解除してください")
+        # --- 必ずミュート前の状態に戻す ---
+        with call.span("restore"):
+            if not controller.restore_all():
+                call.status = "restore-failed"
+        if capture is not None and not committed:
+            capture.cancel()
+    return capture if committed else None
@@ -0,0 +1,140 @@
+"""ローカルプロセス間通信（IPC）ユーティリティ。
+
+Windows では名前付きパイプ、それ以外では UNIX ドメインソケットを使い、
+JSON メッセージを 1 往復でやり取りする。
+
+- send_command(name, message): サーバーへコマンドを送信して応答を受け取る
+- Server(name, handler): コマンドを受け付けて handler の戻り値を応答として返す
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Optional
+
+from config_loader import _base_dir
+
+logger = logging.getLogger(__name__)
+
+# 常駐デーモンのチャンネル名
+DAEMON_CHANNEL = "daemon"
+# 録音のコントロールチャンネル名は録音セッションごと（sessions.channel()）
+
+Handler = Callable[[dict[str, Any]], dict[str, Any]]
+
+
+def address(name: str) -> str:
+    """チャンネル名 *name* に対応する IPC アドレスを返す。
+
+    同じ PC に複数の配置がある場合に衝突しないよう、
+    EXE（またはスクリプト）ディレクトリのハッシュをアドレスに含める。
+    """
+    digest = hashlib.sha1(_base_dir().encode("utf-8")).hexdigest()[:8]
+    if sys.platform == "win32":
+        return rf"\\.\pipe\call_helper_{digest}_{name}"
+    return os.path.join(_base_dir(), f".{name}.sock")
+
+
+def _family() -> str:
+    return "AF_PIPE" if sys.platform == "win32" else "AF_UNIX"
+
+
+def send_command(name: str, message: dict[str, Any], timeout: float = 5.0) -> Optional[dict[str, Any]]:
+    """サーバー *name* にコマンドを送信し、応答を返す。
+
+    サーバーが起動していない場合は None を返す（呼び出し側で従来処理にフォールバックする）。
+    応答が *timeout* 秒以内に届かない場合は TimeoutError を送出する。
+    """
+    try:
+        conn = Client(address(name), family=_family())
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    except OSError as e:
+        logger.debug("IPC 接続に失敗しました (%s): %s", name, e)
+        return None
+
+    with conn:
+        conn.send_bytes(json.dumps(message).encode("utf-8"))
+        if not conn.poll(timeout):
+            raise TimeoutError(f"IPC 応答がありません: {name} ({timeout:.0f} 秒)")
+        return json.loads(conn.recv_bytes().decode("utf-8"))
+
+
+class Server:
+    """名前付きチャンネルでコマンドを受け付ける IPC サーバー。
+
+    接続ごとに 1 メッセージを受け取り、*handler* の戻り値を応答として返す。
+    処理は接続ごとのスレッドで行うため、長い処理が他のコマンドを妨げない。
+    """
+
+    def __init__(self, name: str, handler: Handler) -> None:
+        self.name = name
+        self._handler = handler
+        addr = address(name)
+        if _family() == "AF_UNIX" and os.path.exists(addr):
+            # 前回の異常終了で残ったソケットファイルを削除
+            os.remove(addr)
+        self._listener = Listener(addr, family=_family())
+        self._closed = threading.Event()
+        self._handlers: set[threading.Thread] = set()
+        self._handlers_lock = threading.Lock()
+
+    def serve_forever(self) -> None:
+        """close() が呼ばれるまで接続を受け付ける。"""
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self._closed.is_set():
+                    return
+                logger.exception("IPC 接続の受け付けに失敗しました (%s)", self.name)
+                continue
+            thread = threading.Thread(
+                target=self._handle, args=(conn,), name=f"ipc-{self.name}", daemon=True
+            )
+            with self._handlers_lock:
+                self._handlers.add(thread)
+            thread.start()
+
+    def start(self) -> threading.Thread:
+        """バックグラウンドスレッドで serve_forever() を開始する。"""
+        thread = threading.Thread(target=self.serve_forever, name=f"ipc-{self.name}-accept", daemon=True)
+        thread.start()
+        return thread
+
+    def _handle(self, conn: Connection) -> None:
+        try:
+            self._handle_connection(conn)
+        finally:
+            with self._handlers_lock:
+                self._handlers.discard(threading.current_thread())
+
+    def _handle_connection(self, conn: Connection) -> None:
+        with conn:
+            try:
+                message = json.loads(conn.recv_bytes().decode("utf-8"))
+                try:
+                    reply = self._handler(message)
+                except Exception as e:
+                    logger.exception("IPC コマンドの処理に失敗しました: %s", message)
+                    reply = {"ok": False, "error": str(e)}
+                conn.send_bytes(json.dumps(reply).encode("utf-8"))
+            except (EOFError, OSError):
+                logger.warning("IPC クライアントとの通信が切断されました (%s)", self.name)
+
+    def close(self, timeout: float = 0.0) -> None:
+        """受け付けを終了する。*timeout* 秒まで処理中の応答の送信完了を待つ。"""
+        self._closed.set()
+        try:
+            self._listener.close()
+        except OSError:
+            pass
+        with self._handlers_lock:
+            handlers = list(self._handlers)
+        for thread in handlers:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
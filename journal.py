@@ -0,0 +1,279 @@
+"""クラッシュに強い録音ジャーナル。
+
+録音中の PCM を output_folder/.journal/<ファイル名>/ に固定サイズのセグメントとして追記する。
+プロセスが強制終了されたり PC がスリープしたりしても、それまでの音声はディスクに残る。
+
+- 書き込み中のセグメントは NNNNNN.part、満杯になると末尾に
+  トレーラー（連番・バイト数・CRC32）を付けて NNNNNN.seg にリネームする
+- fsync はブロックごとではなく一定間隔（とセグメント確定時）にまとめて行う
+- 録音が正常に保存されたらジャーナルは削除される
+- recover() は録音プロセスが残したジャーナルを見つけて MP3 を再構築する（--mode=recover）
+"""
+
+import json
+import logging
+import os
+import shutil
+import struct
+import time
+import zlib
+from typing import Optional
+
+import numpy as np
+
+import catalog
+from locks import try_lock
+
+logger = logging.getLogger(__name__)
+
+# ジャーナルのディレクトリ名（output_folder 直下）
+JOURNAL_DIR = ".journal"
+
+# セグメントサイズ: 4 MiB（48kHz / ステレオ / 16bit で約 22 秒）
+# 大きめのセグメントに順次追記することで、録音 PC の書き込み I/O を抑える
+_SEGMENT_BYTES = 4 * 1024 * 1024
+# fsync の間隔（秒）
+_FSYNC_INTERVAL_SEC = 5.0
+# ファイルの書き込みバッファ
+_WRITE_BUFFER_BYTES = 1024 * 1024
+
+_META_FILE = "meta.json"
+_LOCK_FILE = "lock"
+_TRAILER = struct.Struct("<4sIII")  # magic, 連番, PCM バイト数, CRC32
+_TRAILER_MAGIC = b"CHJS"
+
+
+# ---------- ロック（録音中のジャーナルを復旧対象から外す） ----------
+
+def _is_locked(journal_dir: str) -> bool:
+    """ジャーナルが録音中のプロセスにロックされていれば True を返す。"""
+    try:
+        fd = os.open(os.path.join(journal_dir, _LOCK_FILE), os.O_RDWR | os.O_CREAT)
+    except OSError:
+        return True
+    try:
+        return not try_lock(fd)
+    finally:
+        os.close(fd)
+
+
+# ---------- 書き込み ----------
+
+class Journal:
+    """録音中の PCM ブロックをセグメントに追記するジャーナル。"""
+
+    def __init__(self, output_folder: str, base_name: str,
+                 sample_rate: int, channels: int, number: Optional[str] = None) -> None:
+        self.path = os.path.join(output_folder, JOURNAL_DIR, base_name)
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock_fd = os.open(os.path.join(self.path, _LOCK_FILE), os.O_RDWR | os.O_CREAT)
+        if not try_lock(self._lock_fd):
+            os.close(self._lock_fd)
+            raise OSError(f"ジャーナルが別のプロセスに使用されています: {self.path}")
+        try:
+            self._start(base_name, sample_rate, channels, number)
+        except BaseException:
+            os.close(self._lock_fd)
+            raise
+
+    def _start(self, base_name: str, sample_rate: int, channels: int, number: Optional[str]) -> None:
+        meta = {
+            "base_name": base_name,
+            "sample_rate": sample_rate,
+            "channels": channels,
+            "dtype": "int16",
+            "number": number,
+            "started_at": time.time(),
+            "pid": os.getpid(),
+        }
+        meta_path = os.path.join(self.path, _META_FILE)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(meta_path + ".tmp", meta_path)
+
+        self._seq = 0
+        self._file = None
+        self._written = 0
+        self._crc = 0
+        self._last_sync = time.monotonic()
+        self._open_segment()
+
+    def _segment_path(self, seq: int, suffix: str) -> str:
+        return os.path.join(self.path, f"{seq:06d}{suffix}")
+
+    def _open_segment(self) -> None:
+        self._seq += 1
+        self._file = open(self._segment_path(self._seq, ".part"), "wb", buffering=_WRITE_BUFFER_BYTES)
+        self._written = 0
+        self._crc = 0
+
+    def _seal_segment(self) -> None:
+        """書き込み中のセグメントにトレーラーを付けて確定させる。"""
+        self._file.write(_TRAILER.pack(_TRAILER_MAGIC, self._seq, self._written, self._crc))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._segment_path(self._seq, ".part"), self._segment_path(self._seq, ".seg"))
+        self._last_sync = time.monotonic()
+
+    def append(self, block: np.ndarray) -> None:
+        """PCM ブロックを追記する（セグメントが満杯になれば次のセグメントへ切り替える）。"""
+        data = memoryview(np.ascontiguousarray(block)).cast("B")
+        while data:
+            chunk = data[:_SEGMENT_BYTES - self._written]
+            self._file.write(chunk)
+            self._crc = zlib.crc32(chunk, self._crc)
+            self._written += len(chunk)
+            data = data[len(chunk):]
+            if self._written >= _SEGMENT_BYTES:
+                self._seal_segment()
+                self._open_segment()
+
+        if time.monotonic() - self._last_sync >= _FSYNC_INTERVAL_SEC:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        """書き込み中のセグメントを確定させる（録音の保存前に呼ぶ）。"""
+        if self._file is not None and not self._file.closed:
+            self._seal_segment()
+
+    def release(self) -> None:
+        """書き込み中のセグメントを確定させてロックを解放する（ジャーナルは残す）。
+
+        録音の保存に失敗した場合に呼ぶ。ロックを解放すると --mode=recover や
+        常駐モードの起動時の復旧で、このジャーナルが復旧の対象になる。
+        """
+        try:
+            self.close()
+        finally:
+            if self._lock_fd >= 0:
+                os.close(self._lock_fd)
+                self._lock_fd = -1
+
+    def discard(self) -> None:
+        """録音が正常に保存されたあと、ジャーナルを削除する。"""
+        self.release()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+# ---------- 読み出し・復旧 ----------
+
+def _has_valid_trailer(data: bytes) -> bool:
+    """確定処理の途中（トレーラー書き込み後・リネーム前）で止まったセグメントか判定する。"""
+    if len(data) < _TRAILER.size:
+        return False
+    magic, _, length, crc = _TRAILER.unpack(data[-_TRAILER.size:])
+    payload = data[:-_TRAILER.size]
+    return magic == _TRAILER_MAGIC and length == len(payload) and zlib.crc32(payload) == crc
+
+
+def _read_segments(journal_dir: str, frame_bytes: int):
+    """ジャーナルのセグメントを連番順に読み出して PCM バイト列を返すジェネレーター。
+
+    CRC が一致しないセグメントは同じ長さの無音に置き換え、以降の時間軸を保つ。
+    確定していない .part セグメントはフレーム境界までを使う。
+    """
+    names = sorted(n for n in os.listdir(journal_dir) if n.endswith((".seg", ".part")))
+    for name in names:
+        path = os.path.join(journal_dir, name)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        if name.endswith(".part") and not _has_valid_trailer(data):
+            usable = len(data) - len(data) % frame_bytes
+            yield data[:usable]
+            continue
+
+        if len(data) < _TRAILER.size:
+            logger.warning("セグメントが短すぎるためスキップします: %s", path)
+            continue
+        magic, seq, length, crc = _TRAILER.unpack(data[-_TRAILER.size:])
+        payload = data[:-_TRAILER.size]
+        if magic != _TRAILER_MAGIC or length != len(payload):
+            logger.warning("セグメントのトレーラーが不正なため無音に置き換えます: %s", path)
+            yield bytes(len(payload) - len(payload) % frame_bytes)
+        elif zlib.crc32(payload) != crc:
+            logger.warning("セグメントの CRC が一致しないため無音に置き換えます: %s (連番 %d)", path, seq)
+            yield bytes(length)
+        else:
+            yield payload
+
+
+def find_orphans(output_folder: str) -> list[str]:
+    """録音プロセスが残した（ロックされていない）ジャーナルのディレクトリ一覧を返す。"""
+    root = os.path.join(output_folder, JOURNAL_DIR)
+    if not os.path.isdir(root):
+        return []
+    orphans = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if os.path.isfile(os.path.join(path, _META_FILE)) and not _is_locked(path):
+            orphans.append(path)
+    return orphans
+
+
+def rebuild(journal_dir: str, output_folder: str) -> Optional[str]:
+    """ジャーナルから MP3 を再構築し、成功すれば MP3 のパスを返す。"""
+    from mp3codec import create_encoder
+    from mp3frames import Mp3Writer
+    from peaks import PeakTracker, write_peaks
+
+    with open(os.path.join(journal_dir, _META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    mp3_path = os.path.join(output_folder, f"{meta['base_name']}.mp3")
+    frame_bytes = 2 * meta["channels"]
+
+    encoder = create_encoder(meta["sample_rate"], meta["channels"])
+    peaks = PeakTracker(meta["sample_rate"])
+    total = 0
+    tmp_path = mp3_path + ".recovering"
+    with open(tmp_path, "wb") as f:
+        writer = Mp3Writer(f)
+        for pcm in _read_segments(journal_dir, frame_bytes):
+            if pcm:
+                writer.write(encoder.encode(pcm))
+                peaks.process(np.frombuffer(pcm, dtype=np.int16).reshape(-1, meta["channels"]))
+                total += len(pcm)
+        writer.write(encoder.flush())
+        writer.finish()
+
+    if total == 0:
+        os.remove(tmp_path)
+        logger.warning("ジャーナルに音声データがありません: %s", journal_dir)
+        return None
+
+    # ストリーミングで途中まで書かれた MP3 があれば置き換える
+    os.replace(tmp_path, mp3_path)
+    write_peaks(mp3_path, peaks)
+    duration = total / frame_bytes / meta["sample_rate"]
+    logger.info("ジャーナルから録音を復旧しました: %s (%.1f 秒)", mp3_path, duration)
+    started_at = meta.get("started_at")
+    catalog.add(
+        output_folder, mp3_path, catalog.RECOVERED,
+        number=meta.get("number"), started_at=started_at,
+        ended_at=started_at + duration if started_at is not None else None,
+        duration_sec=round(duration, 1), samplerate=meta["sample_rate"], channels=meta["channels"],
+        size=os.path.getsize(mp3_path),
+    )
+    return mp3_path
+
+
+def recover(output_folder: str) -> list[str]:
+    """*output_folder* の孤立したジャーナルをすべて MP3 に復旧し、復旧したパスの一覧を返す。"""
+    recovered = []
+    for journal_dir in find_orphans(output_folder):
+        logger.info("孤立したジャーナルを検出しました: %s", journal_dir)
+        try:
+            mp3_path = rebuild(journal_dir, output_folder)
+        except Exception:
+            logger.exception("ジャーナルの復旧に失敗しました（ジャーナルは残します）: %s", journal_dir)
+            continue
+        if mp3_path is not None:
+            recovered.append(mp3_path)
+        shutil.rmtree(journal_dir, ignore_errors=True)
+    return recovered
@@ -0,0 +1,27 @@
+"""プロセス間の排他に使うロックファイルのユーティリティ。
+
+ジャーナル（録音中のジャーナルを復旧対象から外す）・変換ワーカー（同時に 1 つだけ実行）・
+着信スケジューラー（着信処理を 1 つずつ実行）で共通に使う。
+着信処理の経路から import されるため、標準ライブラリ以外に依存しない。
+"""
+
+import sys
+
+
+def try_lock(fd: int) -> bool:
+    """ファイル *fd* の排他ロックを取得する。他プロセスが保持していれば False を返す。
+
+    ロックは fd を閉じる（またはプロセスが終了する）と解放される。
+    """
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
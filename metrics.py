@@ -0,0 +1,302 @@
+"""処理時間の計測とメトリクスの出力。
+
+着信処理・録音・録音停止の 1 回ごとに CallMetrics を作り、
+名前付きの区間（span）とカウンターを記録して、終了時に JSON Lines へ 1 行追記する。
+
+- 区間の計測はどのモジュールからでも metrics.span("名前") で行える。
+  実行中の CallMetrics が無いスレッドでは何も記録しない
+- 出力先は config.ini の [metrics] セクションで指定する（既定: call_metrics.jsonl）
+- prometheus_textfile を指定すると、直近の記録の p50/p95/p99 を
+  node_exporter の textfile collector 形式で書き出す
+- summarize() は --mode=stats で区間ごとの p50/p95/p99 を表示するために使う
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+from config_loader import load_config, _base_dir
+
+logger = logging.getLogger(__name__)
+
+# 既定の出力ファイル名（EXE ディレクトリに作成）
+_DEFAULT_FILE = "call_metrics.jsonl"
+# Prometheus textfile の集計に使う直近の記録のサイズ（ファイル末尾から読む）
+_TEXTFILE_TAIL_BYTES = 2 * 1024 * 1024
+_QUANTILES = (0.5, 0.95, 0.99)
+
+_current: contextvars.ContextVar[Optional["CallMetrics"]] = contextvars.ContextVar(
+    "call_metrics", default=None
+)
+_write_lock = threading.Lock()
+# redirect() で指定された出力先（シミュレーションの記録を本番の集計に混ぜないため）
+_redirect: Optional[tuple[Optional[str], Optional[str]]] = None
+
+
+class CallMetrics:
+    """1 回の処理（着信・録音・停止）の区間・カウンター・属性を保持する。"""
+
+    def __init__(self, kind: str, **fields) -> None:
+        self.kind = kind
+        self.status = "ok"
+        self.fields = {k: v for k, v in fields.items() if v is not None}
+        self.spans: dict[str, float] = {}
+        self.counters: dict[str, float] = {}
+        self._started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._token: Optional[contextvars.Token] = None
+        self._finished = False
+
+    # ---------- 記録 ----------
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """with ブロックの所要時間を区間 *name* として記録する（同名の区間は合算）。"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, (time.perf_counter() - t0) * 1000)
+
+    def add_span(self, name: str, ms: float) -> None:
+        self.spans[name] = round(self.spans.get(name, 0.0) + ms, 2)
+
+    def count(self, name: str, n: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name: str, value) -> None:
+        """記録に含める属性（着信番号・保存結果など）を設定する。"""
+        if value is not None:
+            self.fields[name] = value
+
+    # ---------- 開始・終了 ----------
+
+    def __enter__(self) -> "CallMetrics":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.status = "error"
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        self.finish()
+
+    def record(self) -> dict:
+        return {
+            "ts": datetime.fromtimestamp(self._started_at).isoformat(timespec="milliseconds"),
+            "kind": self.kind,
+            "status": self.status,
+            "pid": os.getpid(),
+            "wall_ms": round((time.perf_counter() - self._t0) * 1000, 2),
+            "spans": self.spans,
+            "counters": self.counters,
+            "fields": self.fields,
+        }
+
+    def finish(self) -> None:
+        """記録を JSON Lines ファイルへ追記する（2 回目以降の呼び出しは無視）。
+
+        メトリクスの出力に失敗しても本来の処理には影響させない。
+        """
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            _write(self.record())
+        except Exception:
+            logger.warning("メトリクスの書き込みに失敗しました", exc_info=True)
+
+
+def call(kind: str, **fields) -> CallMetrics:
+    """処理 1 回分の CallMetrics を作る。with ブロックの間は現在のスレッドの計測先になる。"""
+    return CallMetrics(kind, **fields)
+
+
+def current() -> Optional[CallMetrics]:
+    """現在のスレッドで実行中の CallMetrics を返す（無ければ None）。"""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """実行中の CallMetrics に区間 *name* を記録する（無ければ何もしない）。"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.span(name):
+        yield
+
+
+def count(name: str, n: float = 1) -> None:
+    """実行中の CallMetrics のカウンター *name* を加算する（無ければ何もしない）。"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.count(name, n)
+
+
+# ---------- 出力 ----------
+
+def _resolve(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(_base_dir(), path)
+
+
+def redirect(path: Optional[str], textfile: Optional[str] = None) -> None:
+    """このプロセスの記録先を config.ini の設定に関係なく *path* に変更する。
+
+    *path* に None を指定すると config.ini の設定に戻す。
+    """
+    global _redirect
+    _redirect = (path, textfile) if path is not None else None
+
+
+def _settings() -> tuple[Optional[str], Optional[str]]:
+    """(JSON Lines のパス, Prometheus textfile のパス) を返す。無効な場合は None。"""
+    if _redirect is not None:
+        return _redirect
+    try:
+        config = load_config()
+    except FileNotFoundError:
+        return _resolve(_DEFAULT_FILE), None
+    if not config.getboolean("metrics", "enabled", fallback=True):
+        return None, None
+    path = config.get("metrics", "file", fallback=_DEFAULT_FILE).strip() or _DEFAULT_FILE
+    textfile = config.get("metrics", "prometheus_textfile", fallback="").strip()
+    return _resolve(path), (_resolve(textfile) if textfile else None)
+
+
+def _write(record: dict) -> None:
+    path, textfile = _settings()
+    if path is None:
+        return
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _write_lock:
+        # 1 行を 1 回の write で追記する（複数プロセスから同時に追記しても行が混ざらない）
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+        if textfile:
+            write_textfile(textfile, read_records(path, tail_bytes=_TEXTFILE_TAIL_BYTES))
+
+
+def metrics_path() -> Optional[str]:
+    """JSON Lines ファイルのパスを返す（メトリクスが無効なら None）。"""
+    return _settings()[0]
+
+
+def read_records(path: str, tail_bytes: Optional[int] = None) -> list[dict]:
+    """JSON Lines ファイルから記録を読み込む。*tail_bytes* を指定すると末尾だけを読む。"""
+    try:
+        with open(path, "rb") as f:
+            if tail_bytes is not None:
+                size = os.fstat(f.fileno()).st_size
+                if size > tail_bytes:
+                    f.seek(size - tail_bytes)
+                    f.readline()  # 途中から読み始めた行は捨てる
+            data = f.read()
+    except FileNotFoundError:
+        return []
+
+    records = []
+    for line in data.splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+# ---------- 集計 ----------
+
+def percentile(values: list[float], q: float) -> float:
+    """*values* の q 分位点（線形補間）を返す。"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    pos = (len(ordered) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize(records: list[dict]) -> dict:
+    """記録を処理種別・区間ごとに集計する。
+
+    Returns
+    -------
+    {kind: {"calls": 件数, "status": {status: 件数}, "spans": {区間: {count, p50, p95, p99, max}}}}
+    """
+    grouped: dict[str, dict] = {}
+    for rec in records:
+        kind = rec.get("kind", "?")
+        group = grouped.setdefault(kind, {"calls": 0, "status": {}, "values": {}})
+        group["calls"] += 1
+        status = rec.get("status", "?")
+        group["status"][status] = group["status"].get(status, 0) + 1
+        spans = dict(rec.get("spans", {}))
+        spans["wall"] = rec.get("wall_ms", 0.0)
+        for name, ms in spans.items():
+            group["values"].setdefault(name, []).append(ms)
+
+    summary = {}
+    for kind, group in sorted(grouped.items()):
+        spans = {}
+        for name, values in sorted(group["values"].items()):
+            spans[name] = {
+                "count": len(values),
+                **{f"p{int(q * 100)}": round(percentile(values, q), 1) for q in _QUANTILES},
+                "max": round(max(values), 1),
+            }
+        summary[kind] = {"calls": group["calls"], "status": group["status"], "spans": spans}
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    """summarize() の結果を表形式の文字列にする（--mode=stats の表示用）。"""
+    lines = []
+    for kind, group in summary.items():
+        status = ", ".join(f"{k}={v}" for k, v in sorted(group["status"].items()))
+        lines.append(f"[{kind}] {group['calls']} 件 ({status})")
+        lines.append(f"  {'span':<24}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        for name, s in group["spans"].items():
+            lines.append(
+                f"  {name:<24}{s['count']:>8}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['max']:>10.1f}"
+            )
+        lines.append("")
+    return "\n".join(lines)
+
+
+def write_textfile(path: str, records: list[dict]) -> None:
+    """直近の記録の分位点を Prometheus の textfile collector 形式で書き出す。"""
+    summary = summarize(records)
+    out = [
+        "# HELP call_helper_span_milliseconds Duration of call_helper phases over recent calls.",
+        "# TYPE call_helper_span_milliseconds summary",
+    ]
+    for kind, group in summary.items():
+        for name, s in group["spans"].items():
+            labels = f'kind="{kind}",span="{name}"'
+            for q in _QUANTILES:
+                out.append(f'call_helper_span_milliseconds{{{labels},quantile="{q}"}} '
+                           f'{s[f"p{int(q * 100)}"]}')
+            out.append(f"call_helper_span_milliseconds_count{{{labels}}} {s['count']}")
+    out += [
+        "# HELP call_helper_recent_calls Number of recent calls by kind and status.",
+        "# TYPE call_helper_recent_calls gauge",
+    ]
+    for kind, group in summary.items():
+        for status, n in sorted(group["status"].items()):
+            out.append(f'call_helper_recent_calls{{kind="{kind}",status="{status}"}} {n}')
+
+    # node_exporter が書きかけのファイルを読まないよう、一時ファイルから置き換える
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(out) + "\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,209 @@
+"""MP3 エンコードユーティリティ（lameenc 使用、ffmpeg 不要）。
+
+録音プロセス・ジャーナル復旧・バックグラウンド変換ワーカーで共通の
+エンコーダー設定を使うため、ここにまとめている。
+sounddevice などのデバイス系モジュールには依存しない。
+"""
+
+import logging
+import os
+from concurrent.futures import Executor
+from typing import Callable, Optional
+
+import lameenc
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# WAV → MP3 変換時に一度に読み込むフレーム数（約 20 秒分）
+_BLOCK_FRAMES = 1024 * 1024
+
+
+# 並列エンコードで 1 区間に割り当てる最短の長さ（秒）。これより短い録音は分けない
+_MIN_SEGMENT_SEC = 30
+# 区間の前に余分にエンコードして捨てるフレーム数（心理音響モデルなどの状態を落ち着かせる）
+_PREROLL_FRAMES = 16
+# 区間の後ろに余分にエンコードするフレーム数（この範囲で継ぎ目の位置を探す）
+_OVERLAP_FRAMES = 32
+# 区間の末尾は flush で補われる無音の影響を受けるため、継ぎ目の候補にしない
+_TAIL_GUARD_FRAMES = 4
+
+# LAME の vbr_mode（vbr_mtrh = LAME の既定 VBR）
+_LAME_VBR_MTRH = 4
+
+
+def create_encoder(
+    sample_rate: int,
+    channels: int,
+    bitrate: int = 128,
+    vbr_quality: Optional[int] = None,
+) -> lameenc.Encoder:
+    """録音用の設定済み lameenc.Encoder を生成する。
+
+    *vbr_quality* (0=高音質 〜 9=小さい) を指定すると VBR、省略時は *bitrate* kbps の CBR。
+    """
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(bitrate)
+    encoder.set_in_sample_rate(sample_rate)
+    encoder.set_channels(channels)
+    encoder.set_quality(2)  # 0=best, 9=fastest
+    if vbr_quality is not None:
+        encoder.set_vbr(_LAME_VBR_MTRH)
+        encoder.set_vbr_quality(vbr_quality)
+    return encoder
+
+
+def pcm_to_mp3(pcm_data: bytes, sample_rate: int, channels: int) -> bytes:
+    """PCM バイト列 → MP3 バイト列に変換する。"""
+    encoder = create_encoder(sample_rate, channels)
+    mp3_data = encoder.encode(pcm_data)
+    mp3_data += encoder.flush()
+    return mp3_data
+
+
+def wav_to_mp3(wav_path: str, mp3_path: str, settings=None, pool: Optional[Executor] = None,
+               workers: int = 1) -> int:
+    """WAV ファイルをブロック単位で読みながら MP3 に変換し、MP3 のバイト数を返す。
+
+    *settings* (analysis.EncodeSettings) を指定すると、無音の短縮・モノラル化・VBR を適用する
+    （省略時はステレオ 128kbps CBR）。MP3 には Xing / Info ヘッダーを付け、波形概要も書き出す。
+    *pool* と *workers* (2 以上) を指定すると、加工後の PCM を一時ファイルに書き出してから
+    encode_segments() で区間ごとに並列にエンコードする。
+    一時ファイルに書いてから置き換えるため、途中で失敗しても不完全な MP3 は残らない。
+    """
+    import soundfile as sf
+
+    from analysis import EncodeSettings, RecordingEncoder, write_sidecar
+    from mp3frames import Mp3Writer
+    from peaks import write_peaks
+
+    settings = settings or EncodeSettings()
+    tmp_path = mp3_path + ".tmp"
+    spool_path = mp3_path + ".pcm"
+    parallel = pool is not None and workers > 1
+    try:
+        with sf.SoundFile(wav_path) as wav, open(tmp_path, "wb") as f:
+            writer = Mp3Writer(f, vbr=settings.vbr)
+            if parallel:
+                with open(spool_path, "wb") as spool:
+                    encoder = RecordingEncoder(wav.samplerate, wav.channels, settings, spool=spool)
+                    for block in wav.blocks(blocksize=_BLOCK_FRAMES, dtype="int16", always_2d=True):
+                        encoder.encode(block)
+                    encoder.flush()
+                encode_segments(spool_path, wav.samplerate, encoder.channels_out, writer.write, pool, workers,
+                                bitrate=settings.bitrate,
+                                vbr_quality=settings.vbr_quality if settings.vbr else None)
+            else:
+                encoder = RecordingEncoder(wav.samplerate, wav.channels, settings)
+                for block in wav.blocks(blocksize=_BLOCK_FRAMES, dtype="int16", always_2d=True):
+                    writer.write(encoder.encode(block))
+                writer.write(encoder.flush())
+            writer.finish()
+        os.replace(tmp_path, mp3_path)
+        sidecar = encoder.sidecar()
+        if sidecar is not None:
+            write_sidecar(mp3_path, sidecar)
+        if encoder.peaks is not None:
+            write_peaks(mp3_path, encoder.peaks)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        if parallel:
+            try:
+                os.remove(spool_path)
+            except OSError:
+                pass
+    return os.path.getsize(mp3_path)
+
+
+# ---------- 区間ごとの並列エンコード ----------
+
+def _frame_samples(sample_rate: int) -> int:
+    """MP3 の 1 フレームのサンプル数（MPEG-1 は 1152、MPEG-2 / 2.5 は 576）。"""
+    return 1152 if sample_rate >= 32000 else 576
+
+
+def _encode_range(raw_path: str, start: int, stop: int, sample_rate: int, channels: int,
+                  bitrate: int, vbr_quality: Optional[int]) -> bytes:
+    """raw PCM ファイルの [start, stop) フレームを 1 つのエンコーダーでエンコードする（プロセスプールで実行）。"""
+    encoder = create_encoder(sample_rate, channels, bitrate, vbr_quality)
+    frame_bytes = 2 * channels
+    out = []
+    with open(raw_path, "rb") as f:
+        f.seek(start * frame_bytes)
+        remaining = stop - start
+        while remaining > 0:
+            data = f.read(min(remaining, _BLOCK_FRAMES) * frame_bytes)
+            if not data:
+                break
+            out.append(encoder.encode(data))
+            remaining -= len(data) // frame_bytes
+    out.append(encoder.flush())
+    return b"".join(out)
+
+
+def encode_segments(raw_path: str, sample_rate: int, channels: int, write: Callable[[bytes], None],
+                    pool: Executor, workers: int, bitrate: int = 128,
+                    vbr_quality: Optional[int] = None, min_segment_sec: float = _MIN_SEGMENT_SEC) -> int:
+    """raw PCM（int16 インターリーブ）ファイルを MP3 フレームの境界で区間に分け、*pool* で並列にエンコードする。
+
+    各区間は前に _PREROLL_FRAMES、後ろに _OVERLAP_FRAMES フレームを余分にエンコードし、
+    重なった範囲でブロックタイプとビットリザーバーが矛盾しない位置を探して継ぎ合わせる
+    （mp3frames.splice）。継ぎ目が見つからない場合は、前の区間から続けてエンコードし直す。
+    1 区間は *min_segment_sec* 秒より短くしない。MP3 データは先頭から順に *write* へ渡し、区間の数を返す。
+    """
+    from mp3frames import parse_header, splice, split_frames
+
+    frame_samples = _frame_samples(sample_rate)
+    total = os.path.getsize(raw_path) // (2 * channels)
+    args = (sample_rate, channels, bitrate, vbr_quality)
+    n_frames = -(-total // frame_samples)
+    length = max(1, -(-n_frames // max(1, workers)), int(min_segment_sec * sample_rate) // frame_samples)
+    starts = list(range(0, n_frames, length))
+    if len(starts) <= 1:
+        write(_encode_range(raw_path, 0, total, *args))
+        return 1
+
+    # 各区間の (エンコーダーの先頭フレーム, 入力の終了位置)
+    bounds = [
+        (max(0, start - _PREROLL_FRAMES),
+         total if k + 1 == len(starts) else min(total, (starts[k + 1] + _OVERLAP_FRAMES) * frame_samples))
+        for k, start in enumerate(starts)
+    ]
+    futures = [pool.submit(_encode_range, raw_path, first * frame_samples, stop, *args) for first, stop in bounds]
+
+    head = split_frames(futures[0].result())
+    header = parse_header(head[0]) if head else None
+    if header is None or header.samplerate != sample_rate or header.samples != frame_samples:
+        # LAME がサンプルレートを変換した場合はフレーム境界が揃わないため、分けずにエンコードする
+        for future in futures[1:]:
+            future.cancel()
+        logger.info("フレーム境界を揃えられないため、区間に分けずにエンコードします")
+        write(_encode_range(raw_path, 0, total, *args))
+        return 1
+
+    # head[0] の時刻（フレーム番号）と、head を出力したエンコーダーの先頭フレーム
+    head_at, head_origin = 0, 0
+    retried = 0
+    for k in range(1, len(starts)):
+        tail_origin, tail_stop = bounds[k]
+        tail = split_frames(futures[k].result())
+        candidates = range(starts[k] - head_at, starts[k] + _OVERLAP_FRAMES - _TAIL_GUARD_FRAMES - head_at)
+        i = splice(head, tail, tail_origin - head_at, candidates)
+        if i is None:
+            # 同じ入力からは同じフレームが出力されるため、head の先頭はそのまま続けられる
+            retried += 1
+            logger.info("区間 %d の継ぎ目が見つからないため、前の区間から続けてエンコードし直します", k)
+            data = pool.submit(_encode_range, raw_path, head_origin * frame_samples, tail_stop, *args).result()
+            head = split_frames(data)[head_at - head_origin:]
+            continue
+        write(b"".join(head[:i]))
+        head = tail[i - (tail_origin - head_at):]
+        head_at, head_origin = head_at + i, tail_origin
+    write(b"".join(head))
+    logger.info("MP3 を %d 区間に分けて並列にエンコードしました (継ぎ直し %d 件)", len(starts), retried)
+    return len(starts)
@@ -0,0 +1,350 @@
+"""MPEG オーディオ Layer III のフレームヘッダーと Xing / Info ヘッダー。
+
+lameenc はフレームだけを出力し、Xing / Info ヘッダー（総フレーム数・シーク用 TOC）を書かない。
+そのままでは 1〜2 時間の録音をシークするたびにプレーヤーがファイル全体を読む（または
+ビットレートから位置を推測する）ため、Mp3Writer で書き込みながらフレームの位置を記録し、
+録音終了時に先頭の Xing / Info フレームへ書き込む。
+
+- Mp3Writer: 最初のフレームと同じ形式の空のヘッダーフレームを先頭に書き、finish() で
+  総フレーム数・総バイト数・TOC（100 分割の位置 → バイト位置）を埋める
+- parse_header() / read_info(): 既存の MP3 の形式と長さを先頭だけから求める（カタログの一括登録用）
+
+標準ライブラリ以外を import しない（--mode=search などから使うため）。
+"""
+
+import logging
+import struct
+from array import array
+from typing import BinaryIO, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+_BITRATES = {
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# バージョンのビット (3=MPEG1, 2=MPEG2, 0=MPEG2.5) → サンプルレート
+_SAMPLERATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+# Xing / Info ヘッダーのフラグ
+_FLAG_FRAMES = 0x01
+_FLAG_BYTES = 0x02
+_FLAG_TOC = 0x04
+_TOC_ENTRIES = 100
+# タグ (4) + フラグ (4) + フレーム数 (4) + バイト数 (4) + TOC (100)
+_XING_SIZE = 4 + 4 + 4 + 4 + _TOC_ENTRIES
+# 既存の MP3 で先頭フレームを探す範囲（ID3v2 タグの後ろから）
+_SCAN_BYTES = 64 * 1024
+
+
+class FrameHeader(NamedTuple):
+    mpeg1: bool
+    samplerate: int
+    bitrate: int
+    channels: int
+    length: int
+    samples: int
+
+    @property
+    def side_info(self) -> int:
+        """サイド情報のバイト数（Xing / Info ヘッダーはこの直後に置く）。"""
+        if self.mpeg1:
+            return 32 if self.channels == 2 else 17
+        return 17 if self.channels == 2 else 9
+
+
+def _frame_length(mpeg1: bool, bitrate: int, samplerate: int, padding: int) -> int:
+    return (144 if mpeg1 else 72) * bitrate // samplerate + padding
+
+
+def parse_header(data, pos: int = 0) -> Optional[FrameHeader]:
+    """*data* の *pos* から始まる 4 バイトを Layer III のフレームヘッダーとして解析する。"""
+    if len(data) < pos + 4:
+        return None
+    b0, b1, b2, b3 = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version = (b1 >> 3) & 3
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or (b1 >> 1) & 3 != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    samplerate = _SAMPLERATES[version][rate_index]
+    bitrate = _BITRATES[mpeg1][bitrate_index] * 1000
+    return FrameHeader(
+        mpeg1=mpeg1,
+        samplerate=samplerate,
+        bitrate=bitrate,
+        channels=1 if b3 >> 6 == 3 else 2,
+        length=_frame_length(mpeg1, bitrate, samplerate, (b2 >> 1) & 1),
+        samples=1152 if mpeg1 else 576,
+    )
+
+
+def _info_frame(first: bytes, header: FrameHeader, tag: bytes, frames: int = 0, size: int = 0,
+                toc: Optional[bytes] = None) -> bytes:
+    """最初のフレーム *first* と同じ形式の Xing / Info フレームを作る。
+
+    フレーム数が 0 の場合はフラグの無い空のヘッダー（書き込み途中のプレースホルダー）になる。
+    """
+    need = 4 + header.side_info + _XING_SIZE
+    for bitrate_index in range(1, 15):
+        length = _frame_length(header.mpeg1, _BITRATES[header.mpeg1][bitrate_index] * 1000,
+                               header.samplerate, 0)
+        if length >= need:
+            break
+    frame = bytearray(length)
+    # CRC 無し・パディング無し、サンプルレートとチャンネルモードは最初のフレームと同じ
+    frame[0:4] = bytes((0xFF, first[1] | 0x01, (bitrate_index << 4) | (first[2] & 0x0C), first[3]))
+    flags = (_FLAG_FRAMES | _FLAG_BYTES | _FLAG_TOC) if frames else 0
+    pos = 4 + header.side_info
+    frame[pos:pos + 16] = tag + struct.pack(">III", flags, frames, size)
+    if toc is not None:
+        frame[pos + 16:pos + 16 + _TOC_ENTRIES] = toc
+    return bytes(frame)
+
+
+class Mp3Writer:
+    """MP3 のフレームをファイルへ書き込み、先頭に Xing / Info ヘッダーを付ける。
+
+    *vbr* が True なら "Xing"、False（CBR）なら "Info" のタグを使う。
+    書き込んだデータのフレームヘッダーを順に解析して各フレームの位置を記録し、
+    finish() でファイルの先頭へ seek してヘッダーを完成させる。
+    """
+
+    def __init__(self, file: BinaryIO, vbr: bool = False) -> None:
+        self._file = file
+        self._tag = b"Xing" if vbr else b"Info"
+        self.bytes_written = 0
+        # 最初のフレームヘッダー（解析できるまでデータを保留する）
+        self._first: Optional[bytes] = None
+        self._header: Optional[FrameHeader] = None
+        self._pending = b""
+        self._info_len = 0
+        # 各フレームの位置（ヘッダーフレームの直後を 0 とする）
+        self._offsets = array("Q")
+        self._audio_bytes = 0
+        self._next = 0
+        self._tail = b""
+        self._synced = True
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        if self._first is None:
+            self._pending += data
+            if len(self._pending) < 4:
+                return
+            data, self._pending = self._pending, b""
+            self._first = bytes(data[:4])
+            self._header = parse_header(self._first)
+            if self._header is None:
+                logger.warning("MP3 の先頭がフレームヘッダーではないため Xing / Info ヘッダーを付けません")
+                self._synced = False
+            else:
+                placeholder = _info_frame(self._first, self._header, self._tag)
+                self._file.write(placeholder)
+                self._info_len = len(placeholder)
+                self.bytes_written += self._info_len
+        if self._synced:
+            self._index(data)
+        self._file.write(data)
+        self._audio_bytes += len(data)
+        self.bytes_written += len(data)
+
+    def _index(self, data: bytes) -> None:
+        """*data* に含まれるフレームの開始位置を記録する（ヘッダーがチャンクをまたいでもよい）。"""
+        buf = self._tail + data
+        base = self._audio_bytes - len(self._tail)
+        pos = self._next - base
+        while pos + 4 <= len(buf):
+            header = parse_header(buf, pos)
+            if header is None:
+                logger.warning("MP3 フレームの位置を見失いました (%d bytes)。TOC は作成しません", base + pos)
+                self._synced = False
+                return
+            self._offsets.append(base + pos)
+            pos += header.length
+        self._next = base + pos
+        self._tail = buf[pos:] if pos < len(buf) else b""
+
+    @property
+    def frames(self) -> int:
+        return len(self._offsets)
+
+    def finish(self) -> None:
+        """保留中のデータを書き出し、先頭の Xing / Info ヘッダーを完成させる。
+
+        ファイルの位置は末尾に戻す。
+        """
+        if self._pending:
+            self._file.write(self._pending)
+            self.bytes_written += len(self._pending)
+            self._pending = b""
+        if self._header is None or not self._synced or not self._offsets:
+            return
+        frames = len(self._offsets)
+        total = self.bytes_written
+        toc = bytes(
+            min(255, (self._info_len + self._offsets[min(frames - 1, i * frames // _TOC_ENTRIES)])
+                * 256 // total)
+            for i in range(_TOC_ENTRIES)
+        )
+        end = self._file.tell()
+        self._file.seek(end - total)
+        self._file.write(_info_frame(self._first, self._header, self._tag, frames, total, toc))
+        self._file.seek(end)
+
+
+def read_info(path: str, size: int) -> Optional[tuple[int, int, float]]:
+    """MP3 の先頭だけを読んで (サンプルレート, チャンネル数, 秒数) を返す。
+
+    Xing / Info ヘッダーがあればそのフレーム数から、無ければビットレート（CBR とみなす）から
+    秒数を求める。
+    """
+    with open(path, "rb") as f:
+        head = f.read(10)
+        offset = 0
+        if head[:3] == b"ID3" and len(head) == 10:
+            offset = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9])
+        f.seek(offset)
+        buf = f.read(_SCAN_BYTES)
+
+    for i in range(len(buf) - 3):
+        header = parse_header(buf, i)
+        if header is None:
+            continue
+        tag = i + 4 + header.side_info
+        if buf[tag:tag + 4] in (b"Xing", b"Info") and len(buf) >= tag + 12:
+            flags, frames = struct.unpack(">II", buf[tag + 4:tag + 12])
+            if flags & _FLAG_FRAMES:
+                return header.samplerate, header.channels, frames * header.samples / header.samplerate
+        return header.samplerate, header.channels, (size - offset - i) * 8 / header.bitrate
+    return None
+
+
+# ---------- フレーム単位の分割と継ぎ合わせ ----------
+
+class SideInfo(NamedTuple):
+    main_data_begin: int
+    main_data_len: int
+    # 最後のグラニュールの (ブロックタイプ, mixed_block_flag) をチャンネルごとに
+    windows: tuple
+
+
+class _Bits:
+    def __init__(self, data: bytes) -> None:
+        self._value = int.from_bytes(data, "big")
+        self._left = len(data) * 8
+
+    def take(self, n: int) -> int:
+        self._left -= n
+        return (self._value >> self._left) & ((1 << n) - 1)
+
+
+def _payload_start(frame, header: FrameHeader) -> int:
+    """メインデータ（ビットリザーバー）の領域の開始位置（ヘッダー・CRC・サイド情報の直後）。"""
+    return 4 + (0 if frame[1] & 1 else 2) + header.side_info
+
+
+def side_info(frame, header: FrameHeader) -> SideInfo:
+    """フレームのサイド情報から、継ぎ合わせに必要な値だけを取り出す。"""
+    start = 4 if frame[1] & 1 else 6
+    bits = _Bits(bytes(frame[start:start + header.side_info]))
+    channels = header.channels
+    if header.mpeg1:
+        main_data_begin = bits.take(9)
+        bits.take((5 if channels == 1 else 3) + 4 * channels)
+        granules = 2
+    else:
+        main_data_begin = bits.take(8)
+        bits.take(1 if channels == 1 else 2)
+        granules = 1
+    total_bits = 0
+    windows: list = []
+    for _gr in range(granules):
+        windows = []
+        for _ch in range(channels):
+            total_bits += bits.take(12)
+            bits.take(9 + 8 + (4 if header.mpeg1 else 9))
+            if bits.take(1):
+                block_type = bits.take(2)
+                mixed = bits.take(1)
+                bits.take(10 + 9)
+            else:
+                block_type, mixed = 0, 0
+                bits.take(15 + 7)
+            bits.take(3 if header.mpeg1 else 2)
+            windows.append((block_type, mixed))
+    return SideInfo(main_data_begin, (total_bits + 7) // 8, tuple(windows))
+
+
+def split_frames(data: bytes) -> list[bytearray]:
+    """lameenc の出力（フレームだけが並んだもの）をフレームごとの bytearray に分ける。"""
+    frames = []
+    pos = 0
+    while pos < len(data):
+        header = parse_header(data, pos)
+        if header is None or pos + header.length > len(data):
+            raise ValueError(f"MP3 フレームの位置を見失いました ({pos} bytes)")
+        frames.append(bytearray(data[pos:pos + header.length]))
+        pos += header.length
+    return frames
+
+
+def _tail_spans(frames: list, end: int, size: int) -> list[tuple[int, int, int]]:
+    """frames[end] の直前にあるメインデータ領域の末尾 *size* バイトを (フレーム, 開始, 終了) で返す。"""
+    spans = []
+    i = end - 1
+    while size > 0:
+        if i < 0:
+            raise ValueError("ビットリザーバーの領域が足りません")
+        frame = frames[i]
+        take = min(size, len(frame) - _payload_start(frame, parse_header(frame)))
+        spans.append((i, len(frame) - take, len(frame)))
+        size -= take
+        i -= 1
+    spans.reverse()
+    return spans
+
+
+def splice(head: list[bytearray], tail: list[bytearray], shift: int, candidates) -> Optional[int]:
+    """同じ PCM を別々のエンコーダーで符号化した 2 つのフレーム列を継ぎ合わせる位置を探す。
+
+    head[i] と tail[i - shift] が同じ時刻のフレームであること（フレーム境界で揃えて
+    エンコードしたこと）を前提に、*candidates* の i のうち次の条件を満たす最初の位置を返す。
+
+    - head[i - 1] と tail[i - shift - 1] の最後のグラニュールのブロックタイプが同じ
+      （窓の重なりが継ぎ目の前後で一致する）
+    - tail[i - shift] がビットリザーバーから参照するバイト数が、head[i - 1] までのメインデータの
+      後ろの空きに収まる
+
+    見つかった場合は参照されるバイトを head 側の空きへ写し（head を書き換える）、
+    head[:i] + tail[i - shift:] が正しいフレーム列になる。見つからなければ None を返す。
+    """
+    for i in candidates:
+        j = i - shift
+        if not (0 < i < len(head) and 0 < j < len(tail)):
+            continue
+        prev_header = parse_header(head[i - 1])
+        prev = side_info(head[i - 1], prev_header)
+        if prev.windows != side_info(tail[j - 1], parse_header(tail[j - 1])).windows:
+            continue
+        need = side_info(tail[j], parse_header(tail[j])).main_data_begin
+        free = len(head[i - 1]) - _payload_start(head[i - 1], prev_header) + prev.main_data_begin \
+            - prev.main_data_len
+        if need > free:
+            continue
+        try:
+            src = _tail_spans(tail, j, need)
+            dst = _tail_spans(head, i, need)
+        except ValueError:
+            continue
+        reservoir = b"".join(bytes(tail[k][s:e]) for k, s, e in src)
+        pos = 0
+        for k, s, e in dst:
+            head[k][s:e] = reservoir[pos:pos + e - s]
+            pos += e - s
+        return i
+    return None
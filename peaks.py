@@ -0,0 +1,158 @@
+"""録音の波形概要（ピーク・RMS）のサイドカー。
+
+レビュー用のツールが長い録音の波形を表示するたびに MP3 全体をデコードしなくて済むよう、
+エンコードする PCM から一定サンプル数ごとの最小値・最大値・RMS を求めて
+<録音名>.peaks に保存する。解像度は 1 点 _BASE_SAMPLES サンプルから _LEVEL_FACTOR 倍ずつ
+粗くした _LEVELS 段で、表示の幅に合った段をそのまま読めばよい。
+
+- 録音中はブロックごとに reshape して min / max / 二乗和をまとめて求める（ループしない）
+- 粗い段は細かい段から np.minimum.reduceat などで求める
+- 無音の短縮・モノラル化の後の PCM（MP3 と同じ時間軸）から計算する
+
+ファイル形式:
+    マジック (8 bytes) + ヘッダー長 (uint32 LE) + JSON ヘッダー + 各段のデータ
+    ヘッダー: {"version", "sample_rate", "channels", "frames",
+              "levels": [{"samples_per_point", "points", "offset"}, ...]}
+    各段のデータ: 1 点あたり int16 LE × 3（最小値・最大値・RMS、全チャンネルをまとめた値）
+    offset はデータ部分（JSON ヘッダーの直後）の先頭からのバイト位置
+"""
+
+import json
+import logging
+import os
+import struct
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PEAKS_SUFFIX = ".peaks"
+_MAGIC = b"CHPEAK\x00\x01"
+# 最も細かい段の 1 点あたりのサンプル数、段ごとの倍率と段数
+_BASE_SAMPLES = 2048
+_LEVEL_FACTOR = 8
+_LEVELS = 4
+_POINT_DTYPE = np.dtype([("min", "<i2"), ("max", "<i2"), ("rms", "<i2")])
+
+
+class PeakTracker:
+    """int16 の PCM ブロックを順に受け取り、最も細かい段の最小値・最大値・二乗和を蓄積する。"""
+
+    def __init__(self, sample_rate: int, base_samples: int = _BASE_SAMPLES) -> None:
+        self.sample_rate = sample_rate
+        self.base_samples = base_samples
+        self.frames = 0
+        self.channels: Optional[int] = None
+        self._carry: Optional[np.ndarray] = None
+        self._mins: list[np.ndarray] = []
+        self._maxs: list[np.ndarray] = []
+        self._sumsq: list[np.ndarray] = []
+        self._counts: list[np.ndarray] = []
+
+    def process(self, block: np.ndarray) -> None:
+        if not len(block):
+            return
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        self.channels = block.shape[1]
+        self.frames += len(block)
+        if self._carry is not None:
+            block = np.concatenate((self._carry, block))
+            self._carry = None
+        full = len(block) // self.base_samples
+        if full:
+            self._reduce(block[: full * self.base_samples].reshape(full, -1))
+        rest = block[full * self.base_samples:]
+        if len(rest):
+            self._carry = rest.copy()
+
+    def _reduce(self, points: np.ndarray) -> None:
+        """(点数, サンプル数) の配列を点ごとにまとめる。"""
+        self._mins.append(points.min(axis=1))
+        self._maxs.append(points.max(axis=1))
+        samples = points.astype(np.float32)
+        self._sumsq.append(np.einsum("ij,ij->i", samples, samples).astype(np.float64))
+        self._counts.append(np.full(len(points), points.shape[1], dtype=np.int64))
+
+    def finish(self) -> None:
+        """末尾の半端な区間を 1 点として確定する。"""
+        if self._carry is not None:
+            self._reduce(self._carry.reshape(1, -1))
+            self._carry = None
+
+    def levels(self) -> list[tuple[int, np.ndarray]]:
+        """(1 点あたりのサンプル数, 点の配列) を細かい段から順に返す。"""
+        self.finish()
+        if not self._mins:
+            return []
+        mins = np.concatenate(self._mins)
+        maxs = np.concatenate(self._maxs)
+        sumsq = np.concatenate(self._sumsq)
+        counts = np.concatenate(self._counts)
+        result = []
+        samples_per_point = self.base_samples
+        for level in range(_LEVELS):
+            if level:
+                starts = np.arange(0, len(mins), _LEVEL_FACTOR)
+                mins = np.minimum.reduceat(mins, starts)
+                maxs = np.maximum.reduceat(maxs, starts)
+                sumsq = np.add.reduceat(sumsq, starts)
+                counts = np.add.reduceat(counts, starts)
+                samples_per_point *= _LEVEL_FACTOR
+            points = np.empty(len(mins), dtype=_POINT_DTYPE)
+            points["min"] = mins
+            points["max"] = maxs
+            points["rms"] = np.minimum(np.sqrt(sumsq / counts), 32767)
+            result.append((samples_per_point, points))
+            if len(mins) == 1:
+                break
+        return result
+
+
+def peaks_path(mp3_path: str) -> str:
+    return os.path.splitext(mp3_path)[0] + PEAKS_SUFFIX
+
+
+def write_peaks(mp3_path: str, tracker: PeakTracker) -> Optional[str]:
+    """*tracker* の内容を MP3 の隣に書き出し、そのパスを返す（音声が無ければ書かない）。"""
+    levels = tracker.levels()
+    if not levels:
+        return None
+    header = {
+        "version": 1,
+        "sample_rate": tracker.sample_rate,
+        "channels": tracker.channels,
+        "frames": tracker.frames,
+        "levels": [],
+    }
+    offset = 0
+    for samples_per_point, points in levels:
+        header["levels"].append({"samples_per_point": samples_per_point, "points": len(points),
+                                 "offset": offset})
+        offset += points.nbytes
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    path = peaks_path(mp3_path)
+    with open(path + ".tmp", "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for _samples_per_point, points in levels:
+            f.write(points.tobytes())
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def read_peaks(path: str) -> dict:
+    """write_peaks() のファイルを読み込み、ヘッダーの各段に "data" (min / max / rms の配列) を付けて返す。"""
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"波形サイドカーではありません: {path}")
+        (header_len,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    data_start = len(_MAGIC) + 4 + header_len
+    for level in header["levels"]:
+        level["data"] = np.fromfile(path, dtype=_POINT_DTYPE, count=level["points"],
+                                    offset=data_start + level["offset"])
+    return header
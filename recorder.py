@@ -3,85 +3,529 @@
 VoiceMeeter Output からオペレーター＋相手の両方の音声をキャプチャし、
 MP3 形式で保存する。
 
-- run(number): 録音を開始し、停止シグナルファイルまたは安全上限まで録音を継続
-- stop(): 停止シグナルファイルを作成して録音プロセスを終了させる
+- run(number): 録音を開始し、停止要求または安全上限まで録音を継続
+- CaptureThread: 着信処理と同じプロセスの録音スレッド。ミュート前からプリロール
+  （直近数秒の保持）を始め、commit() で同じストリームのまま録音に切り替える
+- stop(session, number): 録音に停止を要求し、保存結果（パス・録音時間・サイズ）を受け取る
+- status(): 録音中のセッションの状態を問い合わせる
+  （stop / status の本体は依存ライブラリの無い recording_control.py にある）
+- recover(): 異常終了した録音のジャーナルから MP3 を復旧する
+
+録音はセッション（sessions.py）として登録され、複数の録音を同時に行える。
+各録音はセッションごとのコントロールチャンネルで停止要求と状態問い合わせを受け付ける
+（停止シグナルファイルによる方式はフォールバックとして残している）。
+同じプロセス内の同時録音は 1 つの録音ストリームを共有する。
+
+既定ではストリーミングモードで動作し、録音コールバックが事前確保したリングバッファへ
+書き込んだ音声を、ライタースレッドが逐次 MP3 にエンコードしてファイルへ追記する。
+（config.ini の streaming_encode = false では WAV に録音し、変換ワーカーで MP3 化する）
+あわせて PCM をジャーナル（journal.py）に追記し、プロセスが異常終了しても音声を失わない。
+コールバックが間に合わずに欠けたサンプルは無音で補い、音切れ・クリップの集計を
+録音ごとの .health.json に保存する（health.py）。
 """
 
 import logging
 import os
 import sys
+import threading
 import time
 from datetime import datetime
+from typing import Callable
 
 import numpy as np
-import lameenc
-import sounddevice as sd
-import soundfile as sf
 
-from audio_devices import find_input_device
-from config_loader import load_config, _base_dir
+import catalog
+import ipc
+import metrics
+import sessions
+from analysis import EncodeSettings, RecordingEncoder, sidecar_path, write_sidecar
+from audio_backend import CallbackStatusLog, get_backend
+from audio_devices import find_input_device, get_registry
+from config_loader import Settings, get_settings
+from health import CaptureHealth, GapDetector, write_health
+from journal import Journal, recover as journal_recover
+from mp3frames import Mp3Writer
+from peaks import peaks_path, write_peaks
+from recording_control import STOP_TIMEOUT_SEC, status, stop
+from ringbuffer import AudioRingBuffer
 
 logger = logging.getLogger(__name__)
 
-# シグナルファイル名（EXE ディレクトリに作成）
-_PID_FILE = ".recording.pid"
-_STOP_FILE = ".stop_recording"
+# 停止シグナルファイルの確認間隔（秒）。通常はコントロールチャンネルで即時に停止する
+_SIGNAL_POLL_SEC = 1.0
 
 # 録音パラメータ
 _CHANNELS = 2  # ステレオ（デバイスが対応しない場合は自動調整）
 _DTYPE = "int16"
 
+# 録音コールバックとライタースレッドの間のリングバッファ容量（秒）
+_RING_SECONDS = 30
+# ライタースレッドが一度にシンクへ渡す最大フレーム数（秒）
+_WRITE_BLOCK_SECONDS = 1
+# プリロール中に録音開始（commit）を待つ上限（秒）
+_PRE_ROLL_TIMEOUT_SEC = 60
 
-def _pcm_to_mp3(pcm_data: bytes, sample_rate: int, channels: int) -> bytes:
-    """lameenc を使って PCM バイト列 → MP3 バイト列に変換する（ffmpeg 不要）。"""
-    encoder = lameenc.Encoder()
-    encoder.set_bit_rate(128)
-    encoder.set_in_sample_rate(sample_rate)
-    encoder.set_channels(channels)
-    encoder.set_quality(2)  # 0=best, 9=fastest
 
-    mp3_data = encoder.encode(pcm_data)
-    mp3_data += encoder.flush()
-    return mp3_data
+class _Mp3Sink:
+    """ブロックを 1 つの lameenc.Encoder で逐次エンコードし、MP3 ファイルへ追記するシンク。
 
+    録音終了まで同じエンコーダーを使い続けるため、停止時に残る処理は flush と
+    先頭の Xing / Info ヘッダー（シーク用 TOC）の書き込みのみとなる。
+    無音の短縮・モノラル化・VBR は [recording] の設定（analysis.EncodeSettings）に従う。
+    """
+
+    name = "mp3"
+    required = True
+
+    def __init__(self, mp3_path: str, sample_rate: int, channels: int,
+                 settings: EncodeSettings | None = None) -> None:
+        self.mp3_path = mp3_path
+        self._encoder = RecordingEncoder(sample_rate, channels, settings)
+        self._file = open(mp3_path, "wb")
+        self._writer = Mp3Writer(self._file, vbr=self._encoder.settings.vbr)
+
+    @property
+    def bytes_written(self) -> int:
+        return self._writer.bytes_written
+
+    def _write(self, mp3_data: bytes) -> None:
+        self._writer.write(mp3_data)
+
+    @property
+    def channels(self) -> int:
+        """MP3 のチャンネル数（モノラル化した場合は 1）。"""
+        return self._encoder.channels_out or self._encoder.channels_in
+
+    def write(self, block: np.ndarray) -> None:
+        self._write(self._encoder.encode(block))
+
+    def close(self) -> None:
+        try:
+            self._write(self._encoder.flush())
+            self._writer.finish()
+            self._file.flush()
+        finally:
+            self._file.close()
+        sidecar = self._encoder.sidecar()
+        if sidecar is not None:
+            write_sidecar(self.mp3_path, sidecar)
+        if self._encoder.peaks is not None:
+            write_peaks(self.mp3_path, self._encoder.peaks)
+
+    def abort(self) -> None:
+        self._file.close()
+
+
+class _WavSink:
+    """従来モード用: ブロックを WAV ファイルへ逐次書き込むシンク。
+
+    書き込み中は .part の名前で保存し、閉じたときに .wav へリネームする。
+    MP3 への変換はバックグラウンドの変換ワーカー（transcoder.py）が行う。
+    """
+
+    name = "wav"
+    required = True
+
+    def __init__(self, wav_path: str, sample_rate: int, channels: int) -> None:
+        import soundfile as sf
+
+        self.wav_path = wav_path
+        self._tmp_path = wav_path + ".part"
+        self._file = sf.SoundFile(self._tmp_path, "w", samplerate=sample_rate, channels=channels,
+                                  format="WAV", subtype="PCM_16")
+
+    def write(self, block: np.ndarray) -> None:
+        self._file.write(block)
+
+    def close(self) -> None:
+        self._file.close()
+        os.replace(self._tmp_path, self.wav_path)
+
+    def abort(self) -> None:
+        self._file.close()
+
+
+class _JournalSink:
+    """ブロックをクラッシュ対策のジャーナルへ追記するシンク。
+
+    ジャーナルの書き込み失敗（ディスク不足など）で録音自体を止めないよう、
+    失敗した時点でジャーナルへの書き込みだけを打ち切る。
+    """
+
+    name = "journal"
+    required = False
+
+    def __init__(self, journal: Journal) -> None:
+        self.journal = journal
+
+    def write(self, block: np.ndarray) -> None:
+        self.journal.append(block)
+
+    def close(self) -> None:
+        self.journal.close()
+
+    def abort(self) -> None:
+        try:
+            self.journal.close()
+        except OSError:
+            pass
+
+
+class _HealthSink:
+    """ブロックの 1 秒ごとのレベル・クリップ数を集計するシンク（health.CaptureHealth）。"""
+
+    name = "health"
+    required = False
+
+    def __init__(self, health: CaptureHealth) -> None:
+        self.health = health
+
+    def write(self, block: np.ndarray) -> None:
+        self.health.process(block)
+
+    def close(self) -> None:
+        pass
 
-def _signal_path(filename: str) -> str:
-    """EXE（またはスクリプト）ディレクトリ内のシグナルファイルパスを返す。"""
-    return os.path.join(_base_dir(), filename)
+    def abort(self) -> None:
+        pass
 
 
-def run(number: str | None = None) -> None:
+class _CaptureWriter:
+    """リングバッファから読み出したブロックを専用スレッドで各シンクへ書き込むライター。
+
+    録音コールバックは ring.write() で事前確保したバッファへコピーするだけで、
+    エンコード・ファイル書き込みはすべてライタースレッドが行う。
+    シンクにはリングバッファ内のビューを渡すため、録音全体を結合し直すことはない。
+    """
+
+    def __init__(self, ring: AudioRingBuffer, sinks: list, block_frames: int) -> None:
+        self.ring = ring
+        self.frames_written = 0
+        # シンクごとの書き込み時間（ミリ秒）。メトリクスに記録する
+        self.sink_ms: dict[str, float] = {sink.name: 0.0 for sink in sinks}
+        self._sinks = list(sinks)
+        self._block_frames = block_frames
+        self._stopping = threading.Event()
+        self._error: BaseException | None = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _write(self, block: np.ndarray) -> None:
+        for sink in list(self._sinks):
+            t0 = time.perf_counter()
+            try:
+                sink.write(block)
+                self.sink_ms[sink.name] += (time.perf_counter() - t0) * 1000
+            except Exception:
+                if sink.required:
+                    raise
+                logger.exception("%s への書き込みに失敗しました（以降は書き込みません）",
+                                 type(sink).__name__)
+                sink.abort()
+                self._sinks.remove(sink)
+        self.frames_written += block.shape[0]
+
+    def _drain(self) -> None:
+        """リングバッファにあるデータをすべてシンクへ書き込む。"""
+        while True:
+            views = self.ring.peek(self._block_frames)
+            if not views:
+                return
+            frames = 0
+            for view in views:
+                if self._error is None:
+                    self._write(view)
+                frames += len(view)
+            self.ring.consume(frames)
+
+    def _run(self) -> None:
+        try:
+            while not self._stopping.is_set():
+                if self.ring.wait(0.2):
+                    self._drain()
+            self._drain()
+        except BaseException as e:
+            self._error = e
+            # エラー後もコールバックが詰まらないよう読み捨てる
+            while not self._stopping.wait(0.2):
+                self.ring.consume(self.ring.available())
+
+    def close(self) -> None:
+        """残りのブロックを書き込み、各シンクを閉じる（MP3 は flush される）。
+
+        ライタースレッドでエラーが発生していた場合はここで再送出する。
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        self._thread.join()
+        for sink in self._sinks:
+            if self._error is None:
+                try:
+                    sink.close()
+                    continue
+                except Exception as e:
+                    if sink.required:
+                        self._error = e
+                    else:
+                        logger.exception("%s のクローズに失敗しました", type(sink).__name__)
+            sink.abort()
+        if self._error is not None:
+            raise self._error
+
+
+class _ControlChannel:
+    """録音プロセスのコントロールチャンネル（停止要求・状態問い合わせ）。
+
+    stop を受けると停止イベントをセットし、録音の保存が完了するまで待ってから
+    最終結果（ファイルパス・録音時間・バイト数）を応答する。
+    """
+
+    def __init__(self, channel: str, stop_event: threading.Event, status: Callable[[], dict]) -> None:
+        self.channel = channel
+        self.stop_event = stop_event
+        self._status = status
+        self._finished = threading.Event()
+        self._result: dict = {}
+        self._server: ipc.Server | None = None
+
+    def start(self) -> None:
+        try:
+            self._server = ipc.Server(self.channel, self._handle)
+            self._server.start()
+        except OSError:
+            logger.warning("コントロールチャンネルを開けませんでした（停止シグナルファイルで待機します）",
+                           exc_info=True)
+
+    def _handle(self, message: dict) -> dict:
+        command = message.get("command")
+        if command == "status":
+            return {"ok": True, **self._status()}
+        if command == "stop":
+            logger.info("コントロールチャンネルで停止要求を受信しました")
+            self.stop_event.set()
+            if not self._finished.wait(STOP_TIMEOUT_SEC):
+                return {"ok": False, "error": "録音の保存が時間内に完了しませんでした"}
+            return {"ok": True, **self._result}
+        return {"ok": False, "error": f"不明なコマンドです: {command}"}
+
+    def finish(self, result: dict) -> None:
+        """録音の最終結果を確定させ、待機中の停止要求に応答する。"""
+        self._result = result
+        self._finished.set()
+        if self._server is not None:
+            self._server.close(timeout=5.0)
+
+
+class _SharedInput:
+    """1 つの録音ストリームを複数の録音で共有する（ファンアウト）。
+
+    同じデバイス・サンプルレート・チャンネル数の録音が同時に行われる場合、
+    デバイスを開くのは最初の録音だけにし、コールバックで各録音のリングバッファへ書き込む。
+    購読者の一覧はコールバックがロック無しで読めるよう、変更のたびにタプルを作り直す。
+    欠落の検出（health.GapDetector）もストリームごとに 1 回だけ行い、各購読者に欠けた
+    フレーム数を渡す。
+    """
+
+    _instances: dict[tuple, "_SharedInput"] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, key: tuple, device_index: int, sample_rate: int, channels: int) -> None:
+        self._key = key
+        self._subscribers: tuple["_InputCapture", ...] = ()
+        # status のログは購読者ごとではなくストリームごとにまとめて出す
+        self._status_log = CallbackStatusLog("録音コールバック")
+        self._gaps = GapDetector(sample_rate)
+        self._stream = get_backend().input_stream(
+            samplerate=sample_rate,
+            channels=channels,
+            dtype=_DTYPE,
+            device=device_index,
+            callback=self._callback,
+        )
+
+    def _callback(self, indata, frames, time_info, status) -> None:
+        missing = self._gaps.check(time_info.inputBufferAdcTime, frames)
+        if status:
+            self._status_log.add(status)
+        if missing:
+            self._status_log.add("input gap (無音で補完)")
+        for subscriber in self._subscribers:
+            subscriber.deliver(indata, status, missing)
+
+    @classmethod
+    def subscribe(cls, capture: "_InputCapture", device_index: int, sample_rate: int,
+                  channels: int) -> "_SharedInput":
+        """*capture* を購読者に加える。デバイスがまだ開かれていなければ開く。"""
+        key = (get_backend().name, device_index, sample_rate, channels)
+        with cls._lock:
+            shared = cls._instances.get(key)
+            if shared is None:
+                shared = cls(key, device_index, sample_rate, channels)
+                shared._stream.__enter__()
+                cls._instances[key] = shared
+            else:
+                logger.info("録音ストリームを共有します (デバイス %d, 録音 %d 件目)",
+                            device_index, len(shared._subscribers) + 1)
+            shared._subscribers = shared._subscribers + (capture,)
+        return shared
+
+    def unsubscribe(self, capture: "_InputCapture") -> None:
+        """*capture* を購読者から外す。最後の購読者であればストリームを閉じる。"""
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not capture)
+            if self._subscribers:
+                return
+            del self._instances[self._key]
+        self._stream.__exit__(None, None, None)
+        self._status_log.flush()
+
+
+class _InputCapture:
+    """録音ストリームの購読と、録音コールバックが書き込むリングバッファ。
+
+    プリロール（録音開始前に直近の数秒だけを保持する状態）から録音終了まで
+    同じストリーム・同じリングバッファを使い続けるため、引き継ぎで音声が途切れない。
+    """
+
+    def __init__(self, call: metrics.CallMetrics, device_index: int, sample_rate: int,
+                 channels: int) -> None:
+        self.ring = AudioRingBuffer(sample_rate * _RING_SECONDS, channels, _DTYPE)
+        self.health = CaptureHealth(sample_rate, channels)
+        self._call = call
+        self._device = (device_index, sample_rate, channels)
+        self._shared: _SharedInput | None = None
+
+    def deliver(self, indata, status, missing: int = 0) -> None:
+        """共有ストリームのコールバックから呼ばれる。
+
+        *missing* はこのブロックの前に欠けていたフレーム数で、その分の無音を先に書き込む。
+        """
+        if status:
+            self._call.count("callback_status")
+        overflow = bool(status) and getattr(status, "input_overflow", False)
+        if missing or overflow:
+            self.health.note(self.ring.written_frames, missing, overflow)
+        if missing:
+            self.ring.write_silence(missing)
+        self.ring.write(indata)
+
+    def open(self) -> None:
+        self._shared = _SharedInput.subscribe(self, *self._device)
+
+    def close(self) -> None:
+        if self._shared is not None:
+            shared, self._shared = self._shared, None
+            shared.unsubscribe(self)
+
+
+class CaptureThread(threading.Thread):
+    """着信処理と同じプロセスで録音する録音スレッド。
+
+    start() で録音ストリームを開いてプリロールを始め（直近 pre_roll_sec 秒だけを保持）、
+    commit() で保存を開始する。保存はプリロールで保持していた音声から続けて行うため、
+    ガイダンス再生の冒頭から途切れずに録音される。
+    commit() の前に cancel() した場合は何も保存せずに終了する。
+    """
+
+    def __init__(self, number: str | None = None, output_folder: str | None = None,
+                 pre_roll_sec: float | None = None) -> None:
+        super().__init__(name="recorder", daemon=True)
+        self.number = number
+        self.output_folder = output_folder
+        self.pre_roll_sec = pre_roll_sec
+        self.stop_event = threading.Event()
+        self._commit = threading.Event()
+
+    def run(self) -> None:
+        try:
+            run(number=self.number, stop_event=self.stop_event, output_folder=self.output_folder,
+                commit_event=self._commit, pre_roll_sec=self.pre_roll_sec)
+        except Exception:
+            logger.exception("録音中に予期しないエラーが発生しました")
+
+    def commit(self) -> None:
+        """プリロールから録音（保存）に切り替える。"""
+        self._commit.set()
+
+    def cancel(self) -> None:
+        """録音を取り消す（commit() 後であれば通常の停止と同じく保存して終了する）。"""
+        self.stop_event.set()
+
+
+def run(
+    number: str | None = None,
+    stop_event: threading.Event | None = None,
+    output_folder: str | None = None,
+    commit_event: threading.Event | None = None,
+    pre_roll_sec: float | None = None,
+) -> None:
     """録音メイン処理。
 
     VoiceMeeter Output から音声をキャプチャし、MP3 形式で保存する。
-    音声データはメモリにバッファリングし、録音停止後に一括で変換・保存する。
+    ストリーミングモードでは録音中に逐次エンコードし、停止時は flush のみ行う。
+    従来モードでは WAV に書き出し、MP3 変換は変換ワーカーに引き渡してすぐ終了する。
 
     Parameters
     ----------
     number : str | None
         電話番号（ファイル名に使用）。
+    stop_event : threading.Event | None
+        同一プロセス内から録音を停止するためのイベント（常駐デーモン用）。
+        コントロールチャンネル・停止シグナルファイルによる停止も引き続き有効。
+    output_folder : str | None
+        保存先フォルダ（省略時は config.ini の output_folder。シミュレーション用）。
+    commit_event : threading.Event | None
+        指定した場合、ストリームを開いたあとプリロールしながらこのイベントを待ち、
+        セットされてから保存を開始する（CaptureThread 用）。
+    pre_roll_sec : float | None
+        プリロールで保持する秒数（省略時は config.ini の pre_roll_sec）。
     """
-    config = load_config()
+    if stop_event is None:
+        stop_event = threading.Event()
+    with metrics.call("record", number=number) as call:
+        _record(call, number, stop_event, output_folder, commit_event, pre_roll_sec)
+
+
+def _wait_commit(commit_event: threading.Event, stop_event: threading.Event) -> bool:
+    """プリロール中に録音開始（True）か取り消し・タイムアウト（False）を待つ。"""
+    deadline = time.monotonic() + _PRE_ROLL_TIMEOUT_SEC
+    while not commit_event.wait(0.05):
+        if stop_event.is_set():
+            logger.info("録音開始前に取り消されました")
+            return False
+        if time.monotonic() >= deadline:
+            logger.warning("録音開始の指示が %d 秒以内に無かったため取り消します", _PRE_ROLL_TIMEOUT_SEC)
+            return False
+    return True
+
+
+def _record(call: metrics.CallMetrics, number: str | None, stop_event: threading.Event,
+            output_folder: str | None, commit_event: threading.Event | None,
+            pre_roll_sec: float | None) -> None:
+    settings = get_settings()
 
     # --- 設定読み込み ---
-    output_folder = config.get("recording", "output_folder", fallback="D:\\CallRecordings")
-    device_name = config.get("recording", "recording_device", fallback="VoiceMeeter Output")
-    max_duration_min = config.getint("recording", "max_duration_minutes", fallback=120)
-    max_duration_sec = max_duration_min * 60
-
-    # --- 出力フォルダの作成 ---
-    os.makedirs(output_folder, exist_ok=True)
+    device_name = settings.recording_device
+    if pre_roll_sec is None:
+        pre_roll_sec = settings.pre_roll_sec
 
     # --- 録音デバイスの検索 ---
-    device_index = find_input_device(device_name)
+    with call.span("device_lookup"):
+        device_index = find_input_device(device_name)
     if device_index is None:
         logger.error("録音デバイス '%s' が見つかりません。録音を中止します。", device_name)
+        call.status = "no-device"
         return
 
     # --- デバイス情報の自動検出 ---
-    dev_info = sd.query_devices(device_index)
-    hostapis = sd.query_hostapis()
-    api_name = hostapis[dev_info["hostapi"]]["name"] if dev_info.get("hostapi") is not None else "unknown"
+    registry = get_registry()
+    dev_info = registry.device(device_index)
+    api_name = registry.hostapi_name(device_index)
     max_ch = dev_info["max_input_channels"]
     channels = min(_CHANNELS, max_ch) if max_ch > 0 else _CHANNELS
     sample_rate = int(dev_info["default_samplerate"])
@@ -89,165 +533,286 @@ def run(number: str | None = None) -> None:
     logger.info("録音チャンネル数: %d (デバイス最大: %d)", channels, max_ch)
     logger.info("録音サンプルレート: %d Hz (デバイスデフォルト)", sample_rate)
 
-    # --- ファイル名の決定 ---
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    number_part = f"_{number}" if number else ""
-    base_name = f"recording_{timestamp}{number_part}"
-    wav_path = os.path.join(output_folder, f"{base_name}.wav")
-    mp3_path = os.path.join(output_folder, f"{base_name}.mp3")
+    # --- 録音ストリームを開く（プリロール中は直近 pre_roll_sec 秒だけを保持） ---
+    capture = _InputCapture(call, device_index, sample_rate, channels)
+    if commit_event is not None:
+        capture.ring.keep_latest(int(pre_roll_sec * sample_rate))
+    try:
+        with call.span("stream_open"):
+            capture.open()
+    except Exception:
+        logger.exception("録音ストリームを開けませんでした: デバイス=[%d] %s", device_index, device_name)
+        call.status = "error"
+        return
 
-    # --- PID ファイルの作成 ---
-    pid_path = _signal_path(_PID_FILE)
-    stop_path = _signal_path(_STOP_FILE)
+    try:
+        if commit_event is not None:
+            logger.info("プリロールを開始しました (直近 %.1f 秒を保持)", pre_roll_sec)
+            if not _wait_commit(commit_event, stop_event):
+                call.status = "cancelled"
+                return
+            capture.ring.keep_latest(None)
+            pre_roll_frames = capture.ring.available()
+            call.set("pre_roll_sec", round(pre_roll_frames / sample_rate, 2))
+            logger.info("プリロールから録音に切り替えました (プリロール %.2f 秒分から保存)",
+                        pre_roll_frames / sample_rate)
+        _save(call, capture, settings, number, stop_event, output_folder,
+              device_index, device_name, sample_rate, channels)
+    finally:
+        capture.close()
 
-    # 前回の残留シグナルファイルをクリーンアップ
-    for path in (pid_path, stop_path):
-        if os.path.exists(path):
-            try:
-                os.remove(path)
-            except OSError:
-                pass
 
+def _save(call: metrics.CallMetrics, capture: _InputCapture, settings: Settings, number: str | None,
+          stop_event: threading.Event, output_folder: str | None, device_index: int,
+          device_name: str, sample_rate: int, channels: int) -> None:
+    """開いている録音ストリームの音声を、停止要求または安全上限まで保存する。"""
+    if output_folder is None:
+        output_folder = settings.output_folder
+    max_duration_min = settings.max_duration_minutes
+    max_duration_sec = max_duration_min * 60
+    streaming = settings.streaming_encode
+    use_journal = settings.journal
+    encode_settings = EncodeSettings.from_config(settings.config)
+
+    # --- 出力フォルダの作成 ---
+    os.makedirs(output_folder, exist_ok=True)
+
+    # --- セッションの登録（ファイル名はセッション ID から決める） ---
     try:
-        with open(pid_path, "w", encoding="utf-8") as f:
-            f.write(str(os.getpid()))
-        logger.info("PID ファイルを作成しました: %s (PID=%d)", pid_path, os.getpid())
+        session = sessions.create(
+            number, path_for=lambda sid: os.path.join(output_folder, f"recording_{sid}.mp3")
+        )
     except OSError:
-        logger.exception("PID ファイルの作成に失敗しました")
+        logger.exception("録音セッションを登録できませんでした")
+        call.status = "error"
         return
+    session_id = session.session_id
+    base_name = f"recording_{session_id}"
+    wav_path = os.path.join(output_folder, f"{base_name}.wav")
+    mp3_path = session.path
+    call.set("session", session_id)
+    logger.info("録音セッションを登録しました: %s (PID=%d)", session_id, os.getpid())
 
-    # --- メモリバッファで録音開始 ---
+    # --- 録音開始 ---
     logger.info("録音を開始します: デバイス=[%d] %s", device_index, device_name)
     logger.info("出力先: %s", mp3_path)
     logger.info("安全上限: %d 分", max_duration_min)
-
-    # 音声データをメモリに蓄積（list.append はスレッドセーフ）
-    audio_chunks: list[np.ndarray] = []
-
-    def _audio_callback(indata, frames, time_info, status):
-        if status:
-            logger.warning("録音コールバック status: %s", status)
-        audio_chunks.append(indata.copy())
+    logger.info("エンコード方式: %s", "ストリーミング" if streaming else "一括変換")
+
+    ring = capture.ring
+    health = capture.health if settings.health_report else None
+    # 保存を始めたときのリングバッファ上の位置（欠落の時刻の基準）
+    origin = ring.written_frames - ring.available()
+    writer: _CaptureWriter | None = None
+    health_summary: dict | None = None
+    mp3_sink: _Mp3Sink | None = None
+    wav_sink: _WavSink | None = None
+    journal: Journal | None = None
+    clock = get_backend().clock
+    start_time = clock.time()
+    result = {"session_id": session_id, "status": "error", "path": mp3_path, "duration_sec": 0.0, "bytes": 0}
+
+    def _status() -> dict:
+        frames = writer.frames_written if writer is not None else 0
+        return {
+            "recording": not stop_event.is_set(),
+            "session_id": session_id,
+            "pid": os.getpid(),
+            "number": number,
+            "path": mp3_path,
+            "elapsed_sec": round(clock.time() - start_time, 1),
+            "duration_sec": round(frames / sample_rate, 1),
+            "bytes": mp3_sink.bytes_written if mp3_sink is not None else 0,
+            "ring_high_water": ring.high_water,
+            "dropped_frames": ring.dropped_frames,
+            "xruns": capture.health.xruns,
+        }
+
+    control = _ControlChannel(session.channel, stop_event, _status)
+    control.start()
 
     try:
-        with sd.InputStream(
-            samplerate=sample_rate,
-            channels=channels,
-            dtype=_DTYPE,
-            device=device_index,
-            callback=_audio_callback,
-        ):
-            start_time = time.time()
-            logger.info("録音中... (停止シグナル待機)")
-
-            while True:
-                time.sleep(0.5)
-
-                # 停止シグナルの検出
-                if os.path.exists(stop_path):
-                    logger.info("停止シグナルを検出しました")
-                    break
-
-                # 安全上限チェック
-                elapsed = time.time() - start_time
-                if elapsed >= max_duration_sec:
-                    logger.warning("安全上限 (%d 分) に達したため録音を停止します", max_duration_min)
-                    break
-
-        elapsed_total = time.time() - start_time
+        # --- 書き込み先（シンク）の準備 ---
+        sinks: list = []
+        if use_journal:
+            try:
+                journal = Journal(output_folder, base_name, sample_rate, channels, number)
+                sinks.append(_JournalSink(journal))
+                logger.info("ジャーナル: %s", journal.path)
+            except OSError:
+                logger.warning("ジャーナルを作成できませんでした（ジャーナル無しで録音します）", exc_info=True)
+        if streaming:
+            mp3_sink = _Mp3Sink(mp3_path, sample_rate, channels, encode_settings)
+            sinks.append(mp3_sink)
+            logger.info("エンコード設定: %s", encode_settings.describe())
+        else:
+            # 従来モード: WAV に書き出し、MP3 変換は変換ワーカーに任せる
+            wav_sink = _WavSink(wav_path, sample_rate, channels)
+            sinks.append(wav_sink)
+        if health is not None:
+            sinks.append(_HealthSink(health))
+        writer = _CaptureWriter(ring, sinks, sample_rate * _WRITE_BLOCK_SECONDS)
+        writer.start()
+        logger.info("録音中... (停止要求待機)")
+
+        while True:
+            if stop_event.wait(_SIGNAL_POLL_SEC):
+                logger.info("停止要求を受信しました")
+                break
+
+            # 停止シグナルファイルの検出（フォールバック）
+            if sessions.stop_requested(session_id):
+                logger.info("停止シグナルを検出しました")
+                break
+
+            # 安全上限チェック
+            elapsed = clock.time() - start_time
+            if elapsed >= max_duration_sec:
+                logger.warning("安全上限 (%d 分) に達したため録音を停止します", max_duration_min)
+                break
+
+        capture.close()
+        elapsed_total = clock.time() - start_time
         logger.info("録音を停止しました (録音時間: %.1f 秒)", elapsed_total)
 
-        # --- 音声データの結合 ---
-        if not audio_chunks:
-            logger.warning("録音データが空です")
-            return
-
-        audio_data = np.concatenate(audio_chunks, axis=0)
-        total_samples = audio_data.shape[0]
-        logger.info("録音データ: %d サンプル, shape=%s, dtype=%s",
-                     total_samples, audio_data.shape, audio_data.dtype)
-        logger.info("録音データ値範囲: min=%d, max=%d", audio_data.min(), audio_data.max())
-
-        # --- WAV ファイル保存（soundfile 使用、デバッグ用に残す） ---
-        logger.info("WAV ファイルを保存中: %s", wav_path)
-        sf.write(wav_path, audio_data, sample_rate, subtype='PCM_16')
-        wav_size = os.path.getsize(wav_path)
-        logger.info("WAV ファイルを保存しました: %s (%d bytes)", wav_path, wav_size)
-
-        # --- PCM → MP3 変換（lameenc 使用、ffmpeg 不要） ---
-        logger.info("PCM → MP3 変換中...")
-        pcm_bytes = audio_data.tobytes()
-        logger.info("PCM データサイズ: %d bytes", len(pcm_bytes))
-
-        try:
-            mp3_data = _pcm_to_mp3(pcm_bytes, sample_rate, channels)
-            with open(mp3_path, "wb") as f:
-                f.write(mp3_data)
-            mp3_size = os.path.getsize(mp3_path)
-            logger.info("MP3 ファイルを保存しました: %s (%d bytes)", mp3_path, mp3_size)
-
-            # WAV ファイルを削除（MP3 が正常に保存された場合のみ）
-            os.remove(wav_path)
-            logger.info("WAV ファイルを削除しました: %s", wav_path)
-        except Exception:
-            logger.exception("MP3 変換に失敗しました。WAV ファイルはそのまま残ります: %s", wav_path)
+        # --- 残りのブロックの書き込み（ストリーミングモードでは flush のみ） ---
+        t0 = time.perf_counter()
+        with call.span("finalize"):
+            writer.close()
+        logger.info("書き込みを確定しました (%.0fms)", (time.perf_counter() - t0) * 1000)
+        logger.info("リングバッファ最大使用量: %d フレーム (容量の %.0f%%)",
+                    ring.high_water, ring.high_water * 100 / ring.capacity)
+        if ring.dropped_frames:
+            logger.warning("書き込みが追いつかず %d フレームを破棄しました", ring.dropped_frames)
+
+        if mp3_sink is not None:
+            result = _finish_streaming(mp3_sink, writer.frames_written, sample_rate)
+        else:
+            result = _finish_transcode(wav_sink, mp3_path, writer.frames_written, sample_rate, output_folder)
+        result["session_id"] = session_id
+        if health is not None and writer.frames_written:
+            health_summary = health.summary(origin, ring.dropped_frames)
+            try:
+                write_health(mp3_path, health_summary)
+            except OSError:
+                logger.warning("録音の健全性の集計を保存できませんでした", exc_info=True)
+        with call.span("catalog"):
+            _add_to_catalog(output_folder, result, session, sample_rate,
+                            mp3_sink.channels if mp3_sink is not None else channels)
+
+        # 音声がすべてファイルに保存できた場合のみジャーナルを削除する
+        if journal is not None:
+            if result["status"] != "error":
+                with call.span("journal_discard"):
+                    journal.discard()
+            else:
+                _keep_journal(journal)
+            journal = None
 
     except Exception:
         logger.exception("録音中にエラーが発生しました")
+        capture.close()
+        if writer is not None:
+            try:
+                writer.close()
+            except Exception:
+                logger.exception("録音データの書き込みに失敗しました: %s", mp3_path)
+        if journal is not None:
+            _keep_journal(journal)
     finally:
         # --- クリーンアップ ---
-        for path in (pid_path, stop_path):
-            if os.path.exists(path):
-                try:
-                    os.remove(path)
-                except OSError:
-                    pass
+        call.status = result["status"]
+        call.set("duration_sec", result["duration_sec"])
+        call.set("bytes", result["bytes"])
+        call.set("encode", "streaming" if streaming else "transcode")
+        call.set("ring_high_water", ring.high_water)
+        call.set("dropped_frames", ring.dropped_frames)
+        call.set("xruns", capture.health.xruns)
+        if health_summary is not None:
+            call.set("gap_ms", health_summary["gap_ms_total"])
+            call.set("clipped_pct", health_summary["clipped_pct"])
+        if writer is not None:
+            for name, ms in writer.sink_ms.items():
+                call.add_span(f"sink_{name}", ms)
+        control.finish(result)
+        sessions.remove(session_id)
         logger.info("録音プロセスを終了します")
 
 
-def stop() -> None:
-    """録音停止シグナルを送信し、録音プロセスの終了を待機する。"""
-    pid_path = _signal_path(_PID_FILE)
-    stop_path = _signal_path(_STOP_FILE)
+def _keep_journal(journal: Journal) -> None:
+    """保存に失敗した録音のジャーナルを残し、ロックを解放して復旧の対象にする。"""
+    try:
+        journal.release()
+    except OSError:
+        logger.warning("ジャーナルの確定に失敗しました（確定済みのセグメントまで復旧できます）", exc_info=True)
+    logger.warning("ジャーナルを残しました（--mode=recover で復旧できます）: %s", journal.path)
 
-    # --- PID ファイルの確認 ---
-    if not os.path.exists(pid_path):
-        logger.warning("PID ファイルが見つかりません。録音プロセスが起動していない可能性があります。")
-        return
 
-    try:
-        with open(pid_path, "r", encoding="utf-8") as f:
-            pid = int(f.read().strip())
-        logger.info("録音プロセス PID: %d", pid)
-    except (OSError, ValueError):
-        logger.exception("PID ファイルの読み取りに失敗しました")
+def _add_to_catalog(output_folder: str, result: dict, session: sessions.Session,
+                    sample_rate: int, channels: int) -> None:
+    """保存した録音を録音カタログに登録する（空の録音は登録しない）。"""
+    if result["status"] not in (catalog.OK, catalog.QUEUED, catalog.WAV_FALLBACK):
         return
+    catalog.add(
+        output_folder, result["path"], result["status"],
+        session_id=session.session_id, number=session.number,
+        started_at=session.started_at, ended_at=time.time(),
+        duration_sec=result["duration_sec"], samplerate=sample_rate, channels=channels,
+        size=result["bytes"],
+    )
+
+
+def _finish_streaming(mp3_sink: _Mp3Sink, frames: int, sample_rate: int) -> dict:
+    """ストリーミングモードで書き終えた MP3 の結果を返す。"""
+    if frames == 0:
+        logger.warning("録音データが空です")
+        for path in (mp3_sink.mp3_path, sidecar_path(mp3_sink.mp3_path), peaks_path(mp3_sink.mp3_path)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return {"status": "empty", "path": mp3_sink.mp3_path, "duration_sec": 0.0, "bytes": 0}
+
+    logger.info("MP3 ファイルを保存しました: %s (%d サンプル, %d bytes)",
+                mp3_sink.mp3_path, frames, mp3_sink.bytes_written)
+    return {
+        "status": "ok",
+        "path": mp3_sink.mp3_path,
+        "duration_sec": round(frames / sample_rate, 1),
+        "bytes": mp3_sink.bytes_written,
+    }
+
+
+def _finish_transcode(wav_sink: _WavSink, mp3_path: str, frames: int, sample_rate: int,
+                      output_folder: str) -> dict:
+    """従来モード: 書き終えた WAV の MP3 変換を変換ワーカーに引き渡し、結果を返す。"""
+    wav_path = wav_sink.wav_path
+    if frames == 0:
+        logger.warning("録音データが空です")
+        try:
+            os.remove(wav_path)
+        except OSError:
+            pass
+        return {"status": "empty", "path": mp3_path, "duration_sec": 0.0, "bytes": 0}
+
+    wav_size = os.path.getsize(wav_path)
+    logger.info("WAV ファイルを保存しました: %s (%d bytes)", wav_path, wav_size)
+    result = {"status": "wav-fallback", "path": wav_path,
+              "duration_sec": round(frames / sample_rate, 1), "bytes": wav_size}
+    import transcoder
 
-    # --- 停止シグナルファイルの作成 ---
     try:
-        with open(stop_path, "w", encoding="utf-8") as f:
-            f.write("stop")
-        logger.info("停止シグナルファイルを作成しました: %s", stop_path)
+        transcoder.enqueue(output_folder, wav_path, mp3_path)
     except OSError:
-        logger.exception("停止シグナルファイルの作成に失敗しました")
-        return
+        logger.exception("変換ジョブの登録に失敗しました。WAV ファイルはそのまま残ります: %s", wav_path)
+        return result
 
-    # --- 録音プロセスの終了を待機（PID ファイル消滅を監視） ---
-    logger.info("録音プロセスの終了を待機しています...")
-    max_wait = 30
-    start = time.time()
-    while time.time() - start < max_wait:
-        if not os.path.exists(pid_path):
-            logger.info("録音プロセスが正常に終了しました")
-            return
-        time.sleep(0.5)
+    transcoder.launch_worker()
+    return {**result, "status": "queued", "path": mp3_path, "wav": wav_path}
 
-    logger.warning("録音プロセスが %d 秒以内に終了しませんでした", max_wait)
 
-    # 残留シグナルファイルのクリーンアップ
-    for path in (stop_path,):
-        if os.path.exists(path):
-            try:
-                os.remove(path)
-            except OSError:
-                pass
+def recover() -> list[str]:
+    """output_folder に残った録音ジャーナルから MP3 を復旧する（--mode=recover）。"""
+    recovered = journal_recover(get_settings().output_folder)
+    logger.info("ジャーナルの復旧が完了しました (%d 件)", len(recovered))
+    return recovered
@@ -0,0 +1,136 @@
+"""録音の停止・状態問い合わせ（--mode=stop-recording / --mode=status）。
+
+通話終了フックから呼ばれる停止処理は、録音へ停止を要求して結果を待つだけで
+numpy / sounddevice / soundfile / lameenc を必要としない。
+フックの起動時間を短く保つため、このモジュールは標準ライブラリと
+ipc / metrics / sessions 以外を import しない（recorder は import しない）。
+
+録音はセッション（sessions.py）ごとにコントロールチャンネルを持つため、
+--session=ID / --number=番号 で停止する録音を選べる（省略時はすべての録音）。
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+import ipc
+import metrics
+import sessions
+
+logger = logging.getLogger(__name__)
+
+# 停止要求から保存完了までの最大待機時間（秒）
+STOP_TIMEOUT_SEC = 60
+# 停止シグナルファイルで停止した場合に、セッションの登録が消えるまで待つ時間（秒）
+_SIGNAL_FILE_WAIT_SEC = 30
+
+
+def stop(session: Optional[str] = None, number: Optional[str] = None) -> list[dict]:
+    """録音に停止を要求し、セッションごとの保存結果の一覧を返す。
+
+    *session* にセッション ID を指定するとその録音、"all" または None ですべての録音、
+    *number* を指定するとその電話番号の録音を停止する。
+    コントロールチャンネルで停止した録音は、録音側から受け取った最終結果
+    （session_id・status・path・duration_sec・bytes）を返す。
+    チャンネルに接続できない録音は停止シグナルファイルで停止する（結果は status のみ）。
+    """
+    targets = sessions.find(session, number)
+    if not targets:
+        logger.warning("停止する録音がありません (session=%s, number=%s)", session or sessions.ALL, number)
+        return []
+    logger.info("録音 %d 件に停止を要求します: %s", len(targets), ", ".join(s.session_id for s in targets))
+
+    # 複数の録音は並行して停止する（保存の完了待ちを重ねない）
+    results: dict[str, dict] = {}
+
+    def _run(target: sessions.Session) -> None:
+        with metrics.call("stop", number=target.number, session=target.session_id) as call:
+            results[target.session_id] = _stop(call, target)
+
+    threads = [threading.Thread(target=_run, args=(t,), name=f"stop-{t.session_id}") for t in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [results[t.session_id] for t in targets if t.session_id in results]
+
+
+def _stop(call: metrics.CallMetrics, target: sessions.Session) -> dict:
+    result = {"session_id": target.session_id, "number": target.number}
+    try:
+        with call.span("stop_ack"):
+            reply = ipc.send_command(target.channel, {"command": "stop"}, timeout=STOP_TIMEOUT_SEC + 5)
+    except TimeoutError:
+        logger.warning("録音 %s が %d 秒以内に応答しませんでした", target.session_id, STOP_TIMEOUT_SEC + 5)
+        call.status = "timeout"
+        return {**result, "ok": False, "status": "timeout"}
+
+    if reply is None:
+        logger.info("録音 %s のコントロールチャンネルに接続できません。停止シグナルファイルで停止します。",
+                    target.session_id)
+        call.status = "signal-file"
+        with call.span("stop_signal_file"):
+            stopped = _stop_via_signal_file(target)
+        return {**result, "ok": stopped, "status": "signal-file"}
+    if not reply.get("ok"):
+        logger.warning("録音 %s の停止に失敗しました: %s", target.session_id, reply.get("error"))
+        call.status = "failed"
+        return {**result, "ok": False, "status": "failed", "error": reply.get("error")}
+
+    call.set("recording_status", reply.get("status"))
+    call.set("duration_sec", reply.get("duration_sec"))
+
+    logger.info("録音を停止しました: %s (%.1f 秒, %d bytes, status=%s)",
+                reply.get("path"), reply.get("duration_sec", 0.0), reply.get("bytes", 0), reply.get("status"))
+    return {**result, **reply}
+
+
+def status(session: Optional[str] = None, number: Optional[str] = None) -> dict:
+    """録音中のセッションの状態を返す。
+
+    コントロールチャンネルに接続できないセッションは登録内容のみを返す（reachable = false）。
+    録音中かどうかは確かめられないため recording = false とする
+    （録音プロセスが終了している登録は sessions.find() が削除する）。
+    """
+    found = []
+    for target in sessions.find(session, number):
+        try:
+            reply = ipc.send_command(target.channel, {"command": "status"}, timeout=5.0)
+        except TimeoutError:
+            reply = None
+        if reply is not None:
+            found.append({**target.to_dict(), "reachable": True, **reply})
+        else:
+            found.append({**target.to_dict(), "reachable": False, "recording": False})
+    return {"ok": True, "recording": any(s.get("recording") for s in found), "sessions": found}
+
+
+def _stop_via_signal_file(target: sessions.Session) -> bool:
+    """停止シグナルファイルを作成し、録音の終了（セッションの登録の削除）を待機する（フォールバック）。"""
+    try:
+        sessions.request_stop(target.session_id)
+        logger.info("停止シグナルファイルを作成しました: %s", sessions.stop_path(target.session_id))
+    except OSError:
+        logger.exception("停止シグナルファイルの作成に失敗しました")
+        return False
+
+    # --- 録音の終了を待機（セッションの登録の消滅を監視） ---
+    logger.info("録音 %s (PID=%d) の終了を待機しています...", target.session_id, target.pid)
+    start = time.time()
+    while time.time() - start < _SIGNAL_FILE_WAIT_SEC:
+        if sessions.get(target.session_id) is None:
+            logger.info("録音 %s が正常に終了しました", target.session_id)
+            return True
+        if not target.is_alive():
+            logger.warning("録音 %s (PID=%d) は保存せずに終了しています（登録を削除します）",
+                           target.session_id, target.pid)
+            sessions.remove(target.session_id)
+            return False
+        time.sleep(0.5)
+
+    # チャンネルにも停止シグナルにも応答しない登録は、異常終了した録音の残骸とみなす
+    logger.warning("録音 %s が %d 秒以内に終了しませんでした（登録を削除します）",
+                   target.session_id, _SIGNAL_FILE_WAIT_SEC)
+    sessions.remove(target.session_id)
+    return False
@@ -0,0 +1,147 @@
+"""録音コールバック用の事前確保リングバッファ。
+
+PortAudio のコールバックはブロックごとに新しい配列を確保せず、
+固定容量の numpy 配列へスライスコピーするだけにする。
+消費側スレッドはバッファ内のビューをそのまま次の段（エンコーダー・ジャーナル）へ渡し、
+処理が終わってから consume() で読み出し位置を進める。
+
+単一生産者（コールバック）・単一消費者（ライタースレッド）を前提とし、
+書き込み位置・読み出し位置はそれぞれ一方のスレッドだけが更新する。
+例外としてプリロール中（keep_latest() で上限を設定している間）は消費者がおらず、
+生産者が古いデータを捨てるために読み出し位置を進める。
+"""
+
+import threading
+from typing import Optional
+
+import numpy as np
+
+# write_silence() が一度に書き込む無音のフレーム数
+_SILENCE_FRAMES = 4096
+
+
+class AudioRingBuffer:
+    """固定容量・事前確保の (frames, channels) リングバッファ。
+
+    Attributes
+    ----------
+    high_water : int
+        使用量の最大値（フレーム数）。
+    dropped_frames : int
+        バッファが満杯で書き込めずに破棄したフレーム数。
+    overwritten_frames : int
+        プリロール中に上限を超えて捨てた古いフレーム数。
+    """
+
+    def __init__(self, capacity_frames: int, channels: int, dtype: str = "int16") -> None:
+        self.capacity = capacity_frames
+        self.channels = channels
+        self._buf = np.zeros((capacity_frames, channels), dtype=dtype)
+        # 累積フレーム数（位置はこれを capacity で割った余り）
+        self._write_total = 0
+        self._read_total = 0
+        self._ready = threading.Event()
+        self.high_water = 0
+        self.dropped_frames = 0
+        self.overwritten_frames = 0
+        # プリロール中に保持する最大フレーム数（None = 通常動作）
+        self._keep: Optional[int] = None
+        self._keep_lock = threading.Lock()
+        # write_silence() で書き込む無音（コールバック内で確保しないよう事前に用意する）
+        self._silence = np.zeros((_SILENCE_FRAMES, channels), dtype=dtype)
+
+    @property
+    def written_frames(self) -> int:
+        """これまでに書き込んだフレーム数（破棄分を除く）。"""
+        return self._write_total
+
+    def available(self) -> int:
+        """読み出し可能なフレーム数。"""
+        return self._write_total - self._read_total
+
+    def keep_latest(self, frames: Optional[int]) -> None:
+        """プリロール: 直近 *frames* フレームだけを保持し、古いデータは書き込み時に捨てる。
+
+        None を渡すと通常動作（満杯時は新しいデータを破棄）に戻る。
+        消費者は None に戻してから読み出しを始めること。
+        """
+        if frames is not None:
+            frames = max(1, min(frames, self.capacity))
+        with self._keep_lock:
+            self._keep = frames
+
+    def write(self, data: np.ndarray) -> int:
+        """*data* を書き込み、書き込んだフレーム数を返す（録音コールバックから呼ぶ）。
+
+        空きが足りない分は破棄して dropped_frames に数える。
+        """
+        if self._keep is not None:
+            with self._keep_lock:
+                keep = self._keep
+                if keep is not None:
+                    if len(data) > keep:
+                        skip = len(data) - keep
+                        self.overwritten_frames += self.available() + skip
+                        self._write_total += skip
+                        self._read_total = self._write_total
+                        data = data[skip:]
+                    excess = self.available() + len(data) - keep
+                    if excess > 0:
+                        self._read_total += excess
+                        self.overwritten_frames += excess
+        n = len(data)
+        free = self.capacity - (self._write_total - self._read_total)
+        if n > free:
+            self.dropped_frames += n - free
+            n = free
+        if n > 0:
+            start = self._write_total % self.capacity
+            first = min(n, self.capacity - start)
+            self._buf[start:start + first] = data[:first]
+            if n > first:
+                self._buf[:n - first] = data[first:n]
+            self._write_total += n
+
+            used = self._write_total - self._read_total
+            if used > self.high_water:
+                self.high_water = used
+        self._ready.set()
+        return n
+
+    def write_silence(self, frames: int) -> int:
+        """*frames* フレームの無音を書き込み、書き込んだフレーム数を返す（録音コールバックから呼ぶ）。"""
+        written = 0
+        while frames > 0:
+            n = min(frames, _SILENCE_FRAMES)
+            written += self.write(self._silence[:n])
+            frames -= n
+        return written
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """データが書き込まれるまで待機する。"""
+        if self.available() > 0:
+            return True
+        self._ready.wait(timeout)
+        self._ready.clear()
+        return self.available() > 0
+
+    def peek(self, max_frames: Optional[int] = None) -> list[np.ndarray]:
+        """読み出し可能なデータをコピーせずにビューで返す（折り返し時は 2 つ）。
+
+        ビューの内容は consume() を呼ぶまで上書きされない。
+        """
+        n = self.available()
+        if max_frames is not None:
+            n = min(n, max_frames)
+        if n <= 0:
+            return []
+        start = self._read_total % self.capacity
+        first = min(n, self.capacity - start)
+        views = [self._buf[start:start + first]]
+        if n > first:
+            views.append(self._buf[:n - first])
+        return views
+
+    def consume(self, frames: int) -> None:
+        """読み出し位置を *frames* だけ進める。"""
+        self._read_total += min(frames, self.available())
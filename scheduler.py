@@ -0,0 +1,282 @@
+"""着信イベントのスケジューラー。
+
+BlueBean が短い間隔で --mode=incoming を続けて呼んだ場合（連続着信・フックの再試行）、
+2 つの着信処理が同時にミュート・ガイダンス再生を行うと、先に終わった方が
+もう一方の再生中にマイクのミュートを解除してしまう。
+このモジュールで着信処理を 1 つずつ実行し、重複した着信をまとめる。
+
+方針（config.ini の [scheduler] policy）:
+- serialize: すべての着信を順番に処理する
+- coalesce（既定）: 同じ番号の着信が coalesce_window_sec 秒以内に重なった場合は 1 回にまとめ、
+  それ以外は順番に処理する
+- drop: 処理中（または待機中）の着信があれば新しい着信を破棄する
+
+- 常駐デーモンでは IncomingScheduler のキュー（上限 max_queue 件）で順番に処理する
+- デーモンを使わない場合は、着信処理のプロセス同士で exclusive() のロックファイルを使う
+- いずれの場合も、max_wait_sec 秒を超えて待った着信はガイダンスを流さずに破棄する
+- 着信ごとの待ち時間は metrics の "schedule" レコード（queue_wait）に記録する
+  （処理する着信の記録は、ミュート前の経路でファイルへ書き込まないよう処理の完了後に書き込む）
+"""
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+import metrics
+from config_loader import _base_dir
+from locks import try_lock
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("serialize", "coalesce", "drop")
+
+# 着信処理の排他用ロックファイルと、最後に開始した着信の記録（EXE ディレクトリに作成）
+_LOCK_FILE = ".incoming.lock"
+_LAST_FILE = ".incoming.last"
+# ロック待ちの確認間隔（秒）
+_POLL_SEC = 0.05
+
+# 処理結果（metrics の status にも使う）
+RUN = "run"
+COALESCED = "coalesced"
+DROPPED = "dropped"
+QUEUE_FULL = "queue-full"
+EXPIRED = "expired"
+
+
+class SchedulerSettings:
+    """[scheduler] セクションの設定。"""
+
+    def __init__(self, policy: str = "coalesce", max_queue: int = 4,
+                 coalesce_window_sec: float = 10.0, max_wait_sec: float = 30.0) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"policy は {' / '.join(POLICIES)} のいずれかです: {policy}")
+        self.policy = policy
+        self.max_queue = max(1, max_queue)
+        self.coalesce_window_sec = coalesce_window_sec
+        self.max_wait_sec = max_wait_sec
+
+    @classmethod
+    def from_config(cls, config) -> "SchedulerSettings":
+        """config.ini の [scheduler] セクションから設定を読み込む（無効な値は既定値に戻す）。"""
+        section = "scheduler"
+        try:
+            return cls(
+                policy=config.get(section, "policy", fallback="coalesce").strip().lower(),
+                max_queue=config.getint(section, "max_queue", fallback=4),
+                coalesce_window_sec=config.getfloat(section, "coalesce_window_sec", fallback=10.0),
+                max_wait_sec=config.getfloat(section, "max_wait_sec", fallback=30.0),
+            )
+        except ValueError:
+            logger.exception("[scheduler] の設定が不正です。既定の設定（coalesce）で動作します")
+            return cls()
+
+
+def _record(number: Optional[str], action: str, wait_sec: float = 0.0, depth: int = 0) -> None:
+    """着信 1 件のスケジュール結果を metrics に記録する。"""
+    with metrics.call("schedule", number=number) as call:
+        call.status = action
+        call.add_span("queue_wait", wait_sec * 1000)
+        call.set("queue_depth", depth)
+
+
+# ---------- プロセス間の排他（デーモンを使わない場合） ----------
+
+def _read_last() -> Optional[dict]:
+    try:
+        with open(os.path.join(_base_dir(), _LAST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_last(number: Optional[str]) -> None:
+    path = os.path.join(_base_dir(), _LAST_FILE)
+    try:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"number": number, "started_at": time.time()}, f)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        logger.warning("着信の記録を保存できませんでした: %s", path, exc_info=True)
+
+
+def _is_duplicate(number: Optional[str], settings: SchedulerSettings) -> bool:
+    """直前に開始した着信と同じ番号で、coalesce_window_sec 秒以内であれば True を返す。"""
+    if settings.policy != "coalesce" or not number:
+        return False
+    last = _read_last()
+    return (last is not None and last.get("number") == number
+            and time.time() - last.get("started_at", 0.0) < settings.coalesce_window_sec)
+
+
+@contextlib.contextmanager
+def _locked(timeout: float) -> Iterator[bool]:
+    """着信処理のロックファイルを *timeout* 秒まで待って取得する（取得できたかを返す）。"""
+    fd = os.open(os.path.join(_base_dir(), _LOCK_FILE), os.O_RDWR | os.O_CREAT)
+    try:
+        deadline = time.monotonic() + max(0.0, timeout)
+        locked = try_lock(fd)
+        while not locked and time.monotonic() < deadline:
+            time.sleep(_POLL_SEC)
+            locked = try_lock(fd)
+        yield locked
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def exclusive(number: Optional[str], settings: SchedulerSettings) -> Iterator[str]:
+    """他のプロセスの着信処理と排他し、処理してよければ RUN を返すコンテキストマネージャ。
+
+    RUN 以外（COALESCED / DROPPED / EXPIRED）の場合は何もせずにブロックを抜けること。
+    ブロックを抜けるとロックを解放する。
+    """
+    t0 = time.monotonic()
+    if _is_duplicate(number, settings):
+        logger.info("同じ番号の着信を処理済みのためまとめます: %s", number)
+        _record(number, COALESCED)
+        yield COALESCED
+        return
+
+    drop = settings.policy == "drop"
+    action, wait_sec = None, 0.0
+    try:
+        with _locked(0.0 if drop else settings.max_wait_sec) as locked:
+            wait_sec = time.monotonic() - t0
+            if not locked:
+                action = DROPPED if drop else EXPIRED
+            elif _is_duplicate(number, settings):
+                # 待っている間に同じ番号の着信が処理された
+                action = COALESCED
+            else:
+                action = RUN
+            if action == RUN:
+                _write_last(number)
+                call = metrics.current()
+                if call is not None:
+                    call.add_span("queue_wait", wait_sec * 1000)
+                if wait_sec >= _POLL_SEC:
+                    logger.info("先の着信処理の完了を待ちました (%.0fms)", wait_sec * 1000)
+            else:
+                logger.warning("着信を処理しません (%s, 待ち時間 %.1f 秒): %s", action, wait_sec, number)
+                _record(number, action, wait_sec)
+            yield action
+    finally:
+        # 処理した着信は、再生・復帰とロックの解放が終わってから記録する
+        if action == RUN:
+            _record(number, action, wait_sec)
+
+
+# ---------- 常駐デーモンのキュー ----------
+
+class _Event:
+    __slots__ = ("number", "handler", "queued_at")
+
+    def __init__(self, number: Optional[str], handler: Callable[[Optional[str]], None]) -> None:
+        self.number = number
+        self.handler = handler
+        self.queued_at = time.monotonic()
+
+
+class IncomingScheduler:
+    """着信イベントを専用スレッドで 1 件ずつ処理するキュー（常駐デーモン用）。
+
+    各イベントの処理中は exclusive() と同じロックファイルも保持し、
+    デーモンを使わずに起動された着信処理とも重ならないようにする。
+    """
+
+    def __init__(self, settings: Optional[SchedulerSettings] = None) -> None:
+        self.settings = settings or SchedulerSettings()
+        self._queue: collections.deque[_Event] = collections.deque()
+        self._cond = threading.Condition()
+        # 処理中のイベント（無ければ None）
+        self._running: Optional[_Event] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="incoming-scheduler", daemon=True)
+        self._thread.start()
+
+    def _pending(self) -> list[_Event]:
+        """処理中と待機中のイベント（_cond 内で呼ぶ）。"""
+        return ([self._running] if self._running is not None else []) + list(self._queue)
+
+    def submit(self, number: Optional[str], handler: Callable[[Optional[str]], None]) -> dict:
+        """着信イベントを登録し、{"action": ..., "queue_depth": ...} を返す。
+
+        action は "queued"（処理待ち）/ COALESCED / DROPPED / QUEUE_FULL のいずれか。
+        """
+        s = self.settings
+        with self._cond:
+            pending = self._pending()
+            depth = len(self._queue)
+            action = "queued"
+            if s.policy == "drop" and pending:
+                action = DROPPED
+            elif s.policy == "coalesce" and number and (any(
+                e.number == number and time.monotonic() - e.queued_at < s.coalesce_window_sec
+                for e in pending
+            ) or _is_duplicate(number, s)):
+                action = COALESCED
+            elif depth >= s.max_queue:
+                action = QUEUE_FULL
+            else:
+                self._queue.append(_Event(number, handler))
+                depth += 1
+                self._cond.notify()
+
+        if action == "queued":
+            if depth > 1 or pending:
+                logger.info("着信を待ち行列に追加しました: %s (待機 %d 件)", number, depth)
+        else:
+            logger.warning("着信を処理しません (%s): %s", action, number)
+            _record(number, action, depth=depth)
+        return {"action": action, "queue_depth": depth}
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                event = self._queue.popleft()
+                self._running = event
+                depth = len(self._queue)
+            try:
+                self._process(event, depth)
+            except Exception:
+                logger.exception("着信処理中に予期しないエラーが発生しました")
+            finally:
+                with self._cond:
+                    self._running = None
+
+    def _process(self, event: _Event, depth: int) -> None:
+        with _locked(self.settings.max_wait_sec - (time.monotonic() - event.queued_at)) as locked:
+            wait_sec = time.monotonic() - event.queued_at
+            if not locked or wait_sec > self.settings.max_wait_sec:
+                logger.warning("着信の待ち時間が %.1f 秒を超えたため破棄します: %s",
+                               self.settings.max_wait_sec, event.number)
+                _record(event.number, EXPIRED, wait_sec, depth)
+                return
+            if wait_sec >= _POLL_SEC:
+                logger.info("着信処理の開始を待ちました (%.0fms): %s", wait_sec * 1000, event.number)
+            _write_last(event.number)
+            try:
+                event.handler(event.number)
+            finally:
+                # ミュート前の経路でファイルへ書き込まないよう、記録は再生・復帰の後にする
+                _record(event.number, RUN, wait_sec, depth)
+
+    def close(self) -> None:
+        """待機中のイベントを破棄し、スケジューラーのスレッドを止める（処理中のイベントは待たない）。"""
+        with self._cond:
+            self._closed = True
+            dropped = list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        for event in dropped:
+            _record(event.number, DROPPED)
@@ -0,0 +1,240 @@
+"""録音セッションのレジストリ。
+
+同時に行われる複数の録音（転送・相談中の通話など）を区別するため、録音ごとに
+セッション ID（録音開始時刻＋電話番号、例: 20260220_141530_0312345678）を割り当て、
+EXE ディレクトリの .sessions フォルダに 1 セッション 1 ファイルで登録する。
+
+- create(): セッションを登録する。ファイルを排他作成（O_EXCL）するため、
+  同じ秒・同じ番号で録音が始まっても ID は重複しない（末尾に -2, -3 ... を付ける）
+- find(): セッション ID・"all"・電話番号でセッションを検索する
+  （録音プロセスが異常終了して残った登録は、PID が生きていなければ削除する）
+- 録音プロセスは channel(session_id) のコントロールチャンネルと
+  stop_path(session_id) の停止シグナルファイルで停止要求を受け付ける
+
+停止フック（recording_control.py）から使うため、標準ライブラリと config_loader 以外を import しない。
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from typing import Optional
+
+from config_loader import _base_dir
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_DIR = ".sessions"
+# すべてのセッションを対象にする指定
+ALL = "all"
+# 同じ ID のセッションが既にある場合に試す連番の上限
+_MAX_SUFFIX = 100
+# セッション ID（録音のファイル名）に入れない文字。"-" は連番の区切りに使うため取り除く
+_ID_UNSAFE = re.compile(r'[-\s\\/:*?"<>|]+')
+# Windows で録音プロセスの生存確認に使う定数
+_PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+_ERROR_ACCESS_DENIED = 5
+_STILL_ACTIVE = 259
+
+
+class Session:
+    """登録済みの録音セッション。"""
+
+    def __init__(self, session_id: str, number: Optional[str], pid: int, started_at: float,
+                 path: Optional[str] = None) -> None:
+        self.session_id = session_id
+        self.number = number
+        self.pid = pid
+        self.started_at = started_at
+        self.path = path
+
+    @property
+    def channel(self) -> str:
+        return channel(self.session_id)
+
+    def is_alive(self) -> bool:
+        """録音プロセスがまだ動いているか（PID が不明な登録は動いているとみなす）。"""
+        return self.pid <= 0 or _pid_alive(self.pid)
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "number": self.number,
+            "pid": self.pid,
+            "started_at": self.started_at,
+            "path": self.path,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        return cls(data["session_id"], data.get("number"), int(data.get("pid", 0)),
+                   float(data.get("started_at", 0.0)), data.get("path"))
+
+
+def sessions_dir() -> str:
+    return os.path.join(_base_dir(), SESSIONS_DIR)
+
+
+def _entry_path(session_id: str) -> str:
+    return os.path.join(sessions_dir(), f"{session_id}.json")
+
+
+def channel(session_id: str) -> str:
+    """セッションのコントロールチャンネル名（ipc のチャンネル名）を返す。"""
+    return f"recorder-{session_id}"
+
+
+def stop_path(session_id: str) -> str:
+    """セッションの停止シグナルファイルのパスを返す。"""
+    return os.path.join(sessions_dir(), f"{session_id}.stop")
+
+
+def normalize_number(number: Optional[str]) -> Optional[str]:
+    """電話番号から "-"・空白やファイル名に使えない文字を取り除く（03-1234-5678 → 0312345678）。
+
+    セッション ID・録音カタログ・番号による検索や停止で、同じ番号を同じ文字列として扱うために使う。
+    何も残らなければ None を返す。
+    """
+    return (_ID_UNSAFE.sub("", number) or None) if number else None
+
+
+def make_id(number: Optional[str], started_at: float) -> str:
+    """録音開始時刻と電話番号（normalize_number() で正規化する）からセッション ID を作る。"""
+    timestamp = datetime.fromtimestamp(started_at).strftime("%Y%m%d_%H%M%S")
+    number = normalize_number(number)
+    return f"{timestamp}_{number}" if number else timestamp
+
+
+def create(number: Optional[str], path_for=None, started_at: Optional[float] = None) -> Session:
+    """セッションを登録して返す。
+
+    *path_for* を指定した場合は、決まったセッション ID から録音ファイルのパスを求めて登録する。
+    同じ ID が既にあれば連番を付ける。登録ファイルは排他作成するため、
+    同時に create() しても同じ ID を 2 つの録音が使うことはない。
+    """
+    if started_at is None:
+        started_at = time.time()
+    os.makedirs(sessions_dir(), exist_ok=True)
+    base_id = make_id(number, started_at)
+    for i in range(1, _MAX_SUFFIX + 1):
+        session_id = base_id if i == 1 else f"{base_id}-{i}"
+        try:
+            fd = os.open(_entry_path(session_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            continue
+        session = Session(session_id, number, os.getpid(), started_at,
+                          path_for(session_id) if path_for is not None else None)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(session.to_dict(), f, ensure_ascii=False)
+        _remove(stop_path(session_id))
+        return session
+    raise FileExistsError(f"セッション ID を割り当てられません: {base_id}")
+
+
+def get(session_id: str) -> Optional[Session]:
+    """セッション ID のセッションを返す（無い・書き込み途中の場合は None）。"""
+    try:
+        with open(_entry_path(session_id), "r", encoding="utf-8") as f:
+            return Session.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def list_sessions() -> list[Session]:
+    """登録済みのセッションを開始時刻順に返す。
+
+    録音プロセスが終了しているのに残っている登録（異常終了した録音の残骸）は削除して除く。
+    """
+    try:
+        names = os.listdir(sessions_dir())
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in names:
+        if name.endswith(".json"):
+            session = get(name[:-len(".json")])
+            if session is not None and _prune_dead(session):
+                found.append(session)
+    return sorted(found, key=lambda s: (s.started_at, s.session_id))
+
+
+def find(session: Optional[str] = None, number: Optional[str] = None) -> list[Session]:
+    """停止・状態問い合わせの対象セッションを返す。
+
+    *session* に "all" または None を指定するとすべて、セッション ID を指定するとそのセッション。
+    *number* を指定した場合はその電話番号のセッションに絞り込む。
+    """
+    if session and session != ALL:
+        found = get(session)
+        candidates = [found] if found is not None and _prune_dead(found) else []
+    else:
+        candidates = list_sessions()
+    if number:
+        # "-" や空白の有無が違っても同じ番号とみなす（セッション ID と同じ正規化で比べる）
+        number = normalize_number(number)
+        candidates = [s for s in candidates if normalize_number(s.number) == number]
+    return candidates
+
+
+def request_stop(session_id: str) -> None:
+    """停止シグナルファイルを作成する（コントロールチャンネルに接続できない場合のフォールバック）。"""
+    with open(stop_path(session_id), "w", encoding="utf-8") as f:
+        f.write("stop")
+
+
+def stop_requested(session_id: str) -> bool:
+    return os.path.exists(stop_path(session_id))
+
+
+def remove(session_id: str) -> None:
+    """セッションの登録と停止シグナルファイルを削除する。"""
+    _remove(_entry_path(session_id))
+    _remove(stop_path(session_id))
+
+
+def _prune_dead(session: Session) -> bool:
+    """録音プロセスが終了していれば登録を削除して False を返す。"""
+    if session.is_alive():
+        return True
+    logger.warning("録音プロセス (PID=%d) が終了しているため、セッション %s の登録を削除します",
+                   session.pid, session.session_id)
+    remove(session.session_id)
+    return False
+
+
+def _pid_alive(pid: int) -> bool:
+    if sys.platform == "win32":
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(_PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            # 権限が無いだけなら別のユーザーのプロセスとして動いている
+            return kernel32.GetLastError() == _ERROR_ACCESS_DENIED
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == _STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 権限が無い（別のユーザーのプロセス）などは動いているとみなす
+        pass
+    return True
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.warning("ファイルを削除できませんでした: %s", path, exc_info=True)
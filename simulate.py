@@ -0,0 +1,134 @@
+"""仮想オーディオバックエンドによる通話シミュレーション（--mode=simulate）。
+
+Windows の実機・BlueBean が無い環境で、着信ガイダンス → 録音 → 録音停止の流れを
+常駐デーモンと同じ経路（事前準備済みガイダンス・同一プロセス内の録音スレッド）で繰り返す。
+
+- 入力は [virtual] input_file の WAV（省略時は正弦波）を N 倍速で流す
+- 録音は output_folder ではなくシミュレーション用のフォルダに保存する
+- 処理時間は simulate_metrics.jsonl に記録し、本番の call_metrics.jsonl には混ぜない
+- 終了時に metrics の集計（p50/p95/p99）を返す
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import incoming
+import metrics
+import recorder
+from audio_backend import VirtualAudioBackend, set_backend
+from config_loader import _base_dir, get_settings
+
+logger = logging.getLogger(__name__)
+
+# シミュレーションの保存先（EXE ディレクトリ直下）
+_OUTPUT_DIR = "simulation"
+_METRICS_FILE = "simulate_metrics.jsonl"
+
+
+def run(
+    calls: int = 10,
+    call_seconds: float = 60.0,
+    speed: Optional[float] = None,
+    input_file: Optional[str] = None,
+    output_folder: Optional[str] = None,
+    keep_recordings: bool = False,
+) -> dict:
+    """仮想バックエンドで *calls* 件の通話を模擬し、metrics の集計結果を返す。
+
+    Parameters
+    ----------
+    calls : int
+        模擬する通話の件数。
+    call_seconds : float
+        1 件あたりの通話時間（模擬時間の秒数）。
+    speed : float | None
+        時計の速さ。None の場合は [virtual] speed（省略時 60 倍速）。
+    input_file : str | None
+        録音ストリームに流す WAV。None の場合は [virtual] input_file（省略時は正弦波）。
+    output_folder : str | None
+        録音の保存先。None の場合は EXE ディレクトリの simulation フォルダ。
+    keep_recordings : bool
+        False の場合、各通話の録音ファイルは保存を確認したあと削除する。
+    """
+    settings = get_settings()
+    config = settings.config
+    if speed is None:
+        speed = config.getfloat("virtual", "speed", fallback=60.0)
+    if input_file is None:
+        input_file = config.get("virtual", "input_file", fallback="").strip() or None
+    if output_folder is None:
+        output_folder = os.path.join(_base_dir(), _OUTPUT_DIR)
+    os.makedirs(output_folder, exist_ok=True)
+
+    backend = VirtualAudioBackend(input_file=input_file, speed=speed)
+    set_backend(backend)
+    metrics_path = os.path.join(output_folder, _METRICS_FILE)
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)
+    metrics.redirect(metrics_path)
+
+    logger.info("シミュレーションを開始します: %d 件 × %.0f 秒 (%.1f 倍速, 入力=%s, 保存先=%s)",
+                calls, call_seconds, speed, input_file or "正弦波", output_folder)
+
+    prepared = incoming.prepare(settings)
+    if prepared is None:
+        raise RuntimeError("ガイダンスの事前準備に失敗しました（guidance_file を確認してください）")
+
+    t0 = time.perf_counter()
+    try:
+        _run_calls(backend, prepared, calls, call_seconds, output_folder, keep_recordings,
+                   settings.early_capture is not False)
+    finally:
+        prepared.close()
+
+    elapsed = time.perf_counter() - t0
+    logger.info("シミュレーションが完了しました: %d 件 (実時間 %.1f 秒, 模擬時間 %.1f 分)",
+                calls, elapsed, calls * call_seconds / 60)
+    metrics.redirect(None)
+    return metrics.summarize(metrics.read_records(metrics_path))
+
+
+def _run_calls(backend: VirtualAudioBackend, prepared: incoming.PreparedGuidance, calls: int,
+               call_seconds: float, output_folder: str, keep_recordings: bool,
+               early_capture: bool) -> None:
+    for i in range(calls):
+        number = f"sim{i + 1:05d}"
+        if early_capture:
+            # デーモンと同じく、ミュート前にプリロールを始めた録音スレッドへ切り替える
+            thread = recorder.CaptureThread(number, output_folder=output_folder)
+            stop_event = thread.stop_event
+
+            def _start_capture(_number: str | None, thread=thread) -> recorder.CaptureThread:
+                thread.start()
+                return thread
+
+            incoming.run(number=number, prepared=prepared, start_capture=_start_capture)
+        else:
+            stop_event = threading.Event()
+            thread = threading.Thread(
+                target=recorder.run, name="recorder", daemon=True,
+                kwargs={"number": number, "stop_event": stop_event, "output_folder": output_folder},
+            )
+
+            def _start_recording(_number: str | None, thread: threading.Thread = thread) -> None:
+                thread.start()
+
+            incoming.run(number=number, prepared=prepared, start_recording=_start_recording)
+        backend.clock.sleep(call_seconds)
+        stop_event.set()
+        thread.join()
+
+        if not keep_recordings:
+            _remove_recordings(output_folder, number)
+
+
+def _remove_recordings(output_folder: str, number: str) -> None:
+    for name in os.listdir(output_folder):
+        if name.startswith("recording_") and f"_{number}." in name:
+            try:
+                os.remove(os.path.join(output_folder, name))
+            except OSError:
+                pass
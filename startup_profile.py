@@ -0,0 +1,87 @@
+"""起動時間のプロファイル（--profile-startup）。
+
+builtins.__import__ を差し替えて、新しく読み込まれたモジュールごとの import 時間を計測する。
+自身の時間（self）と、そのモジュールが読み込んだモジュールを含む時間（total）を記録し、
+終了時に self の大きい順にログへ出力する。
+
+call_helper.py の先頭（他のモジュールを import する前）で install() を呼ぶ。
+標準ライブラリ以外を import しないこと。
+"""
+
+import builtins
+import logging
+import sys
+import threading
+import time
+
+_original_import = builtins.__import__
+_local = threading.local()
+_lock = threading.Lock()
+# (モジュール名, self 秒, total 秒, 深さ)
+_records: list[tuple[str, float, float, int]] = []
+_installed_at = 0.0
+
+
+def _stack() -> list[float]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level == 0 and not fromlist and name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    stack = _stack()
+    stack.append(0.0)
+    t0 = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        total = time.perf_counter() - t0
+        children = stack.pop()
+        if stack:
+            stack[-1] += total
+        # 読み込み済みモジュールの from-import など、ほぼ時間のかからないものは記録しない
+        if total >= 0.0001:
+            if level > 0:
+                # 相対 import はパッケージ名を付けて表示する
+                package = (globals or {}).get("__package__") or ""
+                name = f"{package}.{name}" if name else package
+            with _lock:
+                _records.append((name, total - children, total, len(stack)))
+
+
+def install() -> None:
+    """import 時間の計測を開始する。"""
+    global _installed_at
+    if builtins.__import__ is not _timed_import:
+        _installed_at = time.perf_counter()
+        builtins.__import__ = _timed_import
+
+
+def uninstall() -> None:
+    builtins.__import__ = _original_import
+
+
+def report(logger: logging.Logger, top: int = 25) -> None:
+    """計測結果をログに出力する（self 時間の大きい順に *top* 件）。"""
+    uninstall()
+    with _lock:
+        records = list(_records)
+
+    merged: dict[str, list[float]] = {}
+    for name, self_sec, total_sec, depth in records:
+        entry = merged.setdefault(name, [0.0, 0.0, depth])
+        entry[0] += self_sec
+        entry[1] += total_sec
+        entry[2] = min(entry[2], depth)
+
+    import_total = sum(total for _, _, total, depth in records if depth == 0)
+    logger.info("起動プロファイル: import 合計 %.1fms（計測開始から %.1fms）",
+                import_total * 1000, (time.perf_counter() - _installed_at) * 1000)
+    logger.info("  %-40s %10s %10s", "module", "self(ms)", "total(ms)")
+    ranked = sorted(merged.items(), key=lambda item: item[1][0], reverse=True)
+    for name, (self_sec, total_sec, _) in ranked[:top]:
+        logger.info("  %-40s %10.1f %10.1f", name, self_sec * 1000, total_sec * 1000)
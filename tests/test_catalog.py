@@ -0,0 +1,55 @@
+"""録音カタログのファイル名の解釈と一括登録のテスト。"""
+
+import wave
+from datetime import datetime
+
+import pytest
+
+import catalog
+import sessions
+
+
+def _write_wav(path, seconds: float = 0.5, samplerate: int = 8000) -> None:
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(samplerate)
+        w.writeframes(b"\x00\x00" * int(seconds * samplerate))
+
+
+@pytest.mark.parametrize("name, number", [
+    ("recording_20260220_141530_07032962691.wav", "07032962691"),
+    ("recording_20260220_141530_07032962691-2.wav", "07032962691"),
+    # 番号の "-" を取り除く前に作られた録音（番号は正規化して登録する）
+    ("recording_20260220_141530_03-1234-5678.wav", "0312345678"),
+    ("recording_20260220_141530_03-1234-5678-3.wav", "0312345678"),
+    ("recording_20260220_141530_0120-123-456.wav", "0120123456"),
+    ("recording_20260220_141530_0120-123-456-100.wav", "0120123456"),
+    ("recording_20260220_141530.wav", None),
+    ("recording_20260220_141530-2.wav", None),
+])
+def test_import_folder_parses_number(tmp_path, name, number):
+    _write_wav(tmp_path / name)
+    assert catalog.import_folder(str(tmp_path)) == 1
+    [entry] = catalog.search(str(tmp_path))
+    assert entry["file"] == name
+    assert entry["number"] == number
+    assert entry["started_at"] == datetime(2026, 2, 20, 14, 15, 30).timestamp()
+    assert entry["duration_sec"] == 0.5
+
+
+def test_search_by_digits_finds_hyphenated_number(tmp_path):
+    path = tmp_path / "recording_20260220_141530_0312345678.mp3"
+    path.write_bytes(b"")
+    assert catalog.add(str(tmp_path), str(path), catalog.OK, number="03-1234-5678")
+    [entry] = catalog.search(str(tmp_path), number="0312")
+    assert entry["number"] == "0312345678"
+    assert [e["file"] for e in catalog.search(str(tmp_path), number="03-12")] == [path.name]
+    assert catalog.search(str(tmp_path), number="0313") == []
+
+
+def test_session_id_strips_hyphens_from_number():
+    started_at = datetime(2026, 2, 20, 14, 15, 30).timestamp()
+    assert sessions.make_id("03-1234-5678", started_at) == "20260220_141530_0312345678"
+    assert sessions.make_id("+81 3 1234 5678", started_at) == "20260220_141530_+81312345678"
+    assert sessions.make_id(None, started_at) == "20260220_141530"
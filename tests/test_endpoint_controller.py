@@ -0,0 +1,109 @@
+"""EndpointController のキャッシュ・復元ロジックのテスト（仮想エンドポイントを使用）。"""
+
+import pytest
+
+from audio_backend import Clock, VirtualEndpointBackend
+from audio_devices import CAPTURE, RENDER, EndpointController
+
+
+class _FakeBackend(VirtualEndpointBackend):
+    """resolve の回数を数え、指定した回数だけ操作を失敗させる仮想エンドポイント。"""
+
+    def __init__(self) -> None:
+        super().__init__(Clock(speed=0))
+        self.resolved: list[int] = []
+        self.failures = 0
+        self.on_change = None
+        self._generation = 0
+
+    def resolve(self, flow: int):
+        self.resolved.append(flow)
+        return (flow, self._generation)
+
+    def get_mute(self, volume) -> bool:
+        self._fail()
+        return super().get_mute(volume[0])
+
+    def set_mute(self, volume, mute: bool) -> None:
+        self._fail()
+        super().set_mute(volume[0], mute)
+
+    def watch_default_device(self, callback) -> bool:
+        self.on_change = callback
+        return True
+
+    def change_default_device(self) -> None:
+        self._generation += 1
+        self.on_change()
+
+    def _fail(self) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise OSError("endpoint went away")
+
+
+@pytest.fixture
+def backend():
+    return _FakeBackend()
+
+
+@pytest.fixture
+def controller(backend):
+    return EndpointController(backend)
+
+
+def test_interface_is_resolved_once_and_reused(controller, backend):
+    controller.prepare()
+    for _ in range(3):
+        controller.set_mute(CAPTURE, True)
+        controller.get_mute(RENDER)
+    assert sorted(backend.resolved) == [RENDER, CAPTURE]
+
+
+def test_default_device_change_invalidates_cache(controller, backend):
+    controller.set_mute(CAPTURE, True)
+    assert backend.resolved == [CAPTURE]
+    backend.change_default_device()
+    controller.set_mute(CAPTURE, False)
+    assert backend.resolved == [CAPTURE, CAPTURE]
+    controller.set_mute(CAPTURE, True)
+    assert backend.resolved == [CAPTURE, CAPTURE]
+
+
+def test_restore_keeps_endpoints_that_were_already_muted(controller, backend):
+    backend.muted[CAPTURE] = True
+    backend.muted[RENDER] = False
+    assert controller.mute_all() is True
+    assert backend.muted == {CAPTURE: True, RENDER: True}
+    assert controller.restore_all() is True
+    assert backend.muted == {CAPTURE: True, RENDER: False}
+
+
+def test_nested_mute_restores_only_at_outermost_release(controller, backend):
+    controller.mute_all()
+    controller.mute_all()
+    assert controller.restore_all() is True
+    assert backend.muted == {CAPTURE: True, RENDER: True}
+    assert controller.restore_all() is True
+    assert backend.muted == {CAPTURE: False, RENDER: False}
+    # 参照カウントが 0 に戻った後の mute_all() は改めて元の状態を記録する
+    backend.muted[RENDER] = True
+    controller.mute_all()
+    controller.restore_all()
+    assert backend.muted == {CAPTURE: False, RENDER: True}
+
+
+def test_call_retries_once_with_fresh_interface(controller, backend):
+    controller.prepare()
+    backend.failures = 1
+    controller.set_mute(CAPTURE, True)
+    assert backend.muted[CAPTURE] is True
+    assert backend.resolved.count(CAPTURE) == 2
+
+
+def test_call_gives_up_after_single_retry(controller, backend):
+    backend.failures = 2
+    with pytest.raises(OSError):
+        controller.set_mute(CAPTURE, True)
+    assert CAPTURE not in backend.muted
+    assert backend.resolved.count(CAPTURE) == 2
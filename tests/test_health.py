@@ -0,0 +1,65 @@
+"""録音の健全性（health.py）の集計のテスト。"""
+
+import numpy as np
+import pytest
+
+from health import CaptureHealth, GapDetector
+
+
+def _reference(pcm: np.ndarray, sr: int) -> tuple[list[int], list[float], list[int]]:
+    """1 秒ずつ素直に求めたピーク・RMS・クリップ数。"""
+    peaks, rms, clipped = [], [], []
+    for start in range(0, len(pcm), sr):
+        part = pcm[start:start + sr].astype(np.int64)
+        peaks.append(int(np.abs(part).max()))
+        rms.append(float(np.sqrt(np.mean(part.astype(np.float64) ** 2))))
+        clipped.append(int(np.count_nonzero((part >= 32767) | (part <= -32768))))
+    return peaks, rms, clipped
+
+
+def _dbfs(value: float) -> float:
+    return round(max(20 * np.log10(value / 32767), -120.0), 1) if value else -120.0
+
+
+@pytest.mark.parametrize("block", [777, 8000, 20000])
+def test_per_second_stats_match_reference(block):
+    sr = 8000
+    rng = np.random.default_rng(0)
+    pcm = (rng.normal(0, 3000, (sr * 3 + 500, 2))).astype(np.int16)
+    pcm[100:200] = 32767
+    pcm[9000:9010, 0] = -32768
+    pcm[16000:24000] = 0
+
+    health = CaptureHealth(sr, 2)
+    for start in range(0, len(pcm), block):
+        health.process(pcm[start:start + block])
+    summary = health.summary()
+
+    peaks, rms, clipped = _reference(pcm, sr)
+    per_second = summary["per_second"]
+    assert per_second["peak_dbfs"] == [_dbfs(p) for p in peaks]
+    assert per_second["rms_dbfs"] == pytest.approx([_dbfs(r) for r in rms], abs=0.1)
+    assert per_second["clipped"] == clipped == [200, 10, 0, 0]
+    assert summary["clipped_samples"] == 210
+    assert summary["clipped_pct"] == round(210 * 100 / pcm.size, 4)
+    assert summary["duration_sec"] == round(len(pcm) / sr, 3)
+
+
+def test_gaps_before_origin_are_not_reported():
+    health = CaptureHealth(1000, 1)
+    health.note(0, 10, False)
+    health.note(95, 10, False)
+    health.note(500, 20, True)
+    summary = health.summary(origin=100)
+    assert summary["xruns"] == 3
+    assert summary["input_overflows"] == 1
+    assert summary["gaps"] == [{"at_sec": 0.0, "ms": 5.0}, {"at_sec": 0.4, "ms": 20.0}]
+    assert summary["gap_ms_total"] == 25.0
+
+
+def test_gap_detector():
+    detector = GapDetector(48000)
+    times = [0.0001, 0.0101, 0.0201, 0.0401, 0.0502, 0.0602, 10.0]
+    assert [detector.check(t, 480) for t in times] == [0, 0, 0, 480, 0, 0, 5 * 48000]
+    # タイムスタンプを返さないホスト API では何もしない
+    assert GapDetector(48000).check(0.0, 480) == 0
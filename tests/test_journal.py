@@ -0,0 +1,24 @@
+"""録音ジャーナルのロックと解放のテスト。"""
+
+import numpy as np
+import pytest
+
+import journal
+
+
+def test_release_keeps_journal_and_unlocks(tmp_path):
+    j = journal.Journal(str(tmp_path), "recording_x", 8000, 1)
+    j.append(np.zeros((800, 1), dtype=np.int16))
+    assert journal._is_locked(j.path)
+    j.release()
+    j.release()
+    assert not journal._is_locked(j.path)
+    assert [p.endswith("recording_x.mp3") for p in journal.recover(str(tmp_path))] == [True]
+
+
+def test_locked_journal_is_not_reused(tmp_path):
+    j = journal.Journal(str(tmp_path), "recording_x", 8000, 1)
+    with pytest.raises(OSError):
+        journal.Journal(str(tmp_path), "recording_x", 8000, 1)
+    j.discard()
+    assert not (tmp_path / journal.JOURNAL_DIR / "recording_x").exists()
@@ -0,0 +1,109 @@
+"""区間に分けた並列エンコード（mp3codec.encode_segments）のテスト。
+
+同じ合成 PCM を 1 つのエンコーダーと encode_segments の両方でエンコードし、
+フレーム数・デコード後の長さが一致し、継ぎ目の前後の誤差が 1 つのエンコーダーと
+ほぼ同じであることを確かめる（ビットリザーバーの参照が壊れていると、デコーダーが
+そのフレームを無音にするため継ぎ目の SNR が大きく下がる）。
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from mp3codec import _encode_range, _frame_samples, encode_segments
+from mp3frames import Mp3Writer, split_frames
+
+sf = pytest.importorskip("soundfile")
+
+_SECONDS = 16
+_WORKERS = 4
+_MIN_SEGMENT_SEC = 2
+# 継ぎ目の SNR が 1 つのエンコーダーより悪くてもよい幅（dB）
+_TOLERANCE_DB = 0.5
+# 継ぎ目の前後で SNR を求める範囲（MP3 フレーム数）
+_SEAM_WINDOW_FRAMES = 8
+# エンコーダーの遅延を探す範囲（サンプル数）
+_MAX_DELAY = 3000
+
+
+def _synth(rate: int, channels: int) -> np.ndarray:
+    """トーン・ノイズのバースト・無音が入れ替わる int16 の PCM（ブロックタイプが切り替わるように）。"""
+    rng = np.random.default_rng(1)
+    n = _SECONDS * rate
+    t = np.arange(n) / rate
+    tone = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.1 * np.sin(2 * np.pi * 1870 * t)
+    bursts = np.where((t % 0.7) < 0.05, rng.normal(0, 0.4, n), 0.0)
+    gate = np.where((t % 5) < 4.5, 1.0, 0.0)
+    mono = np.clip((tone + bursts) * gate, -1, 1)
+    out = np.empty((n, channels))
+    for ch in range(channels):
+        out[:, ch] = np.roll(mono, 37 * ch)
+    return (out * 32767).astype(np.int16)
+
+
+def _decode(data: bytes, path, vbr: bool) -> np.ndarray:
+    with open(path, "wb") as f:
+        writer = Mp3Writer(f, vbr=vbr)
+        writer.write(data)
+        writer.finish()
+    decoded, _ = sf.read(str(path), dtype="float32", always_2d=True)
+    return decoded
+
+
+def _delay(decoded: np.ndarray, ref: np.ndarray, rate: int) -> int:
+    span = slice(rate // 2, rate)
+    return min(range(_MAX_DELAY), key=lambda d: float(np.mean(
+        (decoded[span.start + d:span.stop + d] - ref[span]) ** 2)))
+
+
+def _snr_db(decoded: np.ndarray, ref: np.ndarray, delay: int, start: int, stop: int) -> float:
+    err = decoded[start + delay:stop + delay] - ref[start:stop]
+    return float(10 * np.log10(np.mean(ref[start:stop] ** 2) / (np.mean(err ** 2) + 1e-20)))
+
+
+@pytest.mark.parametrize("vbr_quality", [None, 4], ids=["cbr", "vbr"])
+@pytest.mark.parametrize("rate, channels", [(44100, 2), (48000, 1), (16000, 2)])
+def test_segments_match_single_encoder(tmp_path, rate, channels, vbr_quality):
+    pcm = _synth(rate, channels)
+    raw_path = str(tmp_path / "in.pcm")
+    pcm.tofile(raw_path)
+    serial = _encode_range(raw_path, 0, len(pcm), rate, channels, 128, vbr_quality)
+    out: list[bytes] = []
+    with ThreadPoolExecutor(max_workers=_WORKERS) as pool:
+        segments = encode_segments(raw_path, rate, channels, out.append, pool, _WORKERS,
+                                   vbr_quality=vbr_quality, min_segment_sec=_MIN_SEGMENT_SEC)
+    joined = b"".join(out)
+    assert segments == _WORKERS
+
+    # フレームの欠落・重複が無い
+    assert len(split_frames(joined)) == len(split_frames(serial))
+    vbr = vbr_quality is not None
+    a = _decode(serial, tmp_path / "serial.mp3", vbr)
+    b = _decode(joined, tmp_path / "segments.mp3", vbr)
+    assert len(b) == len(a)
+
+    # 継ぎ目の正確な位置は重なりの範囲内で決まるため、区間の境界から重なりの長さまでを含めて比べる
+    ref = pcm.astype(np.float32) / 32768
+    delay = _delay(a, ref, rate)
+    frame = _frame_samples(rate)
+    window = _SEAM_WINDOW_FRAMES * frame
+    length = -(-(-(-len(pcm) // frame)) // segments) * frame
+    usable = len(ref) - _MAX_DELAY
+    for k in range(1, segments):
+        start = max(0, k * length - window)
+        stop = min(usable, k * length + 5 * window)
+        loss = _snr_db(a, ref, delay, start, stop) - _snr_db(b, ref, delay, start, stop)
+        assert loss <= _TOLERANCE_DB, f"区間 {k} の継ぎ目で SNR が {loss:.2f} dB 低下"
+
+
+def test_short_input_is_not_split(tmp_path):
+    rate, channels = 44100, 2
+    pcm = _synth(rate, channels)[: rate]
+    raw_path = str(tmp_path / "in.pcm")
+    pcm.tofile(raw_path)
+    out: list[bytes] = []
+    with ThreadPoolExecutor(max_workers=_WORKERS) as pool:
+        segments = encode_segments(raw_path, rate, channels, out.append, pool, _WORKERS)
+    assert segments == 1
+    assert b"".join(out) == _encode_range(raw_path, 0, len(pcm), rate, channels, 128, None)
@@ -0,0 +1,41 @@
+"""録音セッションのレジストリ（sessions.py）のテスト。"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import sessions
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "_base_dir", lambda: str(tmp_path))
+    return tmp_path / sessions.SESSIONS_DIR
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_find_prunes_sessions_of_dead_processes(registry):
+    alive = sessions.create("03-1234-5678", started_at=1_700_000_000)
+    dead = sessions.create("0312345678", started_at=1_700_000_060)
+    entry = registry / f"{dead.session_id}.json"
+    entry.write_text(json.dumps({**dead.to_dict(), "pid": _dead_pid()}), encoding="utf-8")
+
+    assert [s.session_id for s in sessions.find()] == [alive.session_id]
+    assert not entry.exists()
+    assert sessions.find(dead.session_id) == []
+    assert alive.pid == os.getpid()
+
+
+@pytest.mark.parametrize("number", ["0312345678", "03-1234-5678", "03 1234 5678"])
+def test_find_by_number_ignores_hyphens(registry, number):
+    started = sessions.create("03-1234-5678", started_at=1_700_000_000)
+    sessions.create("0120123456", started_at=1_700_000_000)
+    assert [s.session_id for s in sessions.find(number=number)] == [started.session_id]
@@ -0,0 +1,213 @@
+"""バックグラウンド変換ワーカー（WAV → MP3）。
+
+録音プロセスは WAV を書き終えたら変換ジョブをキューに積んで即座に終了し、
+録音デバイスと録音セッションを解放する。変換は --mode=transcode の別プロセスが
+CPU コア数のプロセスプールで行う。
+
+- ジョブがコア数以上あれば 1 ジョブずつ各プロセスで変換する
+- ジョブがコア数より少なければ（通話終了直後の 1 件など）、1 件ずつ録音を区間に分けて
+  すべてのプロセスで並列にエンコードする（mp3codec.encode_segments）
+
+- キュー: output_folder/.transcode_queue/<ファイル名>.json（1 ジョブ 1 ファイル）
+- 以前の変換失敗で残った recording_*.wav（対応する MP3 が無いもの）もまとめて変換する
+- ワーカーは同時に 1 つだけ起動する（ロックファイルで排他）
+"""
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, as_completed
+from typing import Optional
+
+import catalog
+from locks import try_lock
+
+logger = logging.getLogger(__name__)
+
+# キューのディレクトリ名（output_folder 直下）
+QUEUE_DIR = ".transcode_queue"
+_FAILED_DIR = "failed"
+_LOCK_FILE = "worker.lock"
+# 1 ジョブの最大試行回数（超えたら failed/ へ移す）
+_MAX_ATTEMPTS = 3
+
+
+def _queue_path(output_folder: str) -> str:
+    return os.path.join(output_folder, QUEUE_DIR)
+
+
+def _write_job(job_path: str, job: dict) -> None:
+    with open(job_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(job_path + ".tmp", job_path)
+
+
+def enqueue(output_folder: str, wav_path: str, mp3_path: str) -> str:
+    """変換ジョブをキューに追加し、ジョブファイルのパスを返す。"""
+    queue_dir = _queue_path(output_folder)
+    os.makedirs(queue_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(wav_path))[0]
+    job_path = os.path.join(queue_dir, f"{name}.json")
+    _write_job(job_path, {"wav": wav_path, "mp3": mp3_path, "queued_at": time.time(), "attempts": 0})
+    logger.info("変換ジョブを登録しました: %s", job_path)
+    return job_path
+
+
+def launch_worker() -> None:
+    """変換ワーカー（--mode=transcode）をバックグラウンドで起動する。
+
+    既にワーカーが起動している場合、新しいワーカーはロックを取れずにすぐ終了する。
+    """
+    try:
+        if getattr(sys, "frozen", False):
+            cmd = [sys.executable, "--mode=transcode", "--no-daemon"]
+        else:
+            script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "call_helper.py")
+            cmd = [sys.executable, script_path, "--mode=transcode", "--no-daemon"]
+
+        CREATE_NO_WINDOW = 0x08000000
+        creationflags = CREATE_NO_WINDOW if sys.platform == "win32" else 0
+        subprocess.Popen(cmd, creationflags=creationflags)
+        logger.info("変換ワーカーを起動しました: %s", " ".join(cmd))
+    except Exception:
+        logger.exception("変換ワーカーの起動に失敗しました（次回起動時に変換されます）")
+
+
+def _transcode(wav_path: str, mp3_path: str, settings=None, pool: Optional[Executor] = None,
+               workers: int = 1) -> int:
+    """変換処理。MP3 のバイト数を返す。
+
+    通常はプロセスプール内で実行される。*pool* を指定した場合は呼び出し元のプロセスで実行し、
+    エンコードを区間に分けて *pool* の *workers* プロセスで並列に行う。
+    """
+    from mp3codec import wav_to_mp3
+
+    size = wav_to_mp3(wav_path, mp3_path, settings, pool=pool, workers=workers)
+    os.remove(wav_path)
+    return size
+
+
+def _run_here(fn, *args) -> Future:
+    """*fn* をこのプロセスで実行し、結果（または例外）を Future で返す。"""
+    future: Future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
+
+
+def _collect_jobs(output_folder: str) -> dict[str, dict]:
+    """キューのジョブと、取り残された WAV の一覧を {ジョブファイル: ジョブ} で返す。"""
+    queue_dir = _queue_path(output_folder)
+    os.makedirs(queue_dir, exist_ok=True)
+
+    jobs: dict[str, dict] = {}
+    for name in sorted(os.listdir(queue_dir)):
+        if not name.endswith(".json"):
+            continue
+        job_path = os.path.join(queue_dir, name)
+        try:
+            with open(job_path, "r", encoding="utf-8") as f:
+                jobs[job_path] = json.load(f)
+        except (OSError, ValueError):
+            logger.warning("ジョブファイルを読み込めません: %s", job_path)
+
+    # 以前の変換失敗で残った WAV（MP3 が無く、キューにも無いもの）
+    queued = {os.path.abspath(job["wav"]) for job in jobs.values()}
+    for name in sorted(os.listdir(output_folder)):
+        if not (name.startswith("recording_") and name.endswith(".wav")):
+            continue
+        wav_path = os.path.join(output_folder, name)
+        mp3_path = os.path.splitext(wav_path)[0] + ".mp3"
+        if os.path.abspath(wav_path) in queued or os.path.exists(mp3_path):
+            continue
+        job_path = enqueue(output_folder, wav_path, mp3_path)
+        with open(job_path, "r", encoding="utf-8") as f:
+            jobs[job_path] = json.load(f)
+    return jobs
+
+
+def _fail(output_folder: str, job_path: str, job: dict) -> None:
+    """失敗したジョブの試行回数を増やし、上限を超えたら failed/ へ移す。"""
+    job["attempts"] = job.get("attempts", 0) + 1
+    if job["attempts"] < _MAX_ATTEMPTS:
+        _write_job(job_path, job)
+        return
+    failed_dir = os.path.join(os.path.dirname(job_path), _FAILED_DIR)
+    os.makedirs(failed_dir, exist_ok=True)
+    os.replace(job_path, os.path.join(failed_dir, os.path.basename(job_path)))
+    logger.error("変換を %d 回失敗したためジョブを保留します（WAV は残ります）: %s",
+                 job["attempts"], job["wav"])
+    catalog.update(output_folder, job["wav"], catalog.WAV_FALLBACK)
+
+
+def run_pending() -> int:
+    """config.ini の output_folder のキューを処理する（--mode=transcode）。"""
+    from analysis import EncodeSettings
+    from config_loader import get_settings
+
+    settings = get_settings()
+    return run(settings.output_folder, settings=EncodeSettings.from_config(settings.config))
+
+
+def run(output_folder: str, workers: Optional[int] = None, settings=None) -> int:
+    """キューが空になるまで変換ジョブを処理し、変換した件数を返す。
+
+    *settings* (analysis.EncodeSettings) は各変換に渡すエンコード設定（None は既定の CBR）。
+    """
+    queue_dir = _queue_path(output_folder)
+    os.makedirs(queue_dir, exist_ok=True)
+    lock_fd = os.open(os.path.join(queue_dir, _LOCK_FILE), os.O_RDWR | os.O_CREAT)
+    try:
+        if not try_lock(lock_fd):
+            logger.info("別の変換ワーカーが実行中のため終了します")
+            return 0
+
+        workers = workers or os.cpu_count() or 1
+        done = 0
+        attempted: set[str] = set()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                # 処理中に追加されたジョブも拾う（このワーカーで失敗したものは次回に回す）
+                jobs = {p: j for p, j in _collect_jobs(output_folder).items() if p not in attempted}
+                if not jobs:
+                    break
+                logger.info("変換ジョブ %d 件を処理します (プロセス数: %d)", len(jobs), workers)
+                attempted.update(jobs)
+
+                ready = {}
+                for job_path, job in jobs.items():
+                    if not os.path.isfile(job["wav"]):
+                        logger.warning("WAV ファイルが見つからないためジョブを削除します: %s", job["wav"])
+                        os.remove(job_path)
+                        continue
+                    ready[job_path] = job
+
+                if 1 < workers and len(ready) < workers:
+                    # プロセスが余るため、1 件ずつ区間に分けて全プロセスでエンコードする
+                    results = ((_run_here(_transcode, job["wav"], job["mp3"], settings, pool, workers),
+                                job_path, job) for job_path, job in ready.items())
+                else:
+                    futures = {pool.submit(_transcode, job["wav"], job["mp3"], settings): (job_path, job)
+                               for job_path, job in ready.items()}
+                    results = ((future, *futures[future]) for future in as_completed(futures))
+
+                for future, job_path, job in results:
+                    try:
+                        size = future.result()
+                    except Exception:
+                        logger.exception("変換に失敗しました: %s", job["wav"])
+                        _fail(output_folder, job_path, job)
+                        continue
+                    os.remove(job_path)
+                    catalog.update(output_folder, job["mp3"], catalog.OK, size)
+                    done += 1
+                    logger.info("MP3 ファイルを保存しました: %s (%d bytes, 待ち時間 %.1f 秒)",
+                                job["mp3"], size, time.time() - job.get("queued_at", time.time()))
+        return done
+    finally:
+        os.close(lock_fd)